@@ -47,13 +47,17 @@ SITE_ID = 1
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.log.RequestLogMiddleware',
+    'core.db_router.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.network.NetworkMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    'core.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -68,6 +72,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.network.network_context',
             ],
         },
     },
@@ -94,6 +99,70 @@ database_url = os.environ.get('DATABASE_URL')
 if database_url:
     DATABASES['default'] = dj_database_url.parse(database_url)
 
+# Optional read replica for the heavy read-only views (see core/db_router.py).
+# Locally, two SQLite files work: migrate both with `--database=replica`.
+replica_url = os.environ.get('REPLICA_DATABASE_URL')
+if replica_url:
+    DATABASES['replica'] = dj_database_url.parse(replica_url)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+# Keep connections open between requests instead of reconnecting each time.
+# For real pooling put PgBouncer in front, or switch to psycopg 3 and set
+# OPTIONS['pool'].
+for db in DATABASES.values():
+    db['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+    db['CONN_HEALTH_CHECKS'] = True
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+REPLICA_STICKY_SECONDS = 10
+
+# Cache & sessions
+# Locmem works for a single process; point CACHE_BACKEND at Redis (as
+# docker-compose.yml does) or Memcached so all gunicorn workers and the
+# detect_fare_evasion process share OTPs, throttles and the gate scan buffer.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'metro-cache'),
+    }
+}
+
+# How long a worker trusts its memoized routing data when CACHES['default']
+# is per-process and cannot tell it about edits made elsewhere (core/network.py).
+NETWORK_MEMO_TTL = 30
+
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
+# Recent gate scans kept for the live dashboard and fare evasion detector
+# (core/live.py); size it for the scans arriving between detector polls.
+GATE_BUFFER_SIZE = 500
+
+OTP_CACHE_ALIAS = 'default'
+OTP_TTL_SECONDS = 300
+OTP_MAX_ATTEMPTS = 5
+
+# Replayed responses for retried POSTs carrying an Idempotency-Key (core/idempotency.py).
+IDEMPOTENCY_CACHE_ALIAS = 'default'
+IDEMPOTENCY_TTL_SECONDS = 600
+
+# Token-bucket rate limits (core/throttling.py): '<scope>:<user|gate|ip>' ->
+# (burst size, seconds to refill one token). Scopes without an entry are
+# not limited. Client addresses for the ip buckets are read from
+# X-Forwarded-For past THROTTLE_PROXY_COUNT trusted proxies (1 for the nginx
+# in docker-compose and for Render); set PROXY_COUNT=0 when gunicorn faces
+# clients directly, or clients could pick their own address.
+THROTTLE_CACHE_ALIAS = 'default'
+THROTTLE_KEY_TTL = 3600
+THROTTLE_PROXY_COUNT = int(os.environ.get('PROXY_COUNT', 1))
+THROTTLE_RATES = {
+    'buy:user': (5, 60),
+    'buy:ip': (20, 6),
+    'scan:user': (10, 2),
+    'scan:gate': (60, 0.5),
+    'scan:ip': (120, 0.25),
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -176,3 +245,41 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_PASS')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
 EMAIL_TIMEOUT = 10
+
+# Where `manage.py archive_tickets` writes compressed monthly exports.
+TICKET_ARCHIVE_DIR = os.environ.get('TICKET_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+
+# Per-request profiling (core/profiling.py): staff opt in with ?_profile=1 or
+# an X-Profile: 1 header; PROFILE_SAMPLE_RATE profiles a share of all requests.
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_MAX_REPORTS = 50
+PROFILE_MAX_QUERIES = 500
+
+# JSON lines on stderr, written by a background thread (core/log.py).
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'json': {
+            '()': 'core.log.QueueListenerHandler',
+        },
+    },
+    'root': {
+        'handlers': ['json'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        'django': {
+            'handlers': ['json'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'metro': {
+            'handlers': ['json'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
@@ -20,6 +20,11 @@ from core import views as core_views
 
 urlpatterns = [
     path('admin/analytics/', core_views.admin_analytics, name='admin_analytics'),
+    path('admin/od-matrix/', core_views.admin_od_matrix, name='admin_od_matrix'),
+    path('admin/live/', core_views.admin_live_gates, name='admin_live_gates'),
+    path('admin/live/stream/', core_views.admin_live_gates_stream, name='admin_live_gates_stream'),
+    path('admin/profiles/', core_views.admin_profiles, name='admin_profiles'),
+    path('admin/profiles/<str:name>/', core_views.admin_profile_report, name='admin_profile_report'),
     path('admin/', admin.site.urls),
     path('accounts/', include('allauth.urls')),
     path('', include('core.urls')), 
@@ -1,8 +1,21 @@
-from django.contrib import admin
-from .models import User, Station, Ticket, SystemSettings, MetroLine, StationOnLine
+from django.contrib import admin, messages
+from django.db.models import Count
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .models import User, Network, Station, Ticket, SystemSettings, MetroLine, StationOnLine, StationOccupancy, SegmentLoad, FareIncident, TravelStats
+from .forms import LineStopsForm
+from .utils import set_line_stops
 
 admin.site.register(User)
 
+@admin.register(Network)
+class NetworkAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'domain', 'is_default')
+    list_editable = ('is_default',)
+    prepopulated_fields = {'slug': ('name',)}
+    search_fields = ('name', 'slug', 'domain')
+
 class StationOnLineInline(admin.TabularInline):
     model = StationOnLine
     extra = 1
@@ -12,31 +25,76 @@ class StationOnLineInline(admin.TabularInline):
 
 @admin.register(Station)
 class StationAdmin(admin.ModelAdmin):
-    list_display = ('name', 'distance_from_hub', 'display_lines')
+    list_display = ('name', 'network', 'distance_from_hub', 'is_active', 'display_lines')
+    list_editable = ('is_active',)
+    list_filter = ('network',)
     search_fields = ('name',) 
     
     inlines = [StationOnLineInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('stationonline_set__line')
+
     def display_lines(self, obj):
-        return ", ".join([sol.line.name for sol in obj.stationonline_set.all()])
+        return ", ".join(obj.lines)
     display_lines.short_description = 'Associated Lines'
 
 @admin.register(MetroLine)
 class MetroLineAdmin(admin.ModelAdmin):
-    list_display = ('name', 'color', 'is_active', 'station_count')
+    list_display = ('name', 'network', 'color', 'is_active', 'headway_minutes', 'station_count', 'edit_stops_link')
     list_editable = ('is_active', 'color') # Allow editing color directly in list
+    list_filter = ('network',)
     search_fields = ('name',) 
     
     inlines = [StationOnLineInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(num_stations=Count('stationonline'))
+
+    def get_urls(self):
+        custom_urls = [
+            path('<int:line_id>/stops/', self.admin_site.admin_view(self.edit_stops_view), name='core_metroline_stops'),
+        ]
+        return custom_urls + super().get_urls()
+
     def station_count(self, obj):
-        return obj.stationonline_set.count()
+        return obj.num_stations
     station_count.short_description = 'Total Stations'
+    station_count.admin_order_field = 'num_stations'
+
+    def edit_stops_link(self, obj):
+        return format_html('<a href="{}">Edit stops</a>', reverse('admin:core_metroline_stops', args=[obj.id]))
+    edit_stops_link.short_description = 'Stops'
+
+    def edit_stops_view(self, request, line_id):
+        line = get_object_or_404(MetroLine, id=line_id)
+        if not self.has_change_permission(request, line):
+            return redirect('admin:core_metroline_changelist')
+
+        current = StationOnLine.objects.filter(line=line).select_related('station').order_by('order')
+
+        if request.method == 'POST':
+            form = LineStopsForm(request.POST, network=line.network)
+            if form.is_valid():
+                added, removed, moved = set_line_stops(line, form.cleaned_data['stops'])
+                messages.success(request, f"{line.name} updated: {added} added, {removed} removed, {moved} renumbered.")
+                return redirect('admin:core_metroline_changelist')
+        else:
+            form = LineStopsForm(initial={'stops': "\n".join(sol.station.name for sol in current)})
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'line': line,
+            'form': form,
+            'title': f'Edit stops: {line.name}',
+        }
+        return render(request, 'admin/core/metroline/edit_stops.html', context)
 
 @admin.register(Ticket)
 class TicketAdmin(admin.ModelAdmin):
     list_display = ('ticket_id', 'user', 'source', 'destination', 'price', 'status', 'created_at')
-    list_filter = ('status', 'created_at')
+    list_filter = ('network', 'status', 'created_at')
     search_fields = ('ticket_id', 'user__username', 'source__name', 'destination__name')
     readonly_fields = ('ticket_id', 'created_at')
 
@@ -46,4 +104,56 @@ class SystemSettingsAdmin(admin.ModelAdmin):
     list_editable = ('is_metro_open',)  
     
     def has_add_permission(self, request):
-        return not SystemSettings.objects.exists()
\ No newline at end of file
+        # One row per network.
+        return Network.objects.filter(settings__isnull=True).exists()
+
+@admin.register(StationOccupancy)
+class StationOccupancyAdmin(admin.ModelAdmin):
+    list_display = ('station', 'inside', 'updated_at')
+    list_select_related = ('station',)
+    ordering = ('-inside',)
+    readonly_fields = ('station', 'inside', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(TravelStats)
+class TravelStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'trips', 'tickets', 'cancelled', 'total_spent', 'last_trip_at')
+    list_select_related = ('user',)
+    search_fields = ('user__username', 'user__email')
+    readonly_fields = ('user', 'trips', 'tickets', 'cancelled', 'total_spent', 'last_trip_at', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(SegmentLoad)
+class SegmentLoadAdmin(admin.ModelAdmin):
+    list_display = ('line', 'from_station', 'to_station', 'trips', 'computed_at')
+    list_filter = ('line',)
+    list_select_related = ('line', 'from_station', 'to_station')
+    readonly_fields = ('line', 'from_station', 'to_station', 'trips', 'computed_at')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(FareIncident)
+class FareIncidentAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'status', 'user', 'station', 'details', 'last_seen')
+    list_filter = ('status', 'kind', 'last_seen')
+    list_editable = ('status',)
+    list_select_related = ('user', 'station')
+    search_fields = ('user__username', 'station__name')
+    readonly_fields = ('kind', 'user', 'station', 'ticket_ids', 'details', 'first_seen', 'last_seen', 'created_at')
+    actions = ['mark_reviewed', 'mark_dismissed']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Mark selected incidents as reviewed')
+    def mark_reviewed(self, request, queryset):
+        queryset.update(status='REVIEWED')
+
+    @admin.action(description='Dismiss selected incidents')
+    def mark_dismissed(self, request, queryset):
+        queryset.update(status='DISMISSED')
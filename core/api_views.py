@@ -1,17 +1,43 @@
-from rest_framework.decorators import api_view, permission_classes
+import logging
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from .models import Ticket
+from django.utils.dateparse import parse_datetime, parse_time
+from datetime import datetime
+from .models import Ticket, Station
+from .journey import plan_journeys
+from .routing import alternative_routes, ALTERNATIVE_ROUTES
+from .utils import get_navigation_instructions
+from .serializers import TicketSerializer
+from .renderers import ORJSONRenderer
+from .live import publish_gate_event
+from .occupancy import record_entry, record_exit, occupancy_snapshot
+from .idempotency import idempotent
+from .travel_stats import record_trip
+from .throttling import throttle
+
+logger = logging.getLogger('metro.scans')
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle('scan')
+@idempotent('scan')
 def scan_ticket(request):
-
     ticket_id = request.data.get('ticket_id')
     gate_type = request.data.get('gate_type')
+    response = _scan(ticket_id, gate_type)
+    logger.info('gate scan', extra={
+        'ticket_id': ticket_id,
+        'gate': gate_type,
+        'status': response.status_code,
+        'user_id': request.user.id,
+    })
+    return response
 
+def _scan(ticket_id, gate_type):
     try:
         ticket = Ticket.objects.get(ticket_id=ticket_id)
     except Ticket.DoesNotExist:
@@ -25,19 +51,111 @@ def scan_ticket(request):
 
     if gate_type == 'entry':
         if ticket.entry_time:
+            publish_gate_event(ticket, 'entry', result='double_entry')
             return Response({"status": "error", "message": "Already inside! (Double Entry) ⚠️"}, status=400)
         
         ticket.entry_time = timezone.now()
         ticket.save()
+        publish_gate_event(ticket, 'entry')
+        record_entry(ticket)
         return Response({"status": "success", "message": "Gate Open: Welcome! 🟢"})
 
     elif gate_type == 'exit':
         if not ticket.entry_time:
+             publish_gate_event(ticket, 'exit', result='no_entry')
              return Response({"status": "error", "message": "You never scanned in! (Fraud?) ⚠️"}, status=400)
         
         ticket.status = 'USED'
         ticket.exit_time = timezone.now()
         ticket.save()
+        publish_gate_event(ticket, 'exit')
+        record_exit(ticket)
+        record_trip(ticket)
         return Response({"status": "success", "message": "Gate Open: Goodbye! 👋"})
 
-    return Response({"status": "error", "message": "Invalid gate_type"}, status=400)
\ No newline at end of file
+    return Response({"status": "error", "message": "Invalid gate_type"}, status=400)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def occupancy(request):
+    return Response(occupancy_snapshot(request.network.id))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def journeys(request):
+    # ?from=<station id>&to=<station id>&depart=<ISO datetime or HH:MM>
+    try:
+        source_id = int(request.query_params.get('from', ''))
+        destination_id = int(request.query_params.get('to', ''))
+    except ValueError:
+        return Response({"status": "error", "message": "from and to must be station ids"}, status=400)
+
+    depart = request.query_params.get('depart')
+    depart_at = None
+    if depart:
+        depart_at = parse_datetime(depart)
+        if depart_at is None:
+            depart_time = parse_time(depart)
+            if depart_time is None:
+                return Response({"status": "error", "message": "Invalid depart time"}, status=400)
+            depart_at = datetime.combine(timezone.localdate(), depart_time)
+        if timezone.is_naive(depart_at):
+            depart_at = timezone.make_aware(depart_at)
+
+    return Response({"journeys": plan_journeys(request.network.id, source_id, destination_id, depart_at)})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def routes(request):
+    # ?from=<station id>&to=<station id>&k=<number of alternatives>
+    try:
+        source = Station.objects.get(id=request.query_params.get('from'), network=request.network)
+        destination = Station.objects.get(id=request.query_params.get('to'), network=request.network)
+        k = min(max(int(request.query_params.get('k', ALTERNATIVE_ROUTES)), 1), 10)
+    except (Station.DoesNotExist, ValueError):
+        return Response({"status": "error", "message": "from and to must be station ids"}, status=400)
+
+    return Response({"routes": [
+        dict(route, index=index, instructions=get_navigation_instructions(route['path'], route['lines']))
+        for index, route in enumerate(alternative_routes(request.network.id, source.name, destination.name, k))
+    ]})
+
+class TicketCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        # History newest first; with ?since= oldest change first, so a client
+        # can resume from the last updated_at it has seen.
+        if request.query_params.get('since'):
+            return ('updated_at', 'id')
+        return ('-created_at', '-id')
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([ORJSONRenderer])
+def tickets(request):
+    # ?fields=ticket_id,status  ?since=<ISO datetime>  ?cursor=...  ?page_size=
+    # Tickets removed by archive_tickets are not reported as changes: they
+    # are closed tickets older than the months kept live, and simply leave
+    # the history.
+    queryset = Ticket.objects.filter(user=request.user).select_related('source', 'destination')
+
+    since = request.query_params.get('since')
+    if since:
+        since_at = parse_datetime(since)
+        if since_at is None:
+            return Response({"status": "error", "message": "Invalid since timestamp"}, status=400)
+        if timezone.is_naive(since_at):
+            since_at = timezone.make_aware(since_at)
+        queryset = queryset.filter(updated_at__gt=since_at)
+
+    fields = [name for name in request.query_params.get('fields', '').split(',') if name]
+    unknown = set(fields) - set(TicketSerializer.Meta.fields)
+    if unknown:
+        return Response({"status": "error", "message": f"Unknown fields: {', '.join(sorted(unknown))}"}, status=400)
+
+    paginator = TicketCursorPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    return paginator.get_paginated_response(TicketSerializer(page, many=True, fields=fields).data)
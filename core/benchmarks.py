@@ -0,0 +1,124 @@
+import random
+import statistics
+import time
+import tracemalloc
+from .network import route_graph_from_stops
+from .utils import find_shortest_path, get_navigation_instructions
+
+# Routing benchmarks on synthetic networks (`manage.py benchmark_routing`).
+# Everything is generated in memory, so no database is involved.
+
+
+def synthetic_network(stations, lines, interchange=0.1, seed=1):
+    # Returns StationOnLine-style rows (line, order, station, is_active) for
+    # `stations` stations spread over `lines` lines. Every station belongs to
+    # one line; an `interchange` share of them is also added to another line,
+    # and consecutive lines always share a station so the network is connected.
+    rng = random.Random(seed)
+    lines = max(1, min(lines, stations))
+    names = [f"S{i}" for i in range(stations)]
+    rng.shuffle(names)
+
+    stops = [[] for _ in range(lines)]
+    for i, name in enumerate(names):
+        stops[i % lines].append(name)
+
+    for i in range(1, lines):
+        shared = rng.choice(stops[i - 1])
+        if shared not in stops[i]:
+            stops[i].insert(rng.randrange(len(stops[i]) + 1), shared)
+
+    for name in rng.sample(names, int(stations * interchange)):
+        line = rng.randrange(lines)
+        if lines > 1 and name in stops[line]:
+            line = (line + 1) % lines
+        if name not in stops[line]:
+            stops[line].insert(rng.randrange(len(stops[line]) + 1), name)
+
+    rows = []
+    for i, line_stops in enumerate(stops):
+        for order, name in enumerate(line_stops, start=1):
+            rows.append((f"Line {i + 1}", order, name, True))
+    return rows
+
+def _percentiles(samples_ns):
+    ordered = sorted(samples_ns)
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] / 1000, 2)
+    return {
+        'mean_us': round(statistics.fmean(ordered) / 1000, 2),
+        'p50_us': pick(0.50),
+        'p95_us': pick(0.95),
+        'p99_us': pick(0.99),
+        'max_us': round(ordered[-1] / 1000, 2),
+    }
+
+def run_benchmark(rows, queries=1000, seed=1, repeat_build=5):
+    build_ns = []
+    for _ in range(repeat_build):
+        started = time.perf_counter_ns()
+        graph = route_graph_from_stops(rows)
+        build_ns.append(time.perf_counter_ns() - started)
+
+    tracemalloc.start()
+    graph = route_graph_from_stops(rows)
+    graph_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rng = random.Random(seed)
+    names = list(graph)
+    pairs = [tuple(rng.sample(names, 2)) for _ in range(queries)] if len(names) > 1 else []
+
+    path_ns, instructions_ns, stops, found = [], [], [], 0
+    started = time.perf_counter()
+    for source, destination in pairs:
+        t0 = time.perf_counter_ns()
+        path, lines, hops = find_shortest_path(source, destination, graph=graph)
+        t1 = time.perf_counter_ns()
+        get_navigation_instructions(path, lines)
+        t2 = time.perf_counter_ns()
+        path_ns.append(t1 - t0)
+        instructions_ns.append(t2 - t1)
+        if path:
+            found += 1
+            stops.append(hops)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'stations': len(graph),
+        'lines': len({row[0] for row in rows}),
+        'stops': len(rows),
+        'edges': sum(len(neighbors) for neighbors in graph.values()) // 2,
+        'graph_build_ms': round(min(build_ns) / 1e6, 3),
+        'graph_memory_kb': round(graph_bytes / 1024, 1),
+        'queries': len(pairs),
+        'routes_found': found,
+        'mean_stops': round(statistics.fmean(stops), 2) if stops else 0,
+        'find_shortest_path': _percentiles(path_ns) if pairs else {},
+        'get_navigation_instructions': _percentiles(instructions_ns) if pairs else {},
+        'throughput_qps': round(len(pairs) / elapsed, 1) if elapsed else 0,
+    }
+
+def compare(results, baseline):
+    # Ratios of current / baseline for matching network sizes (> 1 is slower).
+    previous = {(r['stations'], r['lines']): r for r in baseline.get('results', [])}
+    changes = []
+    for result in results:
+        old = previous.get((result['stations'], result['lines']))
+        if not old:
+            continue
+        changes.append({
+            'stations': result['stations'],
+            'lines': result['lines'],
+            'graph_build': _ratio(result['graph_build_ms'], old['graph_build_ms']),
+            'find_shortest_path_p50': _ratio(result['find_shortest_path'].get('p50_us'), old['find_shortest_path'].get('p50_us')),
+            'find_shortest_path_p95': _ratio(result['find_shortest_path'].get('p95_us'), old['find_shortest_path'].get('p95_us')),
+            'throughput': _ratio(old['throughput_qps'], result['throughput_qps']),
+            'graph_memory': _ratio(result['graph_memory_kb'], old['graph_memory_kb']),
+        })
+    return changes
+
+def _ratio(current, previous):
+    if not current or not previous:
+        return None
+    return round(current / previous, 3)
@@ -0,0 +1,21 @@
+import os
+from django.core.checks import Error, Tags, register
+from .live import is_shared
+
+# gunicorn.conf.py starts WEB_CONCURRENCY workers; each would otherwise keep
+# its own OTPs, idempotency keys, throttle buckets and gate scan buffer.
+
+
+@register(Tags.caches)
+def shared_cache_for_workers(app_configs, **kwargs):
+    try:
+        workers = int(os.environ.get('WEB_CONCURRENCY') or 1)
+    except ValueError:
+        workers = 1
+    if workers > 1 and not is_shared():
+        return [Error(
+            f"WEB_CONCURRENCY={workers} with a per-process default cache.",
+            hint="Set CACHE_BACKEND/CACHE_LOCATION to a shared cache such as Redis, or run one worker.",
+            id='core.E001',
+        )]
+    return []
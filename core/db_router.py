@@ -0,0 +1,96 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import connections
+
+# Reads go to the 'replica' alias only inside a use_replica() scope, and not
+# for a client that wrote recently (read-your-writes). Without a replica
+# configured every query stays on 'default'.
+
+REPLICA_ALIAS = 'replica'
+PIN_COOKIE = 'db_pin'
+
+_replica_scope = ContextVar('replica_scope', default=False)
+_pinned = ContextVar('db_pinned', default=False)
+_wrote = ContextVar('db_wrote', default=False)
+
+
+def replica_available():
+    return REPLICA_ALIAS in settings.DATABASES
+
+@contextmanager
+def replica_reads():
+    token = _replica_scope.set(True)
+    try:
+        yield
+    finally:
+        _replica_scope.reset(token)
+
+@contextmanager
+def primary_reads():
+    # Inside a replica scope, read from 'default' anyway (e.g. to build data
+    # that is then cached under the current version).
+    token = _replica_scope.set(False)
+    try:
+        yield
+    finally:
+        _replica_scope.reset(token)
+
+def use_replica(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_scope.get() and not _pinned.get() and not _wrote.get() and replica_available():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+def _track_writes(execute, sql, params, many, context):
+    # db_for_write() is also consulted for reads such as get_or_create's
+    # lookup, so only statements that actually modify data pin the client.
+    if sql.lstrip()[:6].upper() in WRITE_STATEMENTS:
+        _wrote.set(True)
+    return execute(sql, params, many, context)
+
+
+class ReplicaStickinessMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_available():
+            return self.get_response(request)
+
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        pinned_token = _pinned.set(pinned_until > time.time())
+        wrote_token = _wrote.set(False)
+        try:
+            with connections['default'].execute_wrapper(_track_writes):
+                response = self.get_response(request)
+            if _wrote.get():
+                seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+                response.set_cookie(PIN_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True, samesite='Lax')
+            return response
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
@@ -1,3 +1,6 @@
+import csv
+import io
+import json
 from django import forms
 from .models import Station
 from django.contrib.auth.forms import UserCreationForm
@@ -42,4 +45,73 @@ class EditProfileForm(forms.ModelForm):
         fields = ['username', 'first_name', 'last_name', 'email']
         widgets = {
             'username': forms.TextInput(attrs={'class': 'form-control', 'readonly': 'readonly'}), # Make username read-only
-        }
\ No newline at end of file
+        }
+
+class LineStopsForm(forms.Form):
+    stops = forms.CharField(
+        label="Stations in order (one per line)",
+        widget=forms.Textarea(attrs={'rows': 30, 'cols': 60})
+    )
+
+    def __init__(self, *args, network=None, **kwargs):
+        # Station names are only unique within a network.
+        self.network = network
+        super().__init__(*args, **kwargs)
+
+    def clean_stops(self):
+        names = [name.strip() for name in self.cleaned_data['stops'].splitlines() if name.strip()]
+        if len(names) != len(set(names)):
+            raise forms.ValidationError("A station can only appear once on a line.")
+
+        stations = {s.name: s for s in Station.objects.filter(network=self.network, name__in=names)}
+        unknown = [name for name in names if name not in stations]
+        if unknown:
+            raise forms.ValidationError(f"Unknown stations: {', '.join(unknown)}")
+
+        return [stations[name] for name in names]
+
+class BulkTicketForm(forms.Form):
+    MAX_ROWS = 2000
+
+    data = forms.CharField(
+        required=False,
+        label="CSV or JSON",
+        widget=forms.Textarea(attrs={'class': 'form-control font-monospace', 'rows': 10,
+                                     'placeholder': 'passenger,source,destination\nalice,Berri-UQAM,Jean-Talon'})
+    )
+    upload = forms.FileField(required=False, label="...or upload a .csv / .json file",
+                             widget=forms.ClearableFileInput(attrs={'class': 'form-control'}))
+    send_emails = forms.BooleanField(required=False, initial=True, label="Email each passenger their ticket")
+
+    def clean(self):
+        cleaned = super().clean()
+        upload = cleaned.get('upload')
+        try:
+            text = upload.read().decode('utf-8-sig') if upload else cleaned.get('data', '')
+        except UnicodeDecodeError:
+            raise forms.ValidationError("The file must be UTF-8 encoded text.")
+        text = text.strip()
+        if not text:
+            raise forms.ValidationError("Paste passenger rows or upload a file.")
+
+        try:
+            if text.startswith('['):
+                records = json.loads(text)
+            else:
+                records = list(csv.DictReader(io.StringIO(text)))
+        except (ValueError, csv.Error) as e:
+            raise forms.ValidationError(f"Could not parse the list: {e}")
+
+        rows = []
+        for number, record in enumerate(records, start=1):
+            if not isinstance(record, dict):
+                raise forms.ValidationError(f"Row {number}: expected an object with passenger, source and destination.")
+            row = {field: str(record.get(field) or '').strip() for field in ('passenger', 'source', 'destination')}
+            if not all(row.values()):
+                raise forms.ValidationError(f"Row {number}: passenger, source and destination are all required.")
+            rows.append(row)
+
+        if len(rows) > self.MAX_ROWS:
+            raise forms.ValidationError(f"At most {self.MAX_ROWS} tickets can be issued at once.")
+        cleaned['rows'] = rows
+        return cleaned
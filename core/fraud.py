@@ -0,0 +1,142 @@
+from collections import OrderedDict, deque
+from datetime import datetime, timezone as dt_timezone
+from .models import FareIncident, Station
+from .network import get_route_graph, network_memoized
+
+# Streaming fare-evasion checks over the gate event ring (core/live.py).
+# Runs outside the request path (`manage.py detect_fare_evasion`); memory is
+# bounded by the window lengths, the per-key deque sizes and MAX_TRACKED.
+
+SHARING_SECONDS_PER_STOP = 60
+BURST_WINDOW_SECONDS = 10 * 60
+BURST_ENTRIES = 3
+NO_ENTRY_WINDOW_SECONDS = 15 * 60
+NO_ENTRY_EXITS = 5
+MAX_EVENTS_PER_KEY = 20
+MAX_TRACKED = 50_000
+
+
+def build_station_hops(network_id):
+    # Stops between every pair of open stations, {(id_a, id_b): hops}.
+    graph = get_route_graph(network_id)
+    ids = dict(Station.objects.filter(network_id=network_id).values_list('name', 'id'))
+    hops = {}
+    for start in graph:
+        seen = {start: 0}
+        frontier = [start]
+        while frontier:
+            following = []
+            for name in frontier:
+                for neighbor, _ in graph[name]:
+                    if neighbor not in seen:
+                        seen[neighbor] = seen[name] + 1
+                        following.append(neighbor)
+            frontier = following
+        for name, distance in seen.items():
+            hops[(ids[start], ids[name])] = distance
+    return hops
+
+def get_station_hops(network_id):
+    return network_memoized('station_hops', network_id, lambda: build_station_hops(network_id))
+
+
+class _Windows:
+    # key -> deque of recent items, least recently touched keys dropped first.
+    def __init__(self, max_keys=MAX_TRACKED, max_items=MAX_EVENTS_PER_KEY):
+        self.max_keys = max_keys
+        self.max_items = max_items
+        self.windows = OrderedDict()
+
+    def push(self, key, item, horizon):
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = deque(maxlen=self.max_items)
+            if len(self.windows) > self.max_keys:
+                self.windows.popitem(last=False)
+        else:
+            self.windows.move_to_end(key)
+        while window and window[0][0] < horizon:
+            window.popleft()
+        window.append(item)
+        return window
+
+    def clear(self, key):
+        self.windows.pop(key, None)
+
+
+class FareEvasionDetector:
+    def __init__(self, hops=None):
+        self.hops = hops
+        self.entries = _Windows()
+        self.refused_exits = _Windows()
+
+    def feed(self, event):
+        # Returns unsaved FareIncident objects triggered by this event.
+        when = datetime.fromisoformat(event['time'])
+        now = when.timestamp()
+        if event['gate'] == 'entry' and event.get('result', 'ok') == 'ok':
+            return self._check_entry(event, when, now)
+        if event['gate'] == 'exit' and event.get('result') == 'no_entry':
+            return self._check_refused_exit(event, when, now)
+        return []
+
+    def _check_entry(self, event, when, now):
+        user_id = event.get('user_id')
+        if user_id is None:
+            return []
+        horizon = now - BURST_WINDOW_SECONDS
+        window = self.entries.push(user_id, (now, event['station_id'], event['ticket_id']), horizon)
+
+        if self.hops is not None:
+            hops = self.hops
+        elif event.get('network_id') is not None:
+            hops = get_station_hops(event['network_id'])
+        else:
+            hops = {}
+        for earlier, station_id, ticket_id in list(window)[:-1]:
+            if station_id == event['station_id']:
+                continue
+            distance = hops.get((station_id, event['station_id']))
+            if distance is not None and now - earlier < distance * SHARING_SECONDS_PER_STOP:
+                self.entries.clear(user_id)
+                return [FareIncident(
+                    kind='SHARING',
+                    user_id=user_id,
+                    station_id=event['station_id'],
+                    ticket_ids=[ticket_id, event['ticket_id']],
+                    details=f"Entries {distance} stops apart within {int(now - earlier)} s.",
+                    first_seen=_at(earlier),
+                    last_seen=when,
+                )]
+
+        if len({station_id for _, station_id, _ in window}) >= BURST_ENTRIES:
+            self.entries.clear(user_id)
+            return [FareIncident(
+                kind='BURST',
+                user_id=user_id,
+                station_id=event['station_id'],
+                ticket_ids=[ticket_id for _, _, ticket_id in window],
+                details=f"{len(window)} entries at {len({s for _, s, _ in window})} stations within {int(now - window[0][0])} s.",
+                first_seen=_at(window[0][0]),
+                last_seen=when,
+            )]
+        return []
+
+    def _check_refused_exit(self, event, when, now):
+        station_id = event['station_id']
+        horizon = now - NO_ENTRY_WINDOW_SECONDS
+        window = self.refused_exits.push(station_id, (now, event['ticket_id']), horizon)
+        if len(window) < NO_ENTRY_EXITS:
+            return []
+        self.refused_exits.clear(station_id)
+        return [FareIncident(
+            kind='NO_ENTRY',
+            station_id=station_id,
+            ticket_ids=[ticket_id for _, ticket_id in window],
+            details=f"{len(window)} exits without entry within {int(now - window[0][0])} s.",
+            first_seen=_at(window[0][0]),
+            last_seen=when,
+        )]
+
+def _at(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
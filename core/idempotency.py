@@ -0,0 +1,64 @@
+import hashlib
+import json
+from functools import wraps
+from django.core.cache import caches
+from django.conf import settings
+from rest_framework.response import Response
+
+# Replays the first response to a request carrying an Idempotency-Key header
+# (or an `idempotency_key` field), so a retried POST never runs twice. Keys
+# are scoped per user and bound to the request body: reusing a key for a
+# different payload is refused.
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+PENDING = 'pending'
+
+
+def _cache():
+    return caches[getattr(settings, 'IDEMPOTENCY_CACHE_ALIAS', 'default')]
+
+def _fingerprint(data):
+    payload = {key: value for key, value in data.items() if key != 'idempotency_key'}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def idempotent(prefix, ttl=None):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER) or request.data.get('idempotency_key')
+            if not key:
+                return view(request, *args, **kwargs)
+            if len(key) > 100:
+                return Response({"status": "error", "message": "Idempotency key too long"}, status=400)
+
+            cache = _cache()
+            timeout = ttl or getattr(settings, 'IDEMPOTENCY_TTL_SECONDS', 600)
+            cache_key = f"idem:{prefix}:{request.user.pk}:{key}"
+            fingerprint = _fingerprint(request.data)
+
+            if not cache.add(cache_key, (PENDING, fingerprint), timeout=timeout):
+                stored = cache.get(cache_key)
+                if stored is not None:
+                    if stored[1] != fingerprint:
+                        return Response({"status": "error", "message": "Idempotency key reused with a different request"}, status=422)
+                    if stored[0] == PENDING:
+                        return Response({"status": "error", "message": "Request still in progress, retry shortly"}, status=409)
+                    status, data = stored[0], stored[2]
+                    response = Response(data, status=status)
+                    response['Idempotent-Replay'] = 'true'
+                    return response
+                # Expired between add() and get(); treat as a first attempt.
+                cache.set(cache_key, (PENDING, fingerprint), timeout=timeout)
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                cache.delete(cache_key)
+                raise
+            if response.status_code >= 500:
+                cache.delete(cache_key)
+            else:
+                cache.set(cache_key, (response.status_code, fingerprint, response.data), timeout=timeout)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,206 @@
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from .models import MetroLine, Station, StationOnLine
+from .network import network_memoized
+
+# Timetable-aware journey planning (RAPTOR, Delling et al.). Every line runs
+# in both directions; each direction is a "route" whose trains leave the
+# terminus every headway_minutes between first_departure and last_departure
+# and reach stop i after offsets[i] seconds. All times are seconds after
+# midnight of the service day.
+
+TRANSFER_SECONDS = 180
+MAX_TRANSFERS = 4
+DAY = 24 * 60 * 60
+INF = float('inf')
+
+
+def _seconds(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+def build_timetable(network_id):
+    lines = {line.id: line for line in MetroLine.objects.filter(network_id=network_id, is_active=True)}
+    by_line = {}
+    for sol in StationOnLine.objects.filter(line_id__in=lines).order_by('line_id', 'order'):
+        by_line.setdefault(sol.line_id, []).append(sol)
+
+    rows = list(Station.objects.filter(network_id=network_id).order_by('id').values_list('id', 'name', 'is_active'))
+    stations = [(station_id, name) for station_id, name, _ in rows]
+    open_stations = [is_active for _, _, is_active in rows]
+    index = {station_id: i for i, (station_id, _) in enumerate(stations)}
+
+    # Flat route arrays: route r owns route_stops/route_offsets[route_start[r]:route_start[r + 1]].
+    route_start, route_stops, route_offsets = [0], [], []
+    route_line, route_headway, route_first, route_last = [], [], [], []
+    for line_id, stops in by_line.items():
+        line = lines[line_id]
+        first = _seconds(line.first_departure)
+        last = _seconds(line.last_departure)
+        if last < first:
+            last += DAY
+
+        offsets = [0]
+        for sol in stops[1:]:
+            offsets.append(offsets[-1] + sol.run_seconds)
+        total = offsets[-1]
+        forward = [(index[sol.station_id], offset) for sol, offset in zip(stops, offsets)]
+        backward = [(stop, total - offset) for stop, offset in forward[::-1]]
+
+        # A closed station splits the line into separately served segments;
+        # offsets stay measured from the terminus the trains leave.
+        for direction in (forward, backward):
+            segments, segment = [], []
+            for stop, offset in direction:
+                if open_stations[stop]:
+                    segment.append((stop, offset))
+                else:
+                    segments.append(segment)
+                    segment = []
+            segments.append(segment)
+
+            for segment in segments:
+                if len(segment) < 2:
+                    continue
+                route_stops.extend(stop for stop, _ in segment)
+                route_offsets.extend(offset for _, offset in segment)
+                route_start.append(len(route_stops))
+                route_line.append(line_id)
+                route_headway.append(line.headway_minutes * 60 or 60)
+                route_first.append(first)
+                route_last.append(last)
+
+    # For every stop, the (route, position) pairs serving it.
+    stop_routes = [[] for _ in stations]
+    for r in range(len(route_line)):
+        for position, stop in enumerate(route_stops[route_start[r]:route_start[r + 1]]):
+            stop_routes[stop].append((r, position))
+
+    return {
+        'index': index,
+        'stations': stations,
+        'lines': {line_id: (line.name, line.color) for line_id, line in lines.items()},
+        'route_start': route_start,
+        'route_stops': route_stops,
+        'route_offsets': route_offsets,
+        'route_line': route_line,
+        'route_headway': route_headway,
+        'route_first': route_first,
+        'route_last': route_last,
+        'stop_routes': stop_routes,
+        'service_start': min(route_first, default=0),
+        'service_end': max(route_last, default=0),
+    }
+
+def get_timetable(network_id):
+    return network_memoized('timetable', network_id, lambda: build_timetable(network_id))
+
+def _next_trip(tt, r, earliest):
+    # Departure time from the terminus of the first trip of route r leaving
+    # it no earlier than `earliest`, or None once service has ended.
+    first, headway = tt['route_first'][r], tt['route_headway'][r]
+    departure = first if earliest <= first else first + -(-(earliest - first) // headway) * headway
+    return departure if departure <= tt['route_last'][r] else None
+
+def raptor(tt, source, target, depart, max_transfers=MAX_TRANSFERS):
+    # Returns the per-round labels; labels[k][stop] = (round, route, board_pos, alight_pos, trip).
+    stops, offsets, starts = tt['route_stops'], tt['route_offsets'], tt['route_start']
+    stop_routes = tt['stop_routes']
+
+    best = [INF] * len(tt['stations'])
+    best[source] = depart
+    previous = best[:]
+    labels = [{}]
+    marked = {source}
+
+    for k in range(1, max_transfers + 2):
+        queue = {}
+        for stop in marked:
+            for r, position in stop_routes[stop]:
+                if position < queue.get(r, INF):
+                    queue[r] = position
+
+        current = previous[:]
+        round_labels = dict(labels[-1])
+        marked = set()
+        change = TRANSFER_SECONDS if k > 1 else 0
+
+        for r, position in queue.items():
+            base = starts[r]
+            trip = None
+            board = None
+            for i in range(position, starts[r + 1] - base):
+                stop, offset = stops[base + i], offsets[base + i]
+                if trip is not None:
+                    arrival = trip + offset
+                    if arrival < best[stop] and arrival < best[target]:
+                        current[stop] = best[stop] = arrival
+                        round_labels[stop] = (k, r, board, i, trip)
+                        marked.add(stop)
+                if previous[stop] < INF and (trip is None or previous[stop] + change <= trip + offset):
+                    candidate = _next_trip(tt, r, previous[stop] + change - offset)
+                    if candidate is not None and (trip is None or candidate < trip):
+                        trip, board = candidate, i
+
+        labels.append(round_labels)
+        previous = current
+        if not marked:
+            break
+    return labels
+
+def _journey(tt, labels, k, source, target, service_day):
+    stops, offsets, starts = tt['route_stops'], tt['route_offsets'], tt['route_start']
+    names = tt['stations']
+
+    def at(seconds):
+        return service_day + timedelta(seconds=seconds)
+
+    legs = []
+    stop = target
+    while stop != source:
+        found, r, board, alight, trip = labels[k][stop]
+        base = starts[r]
+        line_name, line_color = tt['lines'][tt['route_line'][r]]
+        from_stop = stops[base + board]
+        legs.append({
+            'line': line_name,
+            'line_color': line_color,
+            'from': names[from_stop][1],
+            'to': names[stop][1],
+            'departure': at(trip + offsets[base + board]),
+            'arrival': at(trip + offsets[base + alight]),
+            'stops': alight - board,
+        })
+        stop, k = from_stop, found - 1
+    legs.reverse()
+
+    return {
+        'departure': legs[0]['departure'],
+        'arrival': legs[-1]['arrival'],
+        'duration_minutes': round((legs[-1]['arrival'] - legs[0]['departure']).total_seconds() / 60),
+        'transfers': len(legs) - 1,
+        'legs': legs,
+    }
+
+def plan_journeys(network_id, source_id, target_id, depart_at=None, max_transfers=MAX_TRANSFERS):
+    # Pareto-optimal journeys: each one arrives strictly earlier than any
+    # journey with fewer transfers. Ordered by number of transfers.
+    tt = get_timetable(network_id)
+    source, target = tt['index'].get(source_id), tt['index'].get(target_id)
+    if source is None or target is None or source == target:
+        return []
+
+    depart_at = timezone.localtime(depart_at or timezone.now())
+    service_day = timezone.make_aware(datetime.combine(depart_at.date(), time.min))
+    depart = _seconds(depart_at)
+    # Just after midnight we may still be inside yesterday's service.
+    if depart < tt['service_start'] and depart + DAY <= tt['service_end']:
+        depart += DAY
+        service_day -= timedelta(days=1)
+
+    labels = raptor(tt, source, target, depart, max_transfers)
+    journeys = []
+    for k in range(1, len(labels)):
+        label = labels[k].get(target)
+        if label and label[0] == k:
+            journeys.append(_journey(tt, labels, k, source, target, service_day))
+    return journeys
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import numpy as np
+from django.db import transaction
+from .models import MetroLine, Network, Station, StationOnLine
+from .network import invalidate_network, network_memoized
+
+# Station positions for the home page map, computed once per topology change
+# with a Fruchterman-Reingold force layout instead of in every browser.
+# Existing positions seed the next run, so small edits keep the map familiar.
+# Each transit network is laid out on its own. The layout runs after edits
+# (schedule_layout) or from `manage.py compute_map_layout`, never while
+# serving a page; Network.map_topology records what it was computed for.
+
+LAYOUT_ITERATIONS = 300
+LAYOUT_EDGE_LENGTH = 100.0
+LAYOUT_SEED = 7
+
+
+def _topology(network_id):
+    station_ids = list(Station.objects.filter(network_id=network_id).order_by('id').values_list('id', flat=True))
+    by_line = {}
+    for line_id, station_id in StationOnLine.objects.filter(line__network_id=network_id).order_by('line_id', 'order').values_list('line_id', 'station_id'):
+        by_line.setdefault(line_id, []).append(station_id)
+    edges = sorted({
+        (min(a, b), max(a, b))
+        for stations in by_line.values()
+        for a, b in zip(stations, stations[1:])
+    })
+    return station_ids, edges
+
+def force_layout(n, edges, initial=None, iterations=LAYOUT_ITERATIONS, edge_length=LAYOUT_EDGE_LENGTH):
+    # edges: (i, j) index pairs; initial: optional (n, 2) array with NaN rows
+    # for unplaced stations. Returns an (n, 2) array centred on 0, scaled so
+    # connected stations are edge_length apart on average.
+    if n == 0:
+        return np.zeros((0, 2))
+    k = float(edge_length)
+    box = k * np.sqrt(n)
+    rng = np.random.default_rng(LAYOUT_SEED)
+    pos = rng.uniform(-box / 2, box / 2, (n, 2))
+    start_temperature = box / 10
+    if initial is not None:
+        known = ~np.isnan(initial).any(axis=1)
+        if known.any():
+            pos[known] = initial[known]
+            # Only nudge an existing layout.
+            start_temperature = k / 2
+
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    for step in range(iterations):
+        temperature = start_temperature * (1 - step / iterations) + k / 100
+        delta = pos[:, None, :] - pos[None, :, :]
+        dist = np.maximum(np.linalg.norm(delta, axis=2), 0.01)
+        disp = (delta * (k * k / dist ** 2)[:, :, None]).sum(axis=1)
+
+        if len(edges):
+            d = pos[edges[:, 0]] - pos[edges[:, 1]]
+            length = np.maximum(np.linalg.norm(d, axis=1), 0.01)
+            pull = d * (length / k)[:, None]
+            np.add.at(disp, edges[:, 0], -pull)
+            np.add.at(disp, edges[:, 1], pull)
+
+        moved = np.maximum(np.linalg.norm(disp, axis=1), 0.01)
+        pos += disp / moved[:, None] * np.minimum(moved, temperature)[:, None]
+
+    pos -= pos.mean(axis=0)
+    if len(edges):
+        mean_length = np.linalg.norm(pos[edges[:, 0]] - pos[edges[:, 1]], axis=1).mean()
+        if mean_length > 0:
+            pos *= k / mean_length
+    return pos
+
+def _signature(station_ids, edges):
+    return hashlib.sha1(json.dumps([station_ids, edges]).encode()).hexdigest()
+
+def update_layout(network_id, force=False):
+    # Recomputes and stores Station.map_x/map_y if the network's stations or
+    # their connections changed since the last run. Returns True if it did.
+    station_ids, edges = _topology(network_id)
+    signature = _signature(station_ids, [list(edge) for edge in edges])
+    stations = list(Station.objects.filter(network_id=network_id).order_by('id').only('id', 'map_x', 'map_y'))
+    missing = any(station.map_x is None or station.map_y is None for station in stations)
+    stored = Network.objects.filter(pk=network_id).values_list('map_topology', flat=True).first()
+    if not force and not missing and stored == signature:
+        return False
+
+    index = {station_id: i for i, station_id in enumerate(station_ids)}
+    initial = np.array([
+        (np.nan, np.nan) if station.map_x is None or station.map_y is None else (station.map_x, station.map_y)
+        for station in stations
+    ], dtype=float).reshape(-1, 2)
+    pos = force_layout(len(stations), [(index[a], index[b]) for a, b in edges], initial)
+
+    for station, (x, y) in zip(stations, pos):
+        station.map_x, station.map_y = round(float(x), 1), round(float(y), 1)
+    Station.objects.bulk_update(stations, ['map_x', 'map_y'], batch_size=500)
+    # update() sends no signal, so this does not invalidate the network list.
+    Network.objects.filter(pk=network_id).update(map_topology=signature)
+    # Memoized map data built before the new positions were written.
+    invalidate_network(network_id)
+    return True
+
+def schedule_layout(network_id):
+    # Many edits in one transaction: the first run lays the map out, the rest
+    # find the topology unchanged.
+    transaction.on_commit(lambda: update_layout(network_id))
+
+def build_map_data(network_id):
+    lines = MetroLine.objects.filter(network_id=network_id, is_active=True).prefetch_related('stationonline_set__station')
+
+    nodes = []
+    edges = []
+    added_station_ids = set()
+
+    for line in lines:
+        stops = sorted(line.stationonline_set.all(), key=lambda sol: sol.order)
+
+        for i in range(len(stops)):
+            current_stop = stops[i]
+            station = current_stop.station
+
+            if station.id not in added_station_ids:
+                nodes.append({
+                    'id': station.id,
+                    'label': station.name,
+                    'shape': 'dot',
+                    'size': 20 if current_stop.is_interchange else 10,
+                    'color': '#000000' if current_stop.is_interchange else '#666666',
+                    'font': {'size': 14, 'color': '#000000', 'face': 'arial'},
+                    'x': station.map_x,
+                    'y': station.map_y,
+                })
+                added_station_ids.add(station.id)
+
+            if i < len(stops) - 1:
+                next_stop = stops[i + 1]
+                edges.append({
+                    'from': station.id,
+                    'to': next_stop.station.id,
+                    'color': {'color': line.color, 'highlight': line.color},
+                    'width': 5,
+                    'title': line.name
+                })
+
+    return json.dumps({'nodes': nodes, 'edges': edges})
+
+def get_map_data(network_id):
+    return network_memoized('map_data', network_id, lambda: build_map_data(network_id))
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+# Recent gate scans kept in the shared cache as a fixed-size ring buffer:
+# slot `seq % GATE_BUFFER_SIZE` holds event number `seq`. With a cache shared
+# between workers (file/Redis), every worker publishes into the same ring;
+# with a per-process cache each worker has its own ring, which other
+# processes (e.g. detect_fare_evasion) cannot see.
+
+GATE_BUFFER_SIZE = getattr(settings, 'GATE_BUFFER_SIZE', 500)
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+GATE_EVENT_TTL = 60 * 60
+COUNTER_TTL = 60 * 60 * 26
+
+SEQ_KEY = 'gate:seq'
+
+
+def _counter_key(day, station_id, gate_type):
+    return f"gate:count:{day}:{station_id}:{gate_type}"
+
+def is_shared():
+    return settings.CACHES['default']['BACKEND'] not in PER_PROCESS_CACHES
+
+def current_seq():
+    return cache.get(SEQ_KEY, 0)
+
+def publish_gate_event(ticket, gate_type, result='ok'):
+    # result is 'ok' for an opened gate, otherwise why the scan was refused
+    # (e.g. 'no_entry'); refused scans feed core/fraud.py but no counters.
+    now = timezone.now()
+    station_id = ticket.source_id if gate_type == 'entry' else ticket.destination_id
+
+    cache.add(SEQ_KEY, 0, timeout=None)
+    seq = cache.incr(SEQ_KEY)
+    cache.set(f"gate:event:{seq % GATE_BUFFER_SIZE}", {
+        'seq': seq,
+        'time': now.isoformat(),
+        'gate': gate_type,
+        'network_id': ticket.network_id,
+        'station_id': station_id,
+        'user_id': ticket.user_id,
+        'ticket_id': str(ticket.ticket_id),
+        'result': result,
+    }, timeout=GATE_EVENT_TTL)
+
+    if result != 'ok':
+        return
+    key = _counter_key(now.date(), station_id, gate_type)
+    cache.add(key, 0, timeout=COUNTER_TTL)
+    cache.incr(key)
+
+def events_since(seq):
+    # Returns events newer than `seq`; anything already overwritten in the
+    # ring is silently skipped.
+    latest = current_seq()
+    first = max(seq + 1, latest - GATE_BUFFER_SIZE + 1)
+    if first > latest:
+        return []
+
+    keys = {f"gate:event:{s % GATE_BUFFER_SIZE}": s for s in range(first, latest + 1)}
+    found = cache.get_many(keys)
+    events = [event for key, event in found.items() if event['seq'] == keys[key]]
+    return sorted(events, key=lambda event: event['seq'])
+
+def station_counters(station_ids, day=None):
+    day = day or timezone.now().date()
+    keys = {}
+    for station_id in station_ids:
+        for gate_type in ('entry', 'exit'):
+            keys[_counter_key(day, station_id, gate_type)] = (station_id, gate_type)
+
+    counters = {station_id: {'entries': 0, 'exits': 0} for station_id in station_ids}
+    for key, count in cache.get_many(keys).items():
+        station_id, gate_type = keys[key]
+        counters[station_id]['entries' if gate_type == 'entry' else 'exits'] = count
+    return counters
@@ -0,0 +1,239 @@
+import csv
+import io
+import json
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Count
+from .fraud import get_station_hops
+from .models import MetroLine, Station, StationOnLine, Ticket
+from .network import get_route_graph
+from .utils import encode_route, find_shortest_path, get_navigation_instructions
+
+# Synthetic users and tickets for capacity testing (`manage.py
+# generate_load_data`). Everything is drawn from one seeded generator, so the
+# same options on the same network produce the same data. Ticket ids are
+# uuid5 over the username prefix and the ticket's index rather than drawn from
+# the generator, so runs with different prefixes never collide. Tickets are built
+# as numpy columns per batch and written with COPY on PostgreSQL, bulk_create
+# elsewhere.
+
+# Share of a day's trips starting in each hour: morning and evening peaks.
+HOUR_PROFILE = np.array([
+    0.2, 0.1, 0.1, 0.1, 0.3, 1.0, 3.0, 7.0, 9.0, 6.0, 4.0, 3.5,
+    4.0, 4.0, 3.5, 4.5, 6.5, 8.5, 7.0, 4.5, 3.0, 2.0, 1.2, 0.6,
+])
+WEEKEND_FACTOR = 0.6
+DISTANCE_DECAY = 1.2
+SECONDS_PER_STOP = 120
+STATUS_SHARES = {'USED': 0.9, 'CANCELLED': 0.04, 'EXPIRED': 0.06}
+# Not yet exited tickets bought this recently stay ACTIVE instead of EXPIRED.
+ACTIVE_HOURS = 3
+
+TICKET_ID_NAMESPACE = uuid.UUID('7d0b6a4e-3f1c-4d8e-9a52-6c1e0f4b2a91')
+
+TICKET_COLUMNS = (
+    'ticket_id', 'user_id', 'network_id', 'source_id', 'destination_id', 'status', 'price',
+    'created_at', 'entry_time', 'exit_time', 'updated_at', 'route_info', 'route',
+)
+
+
+def od_model(network_id, rng):
+    # Gravity model over station pairs: trips ~ popularity(o) * popularity(d)
+    # / hops^DISTANCE_DECAY, with interchanges more popular.
+    hops = get_station_hops(network_id)
+    station_ids = sorted({a for a, _ in hops})
+    lines_per_station = dict(
+        StationOnLine.objects.filter(station_id__in=station_ids)
+        .values('station_id').annotate(n=Count('id')).values_list('station_id', 'n')
+    )
+    popularity = {
+        station_id: rng.lognormal(0, 0.8) * lines_per_station.get(station_id, 1)
+        for station_id in station_ids
+    }
+    pairs = [(a, b, n) for (a, b), n in hops.items() if a != b]
+    src = np.array([a for a, _, _ in pairs], dtype=np.int64)
+    dst = np.array([b for _, b, _ in pairs], dtype=np.int64)
+    stops = np.array([n for _, _, n in pairs], dtype=np.int64)
+    weights = np.array([popularity[a] * popularity[b] for a, b, _ in pairs]) / stops ** DISTANCE_DECAY
+    return src, dst, stops, weights / weights.sum()
+
+def pair_routes(network_id, src, dst):
+    # (route_info, route JSON) for every pair, from the same search the
+    # booking flow uses.
+    graph = get_route_graph(network_id)
+    names = dict(Station.objects.filter(network_id=network_id).values_list('id', 'name'))
+    station_ids = {name: station_id for station_id, name in names.items()}
+    line_ids = dict(MetroLine.objects.filter(network_id=network_id).values_list('name', 'id'))
+    info, routes = [], []
+    for a, b in zip(src.tolist(), dst.tolist()):
+        path, lines, _ = find_shortest_path(names[a], names[b], graph=graph)
+        info.append(get_navigation_instructions(path, lines))
+        routes.append(json.dumps(encode_route(path, lines, network_id, station_ids, line_ids)))
+    return info, routes
+
+def create_users(count, prefix, rng, batch_size):
+    # Returns the new users' ids. All share one password hash ('load-test').
+    User = get_user_model()
+    password = make_password('load-test')
+    balances = np.round(rng.lognormal(3.0, 1.0, count), 2)
+    for start in range(0, count, batch_size):
+        User.objects.bulk_create([
+            User(
+                username=f"{prefix}{i:08d}",
+                email=f"{prefix}{i:08d}@example.com",
+                password=password,
+                balance=Decimal(str(balances[i])),
+            )
+            for i in range(start, min(start + batch_size, count))
+        ], batch_size=batch_size)
+    return np.fromiter(
+        User.objects.filter(username__startswith=prefix).order_by('id').values_list('id', flat=True),
+        dtype=np.int64,
+    )
+
+def ticket_batch(rng, size, user_ids, user_weights, od, days, now, prefix, first_index=0):
+    src, dst, stops, probabilities = od
+    pair = rng.choice(len(src), size=size, p=probabilities)
+
+    # Day (weekends quieter), then hour by profile, then second in the hour.
+    first_day = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+    day_starts = first_day.timestamp() + np.arange(days) * 86400
+    weekday = (first_day.weekday() + np.arange(days)) % 7
+    day_weights = np.where(weekday >= 5, WEEKEND_FACTOR, 1.0)
+    day = rng.choice(days, size=size, p=day_weights / day_weights.sum())
+    hour = rng.choice(24, size=size, p=HOUR_PROFILE / HOUR_PROFILE.sum())
+    created = day_starts[day] + hour * 3600 + rng.uniform(0, 3600, size)
+    created = np.minimum(created, now.timestamp() - 60)
+
+    entry = created + np.minimum(rng.exponential(600, size), 3600)
+    exit = entry + stops[pair] * SECONDS_PER_STOP + rng.exponential(180, size)
+
+    statuses = np.array(list(STATUS_SHARES))
+    status = statuses[rng.choice(len(statuses), size=size, p=list(STATUS_SHARES.values()))]
+    used = status == 'USED'
+    # Trips still under way at `now` have not exited yet.
+    inside = used & (exit > now.timestamp())
+    status = np.where(inside, 'ACTIVE', status)
+    recent = (status == 'EXPIRED') & (created > now.timestamp() - ACTIVE_HOURS * 3600)
+    status = np.where(recent, 'ACTIVE', status)
+
+    entry = np.where(used & (entry <= now.timestamp()), entry, np.nan)
+    exit = np.where(used & ~inside, exit, np.nan)
+    updated = np.fmax(np.fmax(created, entry), exit)
+
+    return {
+        'ticket_id': [str(uuid.uuid5(TICKET_ID_NAMESPACE, f"{prefix}:{i}")) for i in range(first_index, first_index + size)],
+        'user_id': user_ids[rng.choice(len(user_ids), size=size, p=user_weights)],
+        'source_id': src[pair],
+        'destination_id': dst[pair],
+        'pair': pair,
+        'status': status,
+        'price': 2 + 2 * stops[pair],
+        'created_at': created,
+        'entry_time': entry,
+        'exit_time': exit,
+        'updated_at': updated,
+    }
+
+def _timestamps(values):
+    # Epoch seconds -> ISO strings for COPY, '' (NULL) for NaN.
+    stamps = np.datetime_as_string(np.round(np.nan_to_num(values) * 1e6).astype('datetime64[us]'), timezone='UTC')
+    return np.where(np.isnan(values), '', stamps)
+
+def copy_tickets(batch, network_id, routes):
+    info, route_json = routes
+    columns = {
+        'created_at': _timestamps(batch['created_at']),
+        'entry_time': _timestamps(batch['entry_time']),
+        'exit_time': _timestamps(batch['exit_time']),
+        'updated_at': _timestamps(batch['updated_at']),
+    }
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(zip(
+        batch['ticket_id'], batch['user_id'].tolist(), [network_id] * len(batch['pair']),
+        batch['source_id'].tolist(), batch['destination_id'].tolist(), batch['status'].tolist(),
+        batch['price'].tolist(), columns['created_at'].tolist(), columns['entry_time'].tolist(),
+        columns['exit_time'].tolist(), columns['updated_at'].tolist(),
+        [info[p] for p in batch['pair'].tolist()], [route_json[p] for p in batch['pair'].tolist()],
+    ))
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(
+            f"COPY {Ticket._meta.db_table} ({', '.join(TICKET_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+
+@contextmanager
+def _explicit_timestamps():
+    # bulk_create would otherwise stamp created_at/updated_at with now().
+    fields = [Ticket._meta.get_field('created_at'), Ticket._meta.get_field('updated_at')]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+def _datetime(value):
+    return None if np.isnan(value) else datetime.fromtimestamp(value, dt_timezone.utc)
+
+def bulk_create_tickets(batch, network_id, routes):
+    info, route_json = routes
+    with _explicit_timestamps():
+        Ticket.objects.bulk_create([
+            Ticket(
+                ticket_id=ticket_id,
+                user_id=user_id,
+                network_id=network_id,
+                source_id=source_id,
+                destination_id=destination_id,
+                status=status,
+                price=price,
+                created_at=_datetime(created),
+                entry_time=_datetime(entry),
+                exit_time=_datetime(exit),
+                updated_at=_datetime(updated),
+                route_info=info[pair],
+                route=json.loads(route_json[pair]),
+            )
+            for ticket_id, user_id, source_id, destination_id, status, price, created, entry, exit, updated, pair in zip(
+                batch['ticket_id'], batch['user_id'].tolist(), batch['source_id'].tolist(),
+                batch['destination_id'].tolist(), batch['status'].tolist(), batch['price'].tolist(),
+                batch['created_at'], batch['entry_time'], batch['exit_time'], batch['updated_at'],
+                batch['pair'].tolist(),
+            )
+        ], batch_size=5000)
+
+def generate_tickets(network_id, count, user_ids, rng, prefix, days=90, batch_size=100_000, use_copy=None, now=None, progress=None):
+    now = now or datetime.now(dt_timezone.utc)
+    if use_copy is None:
+        use_copy = connection.vendor == 'postgresql'
+    od = od_model(network_id, rng)
+    if not len(od[0]):
+        return 0
+    routes = pair_routes(network_id, od[0], od[1])
+    # A few heavy riders and many occasional ones.
+    activity = rng.pareto(1.5, len(user_ids)) + 1
+    user_weights = activity / activity.sum()
+
+    written = 0
+    while written < count:
+        size = min(batch_size, count - written)
+        batch = ticket_batch(rng, size, user_ids, user_weights, od, days, now, prefix, written)
+        with transaction.atomic():
+            if use_copy:
+                copy_tickets(batch, network_id, routes)
+            else:
+                bulk_create_tickets(batch, network_id, routes)
+        written += size
+        if progress:
+            progress(written)
+    return written
@@ -0,0 +1,104 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# JSON log lines, one object per record, written by a background thread: the
+# request thread only puts the record on a queue. Every record carries the id
+# of the request it was logged from (also sent back as X-Request-ID).
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Never written out, whatever a caller passes in `extra`.
+REDACTED_FIELDS = {'otp', 'password', 'token'}
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                data[key] = '[redacted]' if key in REDACTED_FIELDS else value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class QueueListenerHandler(QueueHandler):
+    # Used from settings.LOGGING; records are handed to a QueueListener that
+    # writes them with JsonFormatter. The listener is started lazily in each
+    # process, so it also works in forked gunicorn workers.
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.target = logging.StreamHandler(stream)
+        self.target.setFormatter(JsonFormatter())
+        self.listener = None
+        self.pid = None
+
+    def prepare(self, record):
+        # Runs on the logging thread: resolve everything that depends on it
+        # (message args, traceback, request id) before the record is queued.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = _request_id.get()
+        return record
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+            self.listener.start()
+            atexit.register(self.listener.stop)
+        super().emit(record)
+
+
+request_logger = logging.getLogger('metro.request')
+
+
+class RequestLogMiddleware:
+    # Assigns the request id and logs one line per request with its timing.
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        token = _request_id.set(request_id[:64])
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            response[REQUEST_ID_HEADER] = request_id[:64]
+            request_logger.info('request', extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+                'user_id': request.user.pk if getattr(request, 'user', None) and request.user.is_authenticated else None,
+            })
+            return response
+        finally:
+            _request_id.reset(token)
@@ -0,0 +1,79 @@
+import gzip
+import json
+import os
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.functions import Now
+from core.models import Ticket
+from core.partitions import add_months, month_start, drop_partition, ensure_partitions
+
+CLOSED_STATUSES = ('USED', 'CANCELLED', 'EXPIRED')
+# Every column, so an archived ticket can be restored as it was, plus the
+# station names for reading the export on its own.
+EXPORT_FIELDS = tuple(field.attname for field in Ticket._meta.concrete_fields) + ('source__name', 'destination__name')
+
+class Command(BaseCommand):
+    help = 'Exports closed months of tickets to compressed JSONL files and removes them from the live table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=3, help='Recent months (including the current one) to keep live')
+        parser.add_argument('--output-dir', default=getattr(settings, 'TICKET_ARCHIVE_DIR', 'archive'))
+        parser.add_argument('--expire-active', action='store_true', help='Mark leftover ACTIVE tickets in archived months as EXPIRED')
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--months-ahead', type=int, default=3, help='Future monthly partitions to pre-create (PostgreSQL only)')
+
+    def handle(self, *args, **options):
+        if options['keep_months'] < 1:
+            raise CommandError('--keep-months must be at least 1 so the current month stays live.')
+
+        cutoff = add_months(month_start(datetime.now(dt_timezone.utc)), 1 - options['keep_months'])
+        months = [month_start(d) for d in Ticket.objects.filter(created_at__lt=cutoff).dates('created_at', 'month')]
+
+        if not months:
+            self.stdout.write('No months older than %s to archive.' % cutoff.strftime('%Y-%m'))
+
+        os.makedirs(options['output_dir'], exist_ok=True)
+        for month in months:
+            self.archive_month(month, options)
+
+        created = ensure_partitions(month_start(datetime.now(dt_timezone.utc)), options['months_ahead'])
+        for name in created:
+            self.stdout.write(f'Created partition {name}')
+
+    def archive_month(self, month, options):
+        label = month.strftime('%Y-%m')
+        tickets = Ticket.objects.filter(created_at__gte=month, created_at__lt=add_months(month, 1))
+
+        active = tickets.exclude(status__in=CLOSED_STATUSES).count()
+        if active:
+            if not options['expire_active']:
+                self.stdout.write(self.style.WARNING(f'{label}: skipped, {active} ticket(s) still ACTIVE (use --expire-active).'))
+                return
+            if not options['dry_run']:
+                # update() skips auto_now; ?since= syncing relies on updated_at.
+                tickets.exclude(status__in=CLOSED_STATUSES).update(status='EXPIRED', updated_at=Now())
+
+        if options['dry_run']:
+            self.stdout.write(f'{label}: would archive {tickets.count()} ticket(s).')
+            return
+
+        path = os.path.join(options['output_dir'], f'tickets-{label}.jsonl.gz')
+        tmp_path = path + '.tmp'
+        written = 0
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as out:
+            for row in tickets.order_by('id').values(*EXPORT_FIELDS).iterator(chunk_size=5000):
+                out.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False))
+                out.write('\n')
+                written += 1
+        os.replace(tmp_path, path)
+
+        with transaction.atomic():
+            if tickets.count() != written:
+                raise CommandError(f'{label}: tickets changed while exporting, nothing was removed.')
+            if not drop_partition(month):
+                tickets.delete()
+
+        self.stdout.write(self.style.SUCCESS(f'{label}: archived {written} ticket(s) to {path}'))
@@ -0,0 +1,62 @@
+import json
+import platform
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.benchmarks import compare, run_benchmark, synthetic_network
+
+DEFAULT_SIZES = '68,500,2000,10000'
+
+class Command(BaseCommand):
+    help = 'Benchmarks route finding on synthetic networks and writes the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma-separated station counts')
+        parser.add_argument('--stations-per-line', type=int, default=17, help='Sets the number of lines for each size')
+        parser.add_argument('--interchange', type=float, default=0.1, help='Share of stations also served by a second line')
+        parser.add_argument('--queries', type=int, default=1000, help='Random origin/destination pairs per network')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write results to this JSON file')
+        parser.add_argument('--baseline', help='Earlier results file to compare against')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers.')
+        if not 0 <= options['interchange'] <= 1:
+            raise CommandError('--interchange must be between 0 and 1.')
+
+        results = []
+        for stations in sizes:
+            lines = max(1, round(stations / options['stations_per_line']))
+            rows = synthetic_network(stations, lines, options['interchange'], options['seed'])
+            result = run_benchmark(rows, options['queries'], options['seed'])
+            results.append(result)
+            self.stdout.write(
+                f"{result['stations']:>6} stations {result['lines']:>4} lines: "
+                f"build {result['graph_build_ms']} ms, {result['graph_memory_kb']} KB, "
+                f"path p50 {result['find_shortest_path'].get('p50_us')} us "
+                f"p95 {result['find_shortest_path'].get('p95_us')} us, "
+                f"{result['throughput_qps']} queries/s"
+            )
+
+        report = {
+            'created': timezone.now().isoformat(),
+            'python': sys.version.split()[0],
+            'machine': platform.machine(),
+            'settings': {key: options[key] for key in ('interchange', 'queries', 'seed', 'stations_per_line')},
+            'results': results,
+        }
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                report['compared_to'] = options['baseline']
+                report['changes'] = compare(results, json.load(f))
+            for change in report['changes']:
+                self.stdout.write(f"{change['stations']:>6} stations vs baseline: {change}")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from core.layout import update_layout
+from core.models import Network
+
+class Command(BaseCommand):
+    help = 'Computes station positions for the home page map (done automatically when the network changes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Recompute even if the network has not changed')
+        parser.add_argument('--network', help='Slug of the network to lay out (default: all)')
+
+    def handle(self, *args, **options):
+        networks = Network.objects.all()
+        if options['network']:
+            networks = networks.filter(slug=options['network'])
+        for network in networks:
+            if update_layout(network.id, force=options['force']):
+                self.stdout.write(self.style.SUCCESS(f'{network}: map layout updated.'))
+            else:
+                self.stdout.write(f'{network}: map layout is up to date.')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from core.segment_load import backfill_routes, rebuild_segment_load
+
+class Command(BaseCommand):
+    help = 'Rebuilds per-segment line load from the stored routes of USED tickets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true', help='First compute routes for old tickets that have none')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            updated = backfill_routes()
+            self.stdout.write(f'Backfilled routes on {updated} ticket(s).')
+
+        hops = rebuild_segment_load()
+        self.stdout.write(self.style.SUCCESS(f'Segment load rebuilt from {hops} travelled hop(s).'))
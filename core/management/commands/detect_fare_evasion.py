@@ -0,0 +1,49 @@
+import logging
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core.fraud import FareEvasionDetector
+from core.live import GATE_BUFFER_SIZE, current_seq, events_since, is_shared
+from core.models import FareIncident
+
+logger = logging.getLogger('metro.fraud')
+
+class Command(BaseCommand):
+    help = 'Watches gate scans and records suspicious patterns as fare incidents (run as a long-lived process)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds between polls of the scan buffer')
+        parser.add_argument('--once', action='store_true', help='Process the scans currently buffered and exit')
+
+    def handle(self, *args, **options):
+        # Scans reach this process only through the cache the web workers
+        # publish to, so it must be one they all share (Redis in
+        # docker-compose.yml), not a per-process one.
+        if not is_shared():
+            raise CommandError(
+                'The default cache is per-process, so gate scans from the web workers are not visible here. '
+                'Set CACHE_BACKEND/CACHE_LOCATION to a cache shared with them (e.g. Redis).'
+            )
+
+        detector = FareEvasionDetector()
+        seq = max(current_seq() - GATE_BUFFER_SIZE, 0) if options['once'] else current_seq()
+
+        while True:
+            events = events_since(seq)
+            if events and events[0]['seq'] > seq + 1:
+                # More than GATE_BUFFER_SIZE scans since the last poll.
+                missed = events[0]['seq'] - seq - 1
+                logger.warning('gate scans missed', extra={'missed': missed, 'buffer_size': GATE_BUFFER_SIZE})
+                self.stderr.write(f'Missed {missed} scan(s); poll more often or raise GATE_BUFFER_SIZE.')
+
+            incidents = []
+            for event in events:
+                incidents.extend(detector.feed(event))
+                seq = event['seq']
+            if incidents:
+                FareIncident.objects.bulk_create(incidents)
+                for incident in incidents:
+                    self.stdout.write(f'{incident.get_kind_display()}: {incident.details}')
+
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,63 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from core.loadgen import create_users, generate_tickets
+from core.models import Network, Ticket
+from core.network import get_default_network
+from core.partitions import ensure_partitions
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+class Command(BaseCommand):
+    help = 'Generates synthetic users and tickets for capacity testing (reproducible with --seed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--tickets', type=int, default=100_000)
+        parser.add_argument('--days', type=int, default=90, help='Spread tickets over this many days up to now')
+        parser.add_argument('--network', help='Network slug (default: the default network)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--prefix', default='load', help='Username prefix; must not match existing users')
+        parser.add_argument('--batch-size', type=int, default=100_000)
+        parser.add_argument('--no-copy', action='store_true', help='Use bulk_create even on PostgreSQL')
+
+    def handle(self, *args, **options):
+        if options['network']:
+            network = Network.objects.filter(slug=options['network']).first()
+        else:
+            network = get_default_network()
+        if network is None:
+            raise CommandError('Unknown network; load one with loading_metro_data first.')
+
+        User = Ticket._meta.get_field('user').related_model
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Users with prefix '{options['prefix']}' already exist; pick another --prefix.")
+        if options['users'] < 1 or options['days'] < 1:
+            raise CommandError('--users and --days must be at least 1.')
+
+        now = datetime.now(dt_timezone.utc)
+        ensure_partitions(now - timedelta(days=options['days']))
+        use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+
+        # Users and tickets land together or not at all, so a failed run
+        # leaves nothing behind and can be repeated with the same prefix.
+        with transaction.atomic():
+            rng = np.random.default_rng(options['seed'])
+            started = time.perf_counter()
+            user_ids = create_users(options['users'], options['prefix'], rng, min(options['batch_size'], 10_000))
+            self.stdout.write(f"{len(user_ids)} users in {time.perf_counter() - started:.1f} s")
+
+            tickets_started = time.perf_counter()
+
+            def progress(written):
+                rate = written / (time.perf_counter() - tickets_started)
+                self.stdout.write(f"  {written} tickets ({rate:,.0f}/s)")
+
+            written = generate_tickets(
+                network.id, options['tickets'], user_ids, rng, options['prefix'],
+                days=options['days'], batch_size=options['batch_size'], use_copy=use_copy, now=now, progress=progress,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{written} {network} tickets via {'COPY' if use_copy else 'bulk_create'} "
+            f"in {time.perf_counter() - tickets_started:.1f} s. Run reconcile_occupancy, compute_segment_load and rebuild_travel_stats to refresh derived data."
+        ))
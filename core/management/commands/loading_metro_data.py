@@ -1,24 +1,41 @@
 import csv
 from django.core.management.base import BaseCommand
-from core.models import MetroLine, Station, StationOnLine
+from django.db import transaction
+from django.utils.text import slugify
+from core.models import MetroLine, Network, Station, StationOnLine
+from core.network import invalidate_network
 
 class Command(BaseCommand):
     help = 'Loads metro data from lines.csv and calculates simulated distances'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--network', default='montreal', help='Slug of the network to (re)load; created if missing')
+        parser.add_argument('--name', help='Display name for a new network (default: from the slug)')
+        parser.add_argument('--file', default='lines.csv', help='CSV with line_name and stations_list columns')
+
+    @transaction.atomic
     def handle(self, *args, **kwargs):
-        # 1. Clear existing data to prevent duplicates
-        StationOnLine.objects.all().delete()
-        Station.objects.all().delete()
-        MetroLine.objects.all().delete()
+        network, created = Network.objects.get_or_create(
+            slug=slugify(kwargs['network']),
+            defaults={'name': kwargs['name'] or kwargs['network'].replace('-', ' ').title()},
+        )
+        if created and not Network.objects.filter(is_default=True).exists():
+            network.is_default = True
+            network.save()
+
+        # 1. Clear existing data to prevent duplicates (this network only)
+        StationOnLine.objects.filter(line__network=network).delete()
+        Station.objects.filter(network=network).delete()
+        MetroLine.objects.filter(network=network).delete()
         
-        print("Cleared old data...")
+        print(f"Cleared old {network} data...")
 
-        with open('lines.csv', 'r', encoding='utf-8') as file:
+        with open(kwargs['file'], 'r', encoding='utf-8') as file:
             reader = csv.DictReader(file)
             
             for row in reader:
                 line_name = row['line_name']
-                metro_line, created = MetroLine.objects.get_or_create(name=line_name)
+                metro_line, created = MetroLine.objects.get_or_create(network=network, name=line_name)
                 print(f"Processing {line_name}...")
 
                 stations_list = row['stations_list'].split(',')
@@ -30,6 +47,7 @@ class Command(BaseCommand):
                     simulated_distance = (index + 1)
                  
                     station, created = Station.objects.get_or_create(
+                        network=network,
                         name=station_name,
                         defaults={'distance_from_hub': simulated_distance}
                     )
@@ -40,4 +58,5 @@ class Command(BaseCommand):
                         order=index + 1
                     )
 
-        self.stdout.write(self.style.SUCCESS('Successfully loaded Montreal Metro data with distances!'))
\ No newline at end of file
+        invalidate_network(network.id)
+        self.stdout.write(self.style.SUCCESS(f'Successfully loaded {network} Metro data with distances!'))
\ No newline at end of file
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from core.travel_stats import rebuild_travel_stats
+
+class Command(BaseCommand):
+    help = 'Recomputes every user\'s travel stats from their tickets (streamed in chunks)'
+
+    def handle(self, *args, **options):
+        users = rebuild_travel_stats()
+        self.stdout.write(self.style.SUCCESS(f'Travel stats rebuilt for {users} user(s).'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core.occupancy import reconcile_occupancy
+
+class Command(BaseCommand):
+    help = 'Rebuilds the in-system occupancy counters from open tickets (run periodically, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero every counter instead (e.g. after closing time)')
+
+    def handle(self, *args, **options):
+        changed = reconcile_occupancy(reset=options['reset'])
+        action = 'Reset' if options['reset'] else 'Reconciled'
+        self.stdout.write(self.style.SUCCESS(f'{action} occupancy counters ({changed} station(s) changed).'))
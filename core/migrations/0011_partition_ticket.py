@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:04
+
+from django.db import migrations, models
+from core.partitions import partition_ticket_table, unpartition_ticket_table
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_alter_stationonline_options'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_ticket_table, unpartition_ticket_table),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['user', 'created_at'], name='core_ticket_user_id_800f42_idx'),
+        ),
+    ]
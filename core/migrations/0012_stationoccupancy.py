@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_partition_ticket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StationOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inside', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('station', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='core.station')),
+            ],
+            options={
+                'verbose_name_plural': 'Station occupancy',
+            },
+        ),
+    ]
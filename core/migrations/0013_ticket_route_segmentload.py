@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_stationoccupancy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='route',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='SegmentLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trips', models.PositiveIntegerField(default=0)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('from_station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.station')),
+                ('line', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segment_loads', to='core.metroline')),
+                ('to_station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.station')),
+            ],
+            options={
+                'ordering': ['-trips'],
+                'unique_together': {('line', 'from_station', 'to_station')},
+            },
+        ),
+    ]
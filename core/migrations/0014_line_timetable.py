@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:15
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_ticket_route_segmentload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='metroline',
+            name='first_departure',
+            field=models.TimeField(default=datetime.time(5, 30), help_text='First train leaves each terminus'),
+        ),
+        migrations.AddField(
+            model_name='metroline',
+            name='headway_minutes',
+            field=models.PositiveIntegerField(default=5, help_text='Minutes between trains'),
+        ),
+        migrations.AddField(
+            model_name='metroline',
+            name='last_departure',
+            field=models.TimeField(default=datetime.time(0, 30), help_text='Last train leaves each terminus (may be after midnight)'),
+        ),
+        migrations.AddField(
+            model_name='stationonline',
+            name='run_seconds',
+            field=models.PositiveIntegerField(default=120, help_text='Travel time from the previous stop on this line'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_line_timetable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='station',
+            name='is_active',
+            field=models.BooleanField(default=True, help_text='Uncheck to close the station; no routes will use it'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_station_is_active'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='station',
+            name='map_x',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='station',
+            name='map_y',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_station_map_position'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FareIncident',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('SHARING', 'Entries too far apart to be one passenger'), ('BURST', 'Burst of entries on one account'), ('NO_ENTRY', 'Exits without entry at one station')], max_length=10)),
+                ('status', models.CharField(choices=[('OPEN', 'Open'), ('REVIEWED', 'Reviewed'), ('DISMISSED', 'Dismissed')], default='OPEN', max_length=10)),
+                ('ticket_ids', models.JSONField(blank=True, default=list)),
+                ('details', models.TextField(blank=True)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('station', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='fare_incidents', to='core.station')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='fare_incidents', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:26
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_updated_at(apps, schema_editor):
+    Ticket = apps.get_model('core', 'Ticket')
+    Ticket.objects.update(updated_at=Coalesce('exit_time', 'entry_time', 'created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_fareincident'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['user', 'updated_at'], name='core_ticket_user_id_e2dc2e_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def assign_default_network(apps, schema_editor):
+    Network = apps.get_model('core', 'Network')
+    network, _ = Network.objects.get_or_create(slug='montreal', defaults={'name': 'Montreal', 'is_default': True})
+    for model in ('MetroLine', 'Station', 'Ticket', 'SystemSettings'):
+        apps.get_model('core', model).objects.filter(network__isnull=True).update(network=network)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_ticket_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Network',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('slug', models.SlugField(unique=True)),
+                ('domain', models.CharField(blank=True, help_text='Host name that selects this network, e.g. montreal.example.com', max_length=255)),
+                ('is_default', models.BooleanField(default=False, help_text='Used when a request does not pick a network')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='metroline',
+            name='network',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='core.network'),
+        ),
+        migrations.AddField(
+            model_name='station',
+            name='network',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stations', to='core.network'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='network',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='core.network'),
+        ),
+        migrations.AddField(
+            model_name='systemsettings',
+            name='network',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='settings', to='core.network'),
+        ),
+        migrations.RunPython(assign_default_network, migrations.RunPython.noop),
+    ]
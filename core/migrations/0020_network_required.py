@@ -0,0 +1,52 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    # Separate from 0019 so the backfill's deferred constraint checks have
+    # run before the columns are altered (PostgreSQL refuses otherwise).
+
+    dependencies = [
+        ('core', '0019_network'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='metroline',
+            name='network',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='core.network'),
+        ),
+        migrations.AlterField(
+            model_name='station',
+            name='network',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stations', to='core.network'),
+        ),
+        migrations.AlterField(
+            model_name='ticket',
+            name='network',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='core.network'),
+        ),
+        migrations.AlterField(
+            model_name='systemsettings',
+            name='network',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='settings', to='core.network'),
+        ),
+        migrations.AlterField(
+            model_name='metroline',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='station',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='metroline',
+            constraint=models.UniqueConstraint(fields=('network', 'name'), name='unique_line_name_per_network'),
+        ),
+        migrations.AddConstraint(
+            model_name='station',
+            constraint=models.UniqueConstraint(fields=('network', 'name'), name='unique_station_name_per_network'),
+        ),
+    ]
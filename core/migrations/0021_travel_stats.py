@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_network_required'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TravelStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='travel_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('tickets', models.PositiveIntegerField(default=0)),
+                ('trips', models.PositiveIntegerField(default=0)),
+                ('cancelled', models.PositiveIntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_trip_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Travel stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='StationVisits',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('visits', models.PositiveIntegerField(default=0)),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.station')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='station_visits', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-visits'], name='core_statio_user_id_c6f11f_idx')],
+                'unique_together': {('user', 'station')},
+            },
+        ),
+    ]
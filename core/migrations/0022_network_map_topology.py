@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_travel_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='network',
+            name='map_topology',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+    ]
@@ -0,0 +1,15 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:00
+
+from django.db import migrations
+from core.partitions import add_ticket_id_index, drop_ticket_id_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_network_map_topology'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_ticket_id_index, drop_ticket_id_index),
+    ]
@@ -1,5 +1,7 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+import datetime
 import uuid
 
 class User(AbstractUser):
@@ -10,18 +12,47 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+class Network(models.Model):
+    # One city's transit system. Lines, stations, tickets and settings each
+    # belong to exactly one network; routing caches are kept per network.
+    name = models.CharField(max_length=100, unique=True)
+    slug = models.SlugField(unique=True)
+    domain = models.CharField(max_length=255, blank=True, help_text="Host name that selects this network, e.g. montreal.example.com")
+    is_default = models.BooleanField(default=False, help_text="Used when a request does not pick a network")
+    # Stations and connections the stored map layout was computed for (core/layout.py).
+    map_topology = models.CharField(max_length=40, blank=True, editable=False)
+
+    def __str__(self):
+        return self.name
+
 class MetroLine(models.Model):
 
-    name = models.CharField(max_length=100, unique=True)
+    network = models.ForeignKey(Network, on_delete=models.CASCADE, related_name='lines')
+    name = models.CharField(max_length=100)
     color = models.CharField(max_length=7, default='#6c757d', help_text="Hex code, e.g., #FF0000")
     is_active = models.BooleanField(default=True) 
+    headway_minutes = models.PositiveIntegerField(default=5, help_text="Minutes between trains")
+    first_departure = models.TimeField(default=datetime.time(5, 30), help_text="First train leaves each terminus")
+    last_departure = models.TimeField(default=datetime.time(0, 30), help_text="Last train leaves each terminus (may be after midnight)")
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['network', 'name'], name='unique_line_name_per_network')]
+
     def __str__(self):
         return self.name
 
 class Station(models.Model):
 
-    name = models.CharField(max_length=100, unique=True)
+    network = models.ForeignKey(Network, on_delete=models.CASCADE, related_name='stations')
+    name = models.CharField(max_length=100)
     distance_from_hub = models.FloatField(default=0.0, help_text="Distance in km from the central station")
+    is_active = models.BooleanField(default=True, help_text="Uncheck to close the station; no routes will use it")
+    map_x = models.FloatField(null=True, blank=True, editable=False)
+    map_y = models.FloatField(null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['network', 'name'], name='unique_station_name_per_network')]
+
     def __str__(self):
         return self.name
     @property
@@ -34,12 +65,17 @@ class StationOnLine(models.Model):
     line = models.ForeignKey(MetroLine, on_delete=models.CASCADE)
     order = models.PositiveIntegerField(default=0, help_text="Order of station (1, 2, 3...)")
     is_interchange = models.BooleanField(default=False, help_text="Check if users can change lines here")
+    run_seconds = models.PositiveIntegerField(default=120, help_text="Travel time from the previous stop on this line")
 
     class Meta:
         ordering = ['id']
 
     def __str__(self):
         return f"{self.line.name} - {self.station.name}"
+
+    def clean(self):
+        if self.station_id and self.line_id and self.station.network_id != self.line.network_id:
+            raise ValidationError("The station and the line belong to different networks.")
 class Ticket(models.Model):
 
     STATUS_CHOICES = (
@@ -49,9 +85,12 @@ class Ticket(models.Model):
         ('CANCELLED', 'Cancelled'),
     )
 
+    # On PostgreSQL the partitioned table cannot enforce this by itself; the
+    # core_ticket_id table does instead (core/partitions.py).
     ticket_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tickets')
+    network = models.ForeignKey(Network, on_delete=models.CASCADE, related_name='tickets')
     source = models.ForeignKey(Station, related_name='source_tickets', on_delete=models.CASCADE)
     destination = models.ForeignKey(Station, related_name='dest_tickets', on_delete=models.CASCADE)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ACTIVE')
@@ -62,17 +101,120 @@ class Ticket(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     entry_time = models.DateTimeField(null=True, blank=True)
     exit_time = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     route_info = models.TextField(default="Direct Trip")
+    # {"stations": [id, ...], "lines": [line_id per hop]}; see utils.encode_route
+    route = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        # On PostgreSQL the table is partitioned by created_at month (see core/partitions.py).
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['user', 'updated_at']),
+        ]
 
     def __str__(self):
         return f"Ticket {self.ticket_id} ({self.status})"
     
 class SystemSettings(models.Model):
+    network = models.OneToOneField(Network, on_delete=models.CASCADE, related_name='settings')
     is_metro_open = models.BooleanField(default=True)
     
     def __str__(self):
-        return "Metro System Status"
+        return f"{self.network} Metro System Status"
+
+    class Meta:
+        verbose_name_plural = "System Settings"
+
+class StationOccupancy(models.Model):
+    # Passengers currently inside the system, keyed by the station they
+    # entered at. Maintained by scan_ticket, rebuilt by reconcile_occupancy.
+    station = models.OneToOneField(Station, on_delete=models.CASCADE, related_name='occupancy')
+    inside = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Station occupancy"
+
+    def __str__(self):
+        return f"{self.station.name}: {self.inside}"
+
+class FareIncident(models.Model):
+    # Suspicious scan patterns flagged by `manage.py detect_fare_evasion`
+    # (see core/fraud.py), kept for staff review.
+    KIND_CHOICES = (
+        ('SHARING', 'Entries too far apart to be one passenger'),
+        ('BURST', 'Burst of entries on one account'),
+        ('NO_ENTRY', 'Exits without entry at one station'),
+    )
+    STATUS_CHOICES = (
+        ('OPEN', 'Open'),
+        ('REVIEWED', 'Reviewed'),
+        ('DISMISSED', 'Dismissed'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='OPEN')
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='fare_incidents')
+    station = models.ForeignKey(Station, null=True, blank=True, on_delete=models.SET_NULL, related_name='fare_incidents')
+    # Plain ids: the ticket table is partitioned on PostgreSQL, so no foreign key.
+    ticket_ids = models.JSONField(default=list, blank=True)
+    details = models.TextField(blank=True)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} ({self.last_seen:%Y-%m-%d %H:%M})"
+
+class SegmentLoad(models.Model):
+    # Trips that travelled from_station -> to_station on a line, rebuilt by
+    # `manage.py compute_segment_load` from USED tickets.
+    line = models.ForeignKey(MetroLine, on_delete=models.CASCADE, related_name='segment_loads')
+    from_station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='+')
+    to_station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='+')
+    trips = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-trips']
+        unique_together = ('line', 'from_station', 'to_station')
+
+    def __str__(self):
+        return f"{self.line.name}: {self.from_station.name} → {self.to_station.name}"
+
+class TravelStats(models.Model):
+    # Per-user totals, kept up to date by core/travel_stats.py as tickets are
+    # bought, cancelled and used; rebuilt by `manage.py rebuild_travel_stats`.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='travel_stats')
+    tickets = models.PositiveIntegerField(default=0)
+    trips = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+    # Price of every ticket bought, less refunds.
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_trip_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        verbose_name_plural = "System Settings"
\ No newline at end of file
+        verbose_name_plural = "Travel stats"
+
+    def __str__(self):
+        return f"{self.user}: {self.trips} trips"
+
+class StationVisits(models.Model):
+    # Completed trips per user and station (as origin or destination), for
+    # "most used stations".
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='station_visits')
+    station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='+')
+    visits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'station')
+        indexes = [models.Index(fields=['user', '-visits'])]
+
+    def __str__(self):
+        return f"{self.user} at {self.station.name}: {self.visits}"
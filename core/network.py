@@ -0,0 +1,192 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from .db_router import primary_reads
+from .live import is_shared
+from .models import Network, Station, StationOnLine, SystemSettings
+
+# Per-worker copies of data that rarely changes. Each entry remembers the
+# version it was built from; versions live in the shared cache and are bumped
+# by invalidate_network()/invalidate_settings(), so every worker rebuilds on
+# its next use after an edit. Everything belonging to a transit network is
+# versioned per network, so editing one city never touches another's caches.
+# With a per-process cache (LocMem) a bump is only seen by the process that
+# made it, so there entries are also rebuilt after NETWORK_MEMO_TTL seconds.
+
+NETWORKS_VERSION_KEY = 'networks:version'
+NETWORK_VERSION_KEY = 'network:{}:version'
+SETTINGS_VERSION_KEY = 'settings:{}:version'
+# What a network version took out of service, so derived caches can drop
+# only the entries that used it (see core/routing.py).
+NETWORK_CLOSURE_KEY = 'network:{}:closed:{}'
+CLOSURE_TTL = 60 * 60
+NETWORK_SESSION_KEY = 'network'
+NETWORK_HEADER = 'X-Network'
+
+MEMO_TTL = getattr(settings, 'NETWORK_MEMO_TTL', 30)
+
+_memo = {}
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+def _bump(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+        return None
+
+def memo_expired(built_at):
+    # Whether something cached in this process at `built_at` (monotonic
+    # time) may have missed an edit made elsewhere.
+    return not is_shared() and time.monotonic() - built_at > MEMO_TTL
+
+def _memoized(name, version_key, builder):
+    version = _version(version_key)
+    entry = _memo.get(name)
+    if entry is not None and entry[0] == version and not memo_expired(entry[2]):
+        return entry[1]
+    built_at = time.monotonic()
+    # A lagging replica could still return the data from before the bump,
+    # which would then be kept under the new version.
+    with primary_reads():
+        value = builder()
+    _memo[name] = (version, value, built_at)
+    return value
+
+def network_memoized(name, network_id, builder):
+    # _memoized() for data derived from one network's lines and stations.
+    return _memoized(f'{name}:{network_id}', NETWORK_VERSION_KEY.format(network_id), builder)
+
+def network_version(network_id):
+    return _version(NETWORK_VERSION_KEY.format(network_id))
+
+def invalidate_network(network_id, closed=None):
+    # closed: {'lines': [...], 'stations': [...]} names, when the change only
+    # takes parts of the network out of service.
+    version = _bump(NETWORK_VERSION_KEY.format(network_id))
+    if closed and version is not None:
+        cache.set(NETWORK_CLOSURE_KEY.format(network_id, version), closed, timeout=CLOSURE_TTL)
+
+def invalidate_settings(network_id):
+    _bump(SETTINGS_VERSION_KEY.format(network_id))
+
+def invalidate_networks():
+    _bump(NETWORKS_VERSION_KEY)
+
+def closures_between(network_id, old_version, new_version):
+    # Lines and stations closed between two versions, or None if any change
+    # in between was something else (or is no longer known).
+    if old_version is None or new_version < old_version or new_version - old_version > 100:
+        return None
+    keys = [NETWORK_CLOSURE_KEY.format(network_id, v) for v in range(old_version + 1, new_version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return None
+    lines, stations = set(), set()
+    for closed in changes.values():
+        lines.update(closed.get('lines', ()))
+        stations.update(closed.get('stations', ()))
+    return lines, stations
+
+def route_graph_from_stops(rows):
+    # rows: (line_name, order, station_name, station_is_active). Closed
+    # stations stay in the stop order but no edge leads to or from them.
+    graph = {}
+    lines_map = {}
+    for line_name, order, station_name, is_active in rows:
+        lines_map.setdefault(line_name, []).append((order, station_name, is_active))
+
+    for line_name, stops in lines_map.items():
+        stops.sort(key=lambda stop: stop[0])
+        for i in range(len(stops)):
+            _, curr_st, curr_open = stops[i]
+            if not curr_open:
+                continue
+            if curr_st not in graph: graph[curr_st] = []
+
+            if i > 0 and stops[i-1][2]:
+                graph[curr_st].append((stops[i-1][1], line_name))
+            if i < len(stops) - 1 and stops[i+1][2]:
+                graph[curr_st].append((stops[i+1][1], line_name))
+
+    return graph
+
+def build_route_graph(network_id):
+    # Inactive lines are left out.
+    rows = StationOnLine.objects.filter(line__network_id=network_id, line__is_active=True).values_list(
+        'line__name', 'order', 'station__name', 'station__is_active'
+    )
+    return route_graph_from_stops(rows)
+
+def get_route_graph(network_id):
+    return network_memoized('graph', network_id, lambda: build_route_graph(network_id))
+
+def get_stations(network_id):
+    # Lightweight (id, name) rows for station pickers, ordered by name.
+    return network_memoized('stations', network_id, lambda: list(
+        Station.objects.filter(network_id=network_id, is_active=True).order_by('name').values('id', 'name')
+    ))
+
+def get_system_settings(network_id):
+    def load():
+        settings, _ = SystemSettings.objects.get_or_create(network_id=network_id)
+        return settings
+    return _memoized(f'settings:{network_id}', SETTINGS_VERSION_KEY.format(network_id), load)
+
+def get_networks():
+    return _memoized('networks', NETWORKS_VERSION_KEY, lambda: list(Network.objects.order_by('name')))
+
+def get_default_network():
+    networks = get_networks()
+    for network in networks:
+        if network.is_default:
+            return network
+    return networks[0] if networks else None
+
+def network_for_request(request):
+    # Host name first, then an explicit X-Network header (API clients), then
+    # the visitor's choice (see views.switch_network), then the default.
+    networks = get_networks()
+    host = request.get_host().split(':')[0]
+    for network in networks:
+        if network.domain and network.domain == host:
+            return network
+
+    by_slug = {network.slug: network for network in networks}
+    slug = request.headers.get(NETWORK_HEADER)
+    if not slug and hasattr(request, 'session'):
+        slug = request.session.get(NETWORK_SESSION_KEY)
+    return by_slug.get(slug) or get_default_network()
+
+
+class NetworkMiddleware:
+    # Until a network exists (e.g. before loading_metro_data) only the admin
+    # site works; every other page needs request.network.
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.network = network_for_request(request)
+        if request.network is None and not _is_admin_site(request):
+            return HttpResponse(
+                "No transit network has been set up yet.", status=503, content_type='text/plain'
+            )
+        return self.get_response(request)
+
+def _is_admin_site(request):
+    try:
+        return resolve(request.path_info).app_name == 'admin'
+    except Resolver404:
+        return False
+
+def network_context(request):
+    return {'network': getattr(request, 'network', None), 'networks': get_networks()}
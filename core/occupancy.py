@@ -0,0 +1,78 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import Station, StationOccupancy, StationOnLine, Ticket
+
+# A ticket counts as "inside" from its entry scan until its exit scan.
+# Entries older than this are assumed to have left without scanning out.
+INSIDE_MAX_HOURS = 3
+
+
+def _bump(station_id, delta):
+    now = timezone.now()
+    rows = StationOccupancy.objects.filter(station_id=station_id)
+    if not rows.update(inside=Greatest(F('inside') + delta, 0), updated_at=now):
+        StationOccupancy.objects.get_or_create(station_id=station_id)
+        rows.update(inside=Greatest(F('inside') + delta, 0), updated_at=now)
+
+def record_entry(ticket):
+    _bump(ticket.source_id, 1)
+
+def record_exit(ticket):
+    # Passengers are tracked by where they entered, not where they leave.
+    _bump(ticket.source_id, -1)
+
+def inside_tickets(now=None):
+    now = now or timezone.now()
+    return Ticket.objects.filter(
+        status='ACTIVE',
+        entry_time__gte=now - timedelta(hours=INSIDE_MAX_HOURS),
+        exit_time__isnull=True,
+    )
+
+@transaction.atomic
+def reconcile_occupancy(reset=False):
+    counts = {} if reset else dict(
+        inside_tickets().values('source_id').annotate(n=Count('id')).values_list('source_id', 'n')
+    )
+
+    existing = {row.station_id: row for row in StationOccupancy.objects.select_for_update()}
+    now = timezone.now()
+    to_update, to_create = [], []
+    for station_id in Station.objects.values_list('id', flat=True):
+        inside = counts.get(station_id, 0)
+        row = existing.get(station_id)
+        if row is None:
+            to_create.append(StationOccupancy(station_id=station_id, inside=inside))
+        elif row.inside != inside:
+            row.inside = inside
+            row.updated_at = now
+            to_update.append(row)
+
+    StationOccupancy.objects.bulk_update(to_update, ['inside', 'updated_at'])
+    StationOccupancy.objects.bulk_create(to_create)
+    return len(to_update) + len(to_create)
+
+def occupancy_snapshot(network_id):
+    inside_by_station = dict(StationOccupancy.objects.filter(station__network_id=network_id).values_list('station_id', 'inside'))
+
+    stations = [
+        {'id': station_id, 'name': name, 'inside': inside_by_station.get(station_id, 0)}
+        for station_id, name in Station.objects.filter(network_id=network_id).order_by('name').values_list('id', 'name')
+    ]
+
+    # Interchange stations count towards every line that serves them.
+    lines = {}
+    memberships = StationOnLine.objects.filter(line__network_id=network_id, line__is_active=True).values_list('line__name', 'line__color', 'station_id')
+    for line_name, color, station_id in memberships:
+        line = lines.setdefault(line_name, {'name': line_name, 'color': color, 'inside': 0})
+        line['inside'] += inside_by_station.get(station_id, 0)
+
+    return {
+        'total': sum(inside_by_station.values()),
+        'stations': stations,
+        'lines': sorted(lines.values(), key=lambda line: line['name']),
+        'generated_at': timezone.now(),
+    }
@@ -0,0 +1,88 @@
+import io
+from datetime import datetime, time, timedelta
+import numpy as np
+from django.core.cache import cache
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+from .models import Station, Ticket
+
+# Origin-destination trip counts, shape (24, N, N): hour of entry x origin x
+# destination, with stations mapped to dense indices 0..N-1 by ascending id.
+# Each transit network has its own matrices.
+
+CHUNK_SIZE = 50_000
+PAST_DAY_TTL = 60 * 60 * 24 * 30
+TODAY_TTL = 60 * 5
+
+DAY_TYPES = {
+    'all': range(7),
+    'weekday': range(5),
+    'weekend': (5, 6),
+}
+
+
+def station_index(network_id):
+    ids = np.fromiter(Station.objects.filter(network_id=network_id).order_by('id').values_list('id', flat=True), dtype=np.int64)
+    lookup = np.full(int(ids.max()) + 1 if len(ids) else 1, -1, dtype=np.int64)
+    lookup[ids] = np.arange(len(ids))
+    return ids, lookup
+
+def _accumulate(matrix, lookup, rows):
+    data = np.asarray(rows, dtype=np.int64)
+    # Stations created after the index was built (ids past its end, or -1
+    # inside it) are dropped.
+    data = data[(data[:, 0] < len(lookup)) & (data[:, 1] < len(lookup))]
+    src, dst = lookup[data[:, 0]], lookup[data[:, 1]]
+    keep = (src >= 0) & (dst >= 0)
+    np.add.at(matrix, (data[keep, 2], src[keep], dst[keep]), 1)
+
+def compute_day_matrix(network_id, day, station_ids, lookup):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    trips = (
+        Ticket.objects
+        .filter(network_id=network_id, entry_time__gte=start, entry_time__lt=start + timedelta(days=1))
+        .annotate(hour=ExtractHour('entry_time'))
+        .values_list('source_id', 'destination_id', 'hour')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    matrix = np.zeros((24, len(station_ids), len(station_ids)), dtype=np.int32)
+    chunk = []
+    for row in trips:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            _accumulate(matrix, lookup, chunk)
+            chunk = []
+    if chunk:
+        _accumulate(matrix, lookup, chunk)
+    return matrix
+
+def day_matrix(network_id, day, station_ids, lookup):
+    # Cached per day together with the station ids it was indexed by, so a
+    # network change simply invalidates the entry.
+    key = f"od:{network_id}:{day.isoformat()}"
+    cached = cache.get(key)
+    if cached is not None:
+        ids_bytes, matrix_bytes = cached
+        if ids_bytes == station_ids.tobytes():
+            return np.load(io.BytesIO(matrix_bytes))
+
+    matrix = compute_day_matrix(network_id, day, station_ids, lookup)
+    buffer = io.BytesIO()
+    np.save(buffer, matrix)
+    ttl = TODAY_TTL if day >= timezone.localdate() else PAST_DAY_TTL
+    cache.set(key, (station_ids.tobytes(), buffer.getvalue()), timeout=ttl)
+    return matrix
+
+def od_matrix(network_id, start_day, end_day, day_type='all', hours=range(24)):
+    station_ids, lookup = station_index(network_id)
+    weekdays = DAY_TYPES[day_type]
+    hours = list(hours)
+
+    total = np.zeros((len(station_ids), len(station_ids)), dtype=np.int64)
+    day = start_day
+    while day <= end_day:
+        if day.weekday() in weekdays:
+            total += day_matrix(network_id, day, station_ids, lookup)[hours].sum(axis=0)
+        day += timedelta(days=1)
+    return station_ids, total
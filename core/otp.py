@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.cache import caches
+from .utils import generate_otp
+
+OTP_TTL_SECONDS = getattr(settings, 'OTP_TTL_SECONDS', 300)
+OTP_MAX_ATTEMPTS = getattr(settings, 'OTP_MAX_ATTEMPTS', 5)
+
+# Outcomes of check_otp()
+OTP_OK = 'ok'
+OTP_INVALID = 'invalid'
+OTP_EXPIRED = 'expired'
+OTP_LOCKED = 'locked'
+
+
+def _cache():
+    return caches[getattr(settings, 'OTP_CACHE_ALIAS', 'default')]
+
+def _keys(user_id):
+    return f"otp:{user_id}", f"otp:{user_id}:attempts"
+
+def issue_otp(user_id, ticket_data):
+    # A new OTP replaces any pending one and resets the attempt counter.
+    otp = generate_otp()
+    data_key, attempts_key = _keys(user_id)
+    _cache().set_many({
+        data_key: {'otp': otp, 'ticket_data': ticket_data},
+        attempts_key: 0,
+    }, timeout=OTP_TTL_SECONDS)
+    return otp
+
+def check_otp(user_id, entered_otp):
+    cache = _cache()
+    data_key, attempts_key = _keys(user_id)
+
+    pending = cache.get(data_key)
+    if pending is None:
+        return OTP_EXPIRED, None
+
+    try:
+        attempts = cache.incr(attempts_key)
+    except ValueError:
+        # Counter evicted before the OTP itself; start counting again.
+        cache.set(attempts_key, 1, timeout=OTP_TTL_SECONDS)
+        attempts = 1
+
+    if attempts > OTP_MAX_ATTEMPTS:
+        clear_otp(user_id)
+        return OTP_LOCKED, None
+
+    if entered_otp != pending['otp']:
+        return OTP_INVALID, None
+
+    # Only the request that actually removes the entry may book the ticket.
+    if not cache.delete(data_key):
+        return OTP_EXPIRED, None
+    cache.delete(attempts_key)
+    return OTP_OK, pending['ticket_data']
+
+def clear_otp(user_id):
+    _cache().delete_many(_keys(user_id))
@@ -0,0 +1,202 @@
+from datetime import datetime, timezone as dt_timezone
+from django.db import connection, transaction
+
+# Monthly RANGE partitioning of core_ticket on created_at. Only PostgreSQL
+# supports it; on other backends Ticket stays a plain table and every helper
+# here is a no-op.
+
+TICKET_TABLE = 'core_ticket'
+DEFAULT_PARTITION = 'core_ticket_default'
+# A partitioned table can only enforce UNIQUE (ticket_id, created_at), so
+# triggers keep every ticket_id in this plain table, whose primary key makes
+# ticket_id unique across all partitions (see add_ticket_id_index).
+TICKET_ID_TABLE = 'core_ticket_id'
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TICKET_TABLE])
+        return cursor.fetchone() is not None
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+def partition_name(month):
+    return f"{TICKET_TABLE}_y{month.year}m{month.month:02d}"
+
+def partition_exists(month):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [partition_name(month)])
+        return cursor.fetchone()[0]
+
+def _create_partition(cursor, month):
+    name = partition_name(month)
+    start, end = month, add_months(month, 1)
+
+    cursor.execute("SELECT count(*) FROM " + DEFAULT_PARTITION + " WHERE created_at >= %s AND created_at < %s", [start, end])
+    stray_rows = cursor.fetchone()[0]
+
+    if not stray_rows:
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF {TICKET_TABLE} FOR VALUES FROM (%s) TO (%s)", [start, end]
+        )
+        return
+
+    # Rows for this month already landed in the default partition; move them
+    # out while it is detached so the new range does not overlap. Their ids
+    # are registered again by the insert trigger.
+    cursor.execute(f"ALTER TABLE {TICKET_TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+    if _has_ticket_id_index(cursor):
+        cursor.execute(
+            f"DELETE FROM {TICKET_ID_TABLE} WHERE ticket_id IN "
+            f"(SELECT ticket_id FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s)",
+            [start, end],
+        )
+    cursor.execute(f"CREATE TABLE {name} PARTITION OF {TICKET_TABLE} FOR VALUES FROM (%s) TO (%s)", [start, end])
+    cursor.execute(
+        f"INSERT INTO {TICKET_TABLE} SELECT * FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s",
+        [start, end],
+    )
+    cursor.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s", [start, end])
+    cursor.execute(f"ALTER TABLE {TICKET_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+
+def ensure_partitions(start, months_ahead=3):
+    if not is_partitioned():
+        return []
+
+    created = []
+    last = add_months(month_start(datetime.now(dt_timezone.utc)), months_ahead)
+    month = month_start(start)
+    with transaction.atomic(), connection.cursor() as cursor:
+        while month <= last:
+            if not partition_exists(month):
+                _create_partition(cursor, month)
+                created.append(partition_name(month))
+            month = add_months(month, 1)
+    return created
+
+def drop_partition(month):
+    # Returns False when the month has no partition of its own (its rows, if
+    # any, live in the default partition and must be deleted instead).
+    if not is_partitioned() or not partition_exists(month):
+        return False
+    name = partition_name(month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {TICKET_TABLE} DETACH PARTITION {name}")
+        # Dropping a table fires no delete triggers.
+        if _has_ticket_id_index(cursor):
+            cursor.execute(f"DELETE FROM {TICKET_ID_TABLE} WHERE ticket_id IN (SELECT ticket_id FROM {name})")
+        cursor.execute(f"DROP TABLE {name}")
+    return True
+
+def _has_ticket_id_index(cursor):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [TICKET_ID_TABLE])
+    return cursor.fetchone()[0]
+
+def add_ticket_id_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {TICKET_ID_TABLE} (ticket_id uuid PRIMARY KEY)")
+        # Fails the migration if duplicates already slipped in.
+        cursor.execute(f"INSERT INTO {TICKET_ID_TABLE} SELECT ticket_id FROM {TICKET_TABLE}")
+        cursor.execute(f"""
+            CREATE FUNCTION {TICKET_ID_TABLE}_sync() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    INSERT INTO {TICKET_ID_TABLE} (ticket_id) VALUES (NEW.ticket_id);
+                ELSE
+                    DELETE FROM {TICKET_ID_TABLE} WHERE ticket_id = OLD.ticket_id;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        # Row triggers on the partitioned table are cloned to every partition,
+        # so COPY and bulk inserts are covered as well.
+        cursor.execute(
+            f"CREATE TRIGGER {TICKET_ID_TABLE}_sync AFTER INSERT OR DELETE ON {TICKET_TABLE} "
+            f"FOR EACH ROW EXECUTE FUNCTION {TICKET_ID_TABLE}_sync()"
+        )
+
+def drop_ticket_id_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {TICKET_ID_TABLE}_sync ON {TICKET_TABLE}")
+        cursor.execute(f"DROP FUNCTION IF EXISTS {TICKET_ID_TABLE}_sync()")
+        cursor.execute(f"DROP TABLE IF EXISTS {TICKET_ID_TABLE}")
+
+
+def _add_foreign_keys(cursor):
+    # Index names are global to the schema, so this runs only once the old
+    # copy of the table (which owns the previous indexes) has been dropped.
+    for column, target in (('user_id', 'core_user'), ('source_id', 'core_station'), ('destination_id', 'core_station')):
+        cursor.execute(
+            f"ALTER TABLE {TICKET_TABLE} ADD CONSTRAINT {TICKET_TABLE}_{column}_fk "
+            f"FOREIGN KEY ({column}) REFERENCES {target} (id) DEFERRABLE INITIALLY DEFERRED"
+        )
+        cursor.execute(f"CREATE INDEX {TICKET_TABLE}_{column}_idx ON {TICKET_TABLE} ({column})")
+
+def partition_ticket_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    old = f"{TICKET_TABLE}_unpartitioned"
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {TICKET_TABLE} RENAME TO {old}")
+        cursor.execute(f"CREATE TABLE {TICKET_TABLE} (LIKE {old}) PARTITION BY RANGE (created_at)")
+
+        # The partition key has to be part of every unique constraint.
+        cursor.execute(f"ALTER TABLE {TICKET_TABLE} ADD CONSTRAINT core_ticket_partitioned_pkey PRIMARY KEY (id, created_at)")
+        cursor.execute(f"ALTER TABLE {TICKET_TABLE} ADD CONSTRAINT core_ticket_ticket_id_uniq UNIQUE (ticket_id, created_at)")
+
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TICKET_TABLE} DEFAULT")
+
+        cursor.execute(f"SELECT min(created_at) FROM {old}")
+        first = cursor.fetchone()[0] or datetime.now(dt_timezone.utc)
+        last = add_months(month_start(datetime.now(dt_timezone.utc)), 3)
+        month = month_start(first)
+        while month <= last:
+            cursor.execute(
+                f"CREATE TABLE {partition_name(month)} PARTITION OF {TICKET_TABLE} FOR VALUES FROM (%s) TO (%s)",
+                [month, add_months(month, 1)],
+            )
+            month = add_months(month, 1)
+
+        cursor.execute(f"INSERT INTO {TICKET_TABLE} SELECT * FROM {old}")
+        cursor.execute(f"SELECT COALESCE(max(id), 0) + 1 FROM {old}")
+        next_id = cursor.fetchone()[0]
+        cursor.execute(f"DROP TABLE {old}")
+        _add_foreign_keys(cursor)
+
+        # Identity columns are not supported on partitioned tables before
+        # PostgreSQL 17, so ids come from an owned sequence instead. It is
+        # created after the drop because the old identity sequence has the
+        # same name.
+        cursor.execute(f"CREATE SEQUENCE {TICKET_TABLE}_id_seq OWNED BY {TICKET_TABLE}.id")
+        cursor.execute(f"ALTER TABLE {TICKET_TABLE} ALTER COLUMN id SET DEFAULT nextval('{TICKET_TABLE}_id_seq')")
+        cursor.execute(f"SELECT setval('{TICKET_TABLE}_id_seq', %s, false)", [next_id])
+
+def unpartition_ticket_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    old = f"{TICKET_TABLE}_partitioned"
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {TICKET_TABLE} RENAME TO {old}")
+        cursor.execute(f"CREATE TABLE {TICKET_TABLE} (LIKE {old} INCLUDING DEFAULTS)")
+        cursor.execute(f"ALTER TABLE {TICKET_TABLE} ADD PRIMARY KEY (id)")
+        cursor.execute(f"ALTER TABLE {TICKET_TABLE} ADD CONSTRAINT core_ticket_ticket_id_key UNIQUE (ticket_id)")
+        cursor.execute(f"INSERT INTO {TICKET_TABLE} SELECT * FROM {old}")
+        cursor.execute(f"ALTER SEQUENCE {TICKET_TABLE}_id_seq OWNED BY {TICKET_TABLE}.id")
+        cursor.execute(f"DROP TABLE {old} CASCADE")
+        _add_foreign_keys(cursor)
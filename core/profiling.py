@@ -0,0 +1,163 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+# Opt-in per-request profiling. Staff add `?_profile=1` or an `X-Profile: 1`
+# header; PROFILE_SAMPLE_RATE additionally profiles that share of all
+# requests. Each profiled request leaves a JSON report (cProfile summary and
+# SQL with timings) plus the raw .prof in PROFILE_DIR, which keeps only the
+# newest PROFILE_MAX_REPORTS. Browse them at /admin/profiles/.
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+REPORT_NAME = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$')
+
+
+def _profile_dir():
+    return getattr(settings, 'PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+
+def _wanted(request):
+    flag = request.GET.get(PROFILE_PARAM) or request.headers.get(PROFILE_HEADER)
+    if flag and flag != '0' and getattr(request, 'user', None) and request.user.is_staff:
+        return True
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+
+class QueryLog:
+    def __init__(self, limit):
+        self.limit = limit
+        self.queries = []
+        self.count = 0
+        self.total = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.count += 1
+            self.total += elapsed
+            if len(self.queries) < self.limit:
+                # Statements only; parameters may hold personal data.
+                self.queries.append({'alias': context['connection'].alias, 'ms': round(elapsed, 3), 'sql': sql})
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _wanted(request):
+            return self.get_response(request)
+
+        log = QueryLog(getattr(settings, 'PROFILE_MAX_QUERIES', 500))
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in settings.DATABASES:
+                stack.enter_context(connections[alias].execute_wrapper(log))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = (time.perf_counter() - started) * 1000
+
+        name = save_report(request, response, profiler, log, duration)
+        response['X-Profile-Report'] = name
+        return response
+
+
+def save_report(request, response, profiler, log, duration):
+    directory = _profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    name = f"{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+    stats_text = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stats_text)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(60)
+
+    user = getattr(request, 'user', None)
+    report = {
+        'name': name,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'user': user.get_username() if user is not None and user.is_authenticated else None,
+        'status': response.status_code,
+        'created': timezone.now().isoformat(),
+        'duration_ms': round(duration, 2),
+        'sql_count': log.count,
+        'sql_ms': round(log.total, 2),
+        'queries': log.queries,
+        'stats': stats_text.getvalue(),
+    }
+    profiler.dump_stats(os.path.join(directory, f'{name}.prof'))
+    with open(os.path.join(directory, f'{name}.json'), 'w') as f:
+        json.dump(report, f)
+
+    _prune(directory)
+    return name
+
+def _report_names(directory):
+    # Oldest first. Names only resolve to the second, so several reports
+    # written within one second are ordered by modification time.
+    names = []
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json') or not REPORT_NAME.match(filename[:-5]):
+            continue
+        try:
+            names.append((os.stat(os.path.join(directory, filename)).st_mtime_ns, filename[:-5]))
+        except FileNotFoundError:
+            pass
+    return [name for _, name in sorted(names)]
+
+def _prune(directory):
+    keep = getattr(settings, 'PROFILE_MAX_REPORTS', 50)
+    names = _report_names(directory)
+    for old in names[:-keep] if keep else names:
+        for ext in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, old + ext))
+            except FileNotFoundError:
+                pass
+
+def list_reports():
+    directory = _profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    reports = []
+    for name in reversed(_report_names(directory)):
+        report = load_report(name)
+        if report:
+            report.pop('queries', None)
+            report.pop('stats', None)
+            reports.append(report)
+    return reports
+
+def report_path(name, ext):
+    if not REPORT_NAME.match(name):
+        return None
+    path = os.path.join(_profile_dir(), name + ext)
+    return path if os.path.exists(path) else None
+
+def load_report(name):
+    path = report_path(name, '.json')
+    if path is None:
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,22 @@
+import io
+import qrcode
+from qrcode.image.svg import SvgPathImage
+from django.core.cache import cache
+
+# A ticket's QR code only encodes its ticket_id, so each image is rendered
+# once and then served from the cache (and the browser's cache). Callers
+# check that the ticket exists first (see views.ticket_qr).
+
+QR_CACHE_TTL = 60 * 60 * 24 * 30
+
+
+def ticket_qr_svg(ticket_id):
+    key = f"qr:{ticket_id}"
+    svg = cache.get(key)
+    if svg is None:
+        image = qrcode.make(str(ticket_id), image_factory=SvgPathImage, border=2)
+        buffer = io.BytesIO()
+        image.save(buffer)
+        svg = buffer.getvalue()
+        cache.set(key, svg, timeout=QR_CACHE_TTL)
+    return svg
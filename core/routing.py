@@ -0,0 +1,132 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+from .network import closures_between, get_route_graph, memo_expired, network_version
+
+# Ranked alternative routes (Yen's k-shortest loopless paths). Routes are
+# ordered by number of stops, then by number of transfers, so the first one
+# always has the same length (and fare) as find_shortest_path().
+
+ALTERNATIVE_ROUTES = 3
+ROUTE_CACHE_SIZE = 2048
+
+# network_id -> {'version': ..., 'since': monotonic time, 'entries': OrderedDict()}
+# Shared by a worker's threads; every access holds _route_lock.
+_route_cache = {}
+_route_lock = threading.Lock()
+
+
+def _cost(lines):
+    transfers = sum(1 for a, b in zip(lines, lines[1:]) if a != b)
+    return len(lines), transfers
+
+def _best_path(graph, source, target, arrival_line=None, banned_nodes=(), banned_edges=()):
+    # Dijkstra over (station, line) states with cost (stops, transfers).
+    tie = count()
+    heap = [((0, 0), next(tie), source, arrival_line, [source], [])]
+    done = set()
+    while heap:
+        (stops, transfers), _, node, line, path, lines = heapq.heappop(heap)
+        if node == target:
+            return path, lines
+        if (node, line) in done:
+            continue
+        done.add((node, line))
+        for neighbor, next_line in graph.get(node, []):
+            if neighbor in banned_nodes or neighbor in path or (node, neighbor, next_line) in banned_edges:
+                continue
+            changed = line is not None and next_line != line
+            heapq.heappush(heap, (
+                (stops + 1, transfers + changed), next(tie), neighbor, next_line,
+                path + [neighbor], lines + [next_line],
+            ))
+    return None
+
+def k_shortest_paths(graph, source, target, k):
+    if source == target or source not in graph or target not in graph:
+        return []
+    first = _best_path(graph, source, target)
+    if first is None:
+        return []
+
+    found = [first]
+    seen = {(tuple(first[0]), tuple(first[1]))}
+    candidates = []
+    tie = count()
+    while len(found) < k:
+        path, lines = found[-1]
+        for i in range(len(path) - 1):
+            root_path, root_lines = path[:i + 1], lines[:i]
+            banned_edges = {
+                (p[i], p[i + 1], l[i])
+                for p, l in found
+                if p[:i + 1] == root_path and l[:i] == root_lines
+            }
+            spur = _best_path(
+                graph, path[i], target,
+                arrival_line=root_lines[-1] if root_lines else None,
+                banned_nodes=set(root_path[:-1]),
+                banned_edges=banned_edges,
+            )
+            if spur is None:
+                continue
+            candidate = (root_path + spur[0][1:], root_lines + spur[1])
+            key = (tuple(candidate[0]), tuple(candidate[1]))
+            if key not in seen:
+                seen.add(key)
+                heapq.heappush(candidates, (_cost(candidate[1]), next(tie), candidate))
+        if not candidates:
+            break
+        found.append(heapq.heappop(candidates)[2])
+    return found
+
+def _current_routes(network_id):
+    # Closing a line or station only removes options, so routes that did not
+    # use it are still the best ones and stay cached. Any other network edit
+    # empties that network's cache. Call with _route_lock held.
+    state = _route_cache.setdefault(network_id, {'version': None, 'since': 0, 'entries': OrderedDict()})
+    entries = state['entries']
+    version = network_version(network_id)
+    if state['version'] == version and not memo_expired(state['since']):
+        return entries
+
+    closed = closures_between(network_id, state['version'], version)
+    if closed is None or state['version'] == version:
+        entries.clear()
+    else:
+        lines, stations = closed
+        for key, routes in list(entries.items()):
+            if any(lines.intersection(route['lines']) or stations.intersection(route['path']) for route in routes):
+                entries.pop(key, None)
+    state['version'] = version
+    state['since'] = time.monotonic()
+    return entries
+
+def alternative_routes(network_id, source_name, target_name, k=ALTERNATIVE_ROUTES):
+    # LRU per network and (source, target, k), kept in step with the network
+    # by _current_routes(). The search itself runs without the lock.
+    key = (source_name, target_name, k)
+    with _route_lock:
+        cache = _current_routes(network_id)
+        version = _route_cache[network_id]['version']
+        routes = cache.get(key)
+        if routes is not None:
+            cache.move_to_end(key)
+            return routes
+
+    routes = []
+    for path, lines in k_shortest_paths(get_route_graph(network_id), source_name, target_name, k):
+        stops, transfers = _cost(lines)
+        routes.append({'path': path, 'lines': lines, 'stops': stops, 'transfers': transfers})
+
+    with _route_lock:
+        cache = _current_routes(network_id)
+        # Not cached if the network changed while searching.
+        if _route_cache[network_id]['version'] != version:
+            return routes
+        cache[key] = routes
+        while len(cache) > ROUTE_CACHE_SIZE:
+            cache.popitem(last=False)
+    return routes
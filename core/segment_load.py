@@ -0,0 +1,87 @@
+import numpy as np
+from django.db import transaction
+from django.db.models.functions import Now
+from .models import MetroLine, Network, SegmentLoad, Station, StationOnLine, Ticket
+from .network import get_route_graph
+from .utils import encode_route, find_shortest_path
+
+CHUNK_SIZE = 20_000
+
+
+def segment_keys():
+    # Every directed (line, from, to) hop of the network, encoded as one int64
+    # so a chunk of routes can be matched with a single searchsorted().
+    stride = (Station.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+    by_line = {}
+    for line_id, station_id in StationOnLine.objects.order_by('line_id', 'order').values_list('line_id', 'station_id'):
+        by_line.setdefault(line_id, []).append(station_id)
+
+    segments = []
+    for line_id, stations in by_line.items():
+        for a, b in zip(stations, stations[1:]):
+            segments.append((line_id, a, b))
+            segments.append((line_id, b, a))
+
+    keys = np.array([(line_id * stride + a) * stride + b for line_id, a, b in segments], dtype=np.int64)
+    order = np.argsort(keys)
+    return stride, keys[order], [segments[i] for i in order]
+
+def _count_chunk(routes, stride, keys, counts):
+    lines, frm, to = [], [], []
+    for route in routes:
+        stations, route_lines = route.get('stations') or [], route.get('lines') or []
+        if len(route_lines) != len(stations) - 1:
+            continue
+        lines.extend(route_lines)
+        frm.extend(stations[:-1])
+        to.extend(stations[1:])
+    if not lines:
+        return
+
+    hop_keys = (np.asarray(lines, dtype=np.int64) * stride + np.asarray(frm, dtype=np.int64)) * stride + np.asarray(to, dtype=np.int64)
+    idx = np.minimum(np.searchsorted(keys, hop_keys), len(keys) - 1)
+    # Hops over segments that no longer exist are dropped.
+    known = keys[idx] == hop_keys
+    counts += np.bincount(idx[known], minlength=len(keys))
+
+def backfill_routes():
+    # Tickets sold before Ticket.route existed: one route search per OD pair.
+    updated = 0
+    for network in Network.objects.all():
+        missing = Ticket.objects.filter(network=network, status='USED', route__isnull=True)
+        pairs = missing.values_list('source_id', 'destination_id').order_by().distinct()
+        names = dict(Station.objects.filter(network=network).values_list('id', 'name'))
+        station_ids = {name: station_id for station_id, name in names.items()}
+        line_ids = dict(MetroLine.objects.filter(network=network).values_list('name', 'id'))
+        graph = get_route_graph(network.id)
+
+        for source_id, destination_id in pairs:
+            path, lines, _ = find_shortest_path(names[source_id], names[destination_id], graph=graph)
+            route = encode_route(path, lines, network.id, station_ids, line_ids)
+            if route:
+                updated += missing.filter(source_id=source_id, destination_id=destination_id).update(route=route, updated_at=Now())
+    return updated
+
+def rebuild_segment_load():
+    stride, keys, segments = segment_keys()
+    counts = np.zeros(len(keys), dtype=np.int64)
+
+    if len(keys):
+        routes = Ticket.objects.filter(status='USED', route__isnull=False).values_list('route', flat=True)
+        chunk = []
+        for route in routes.iterator(chunk_size=CHUNK_SIZE):
+            chunk.append(route)
+            if len(chunk) == CHUNK_SIZE:
+                _count_chunk(chunk, stride, keys, counts)
+                chunk = []
+        if chunk:
+            _count_chunk(chunk, stride, keys, counts)
+
+    with transaction.atomic():
+        SegmentLoad.objects.all().delete()
+        SegmentLoad.objects.bulk_create([
+            SegmentLoad(line_id=line_id, from_station_id=a, to_station_id=b, trips=int(trips))
+            for (line_id, a, b), trips in zip(segments, counts)
+            if trips
+        ], batch_size=1000)
+    return int(counts.sum())
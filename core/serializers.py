@@ -2,6 +2,19 @@ from rest_framework import serializers
 from .models import Ticket
 
 class TicketSerializer(serializers.ModelSerializer):
+    source_name = serializers.CharField(source='source.name', read_only=True)
+    destination_name = serializers.CharField(source='destination.name', read_only=True)
+
     class Meta:
         model = Ticket
-        fields = ['ticket_id', 'source', 'destination', 'price', 'status', 'entry_time', 'exit_time']
\ No newline at end of file
+        fields = [
+            'ticket_id', 'source', 'source_name', 'destination', 'destination_name', 'price', 'status',
+            'route_info', 'created_at', 'entry_time', 'exit_time', 'updated_at',
+        ]
+
+    def __init__(self, *args, fields=None, **kwargs):
+        # Sparse fieldsets: TicketSerializer(..., fields=['ticket_id', 'status'])
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
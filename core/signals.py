@@ -0,0 +1,46 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Network, MetroLine, Station, StationOnLine, SystemSettings
+from .layout import schedule_layout
+from .network import invalidate_network, invalidate_networks, invalidate_settings
+
+def _closed_name(sender, instance):
+    # The name of a line/station whose save does nothing but close it.
+    if instance.pk is None or instance.is_active:
+        return None
+    old = sender.objects.filter(pk=instance.pk).first()
+    if old is None or not old.is_active:
+        return None
+    for field in sender._meta.concrete_fields:
+        if field.name != 'is_active' and getattr(old, field.attname) != getattr(instance, field.attname):
+            return None
+    return old.name
+
+@receiver(pre_save, sender=MetroLine)
+@receiver(pre_save, sender=Station)
+def remember_closure(sender, instance, **kwargs):
+    instance._closed_name = _closed_name(sender, instance)
+
+@receiver([post_save, post_delete], sender=MetroLine)
+@receiver([post_save, post_delete], sender=Station)
+@receiver([post_save, post_delete], sender=StationOnLine)
+def network_changed(sender, instance=None, signal=None, **kwargs):
+    # Only the network the object belongs to is invalidated.
+    network_id = instance.line.network_id if sender is StationOnLine else instance.network_id
+    closed_name = getattr(instance, '_closed_name', None) if signal is post_save else None
+    if closed_name:
+        invalidate_network(network_id, closed={'lines' if sender is MetroLine else 'stations': [closed_name]})
+    else:
+        invalidate_network(network_id)
+        schedule_layout(network_id)
+
+@receiver([post_save, post_delete], sender=SystemSettings)
+def settings_changed(sender, instance=None, created=False, **kwargs):
+    # The row is created by get_system_settings() on first use, so nothing
+    # can have cached it before; bumping here would discard that first build.
+    if not created:
+        invalidate_settings(instance.network_id)
+
+@receiver([post_save, post_delete], sender=Network)
+def networks_changed(sender, **kwargs):
+    invalidate_networks()
@@ -1,3 +1,1329 @@
-from django.test import TestCase
+import atexit
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import uuid
+from datetime import datetime, time, timedelta
+from unittest import mock
+import numpy as np
+import qrcode
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase
+from django.utils import timezone
+from . import db_router, live, throttling, warmup
+from . import network as network_module
+from . import routing
+from . import views
+from .benchmarks import compare, run_benchmark, synthetic_network
+from .checks import shared_cache_for_workers
+from .idempotency import PENDING, _fingerprint
+from .forms import BulkTicketForm, LineStopsForm
+from .fraud import FareEvasionDetector, get_station_hops
+from .journey import plan_journeys
+from .log import JsonFormatter, QueueListenerHandler, RequestLogMiddleware, current_request_id
+from .layout import force_layout, get_map_data, update_layout
+from .otp import OTP_EXPIRED, OTP_INVALID, OTP_LOCKED, OTP_MAX_ATTEMPTS, OTP_OK, check_otp, issue_otp
+from .occupancy import occupancy_snapshot, reconcile_occupancy, record_entry, record_exit
+from .od_matrix import _accumulate, od_matrix, station_index
+from . import segment_load
+from .segment_load import backfill_routes, rebuild_segment_load
+from .models import FareIncident, MetroLine, Network, SegmentLoad, Station, StationOccupancy, StationOnLine, StationVisits, Ticket, TravelStats
+from .network import closures_between, get_route_graph, get_stations, get_system_settings, invalidate_network
+from . import travel_stats
+from .travel_stats import rebuild_travel_stats, stats_for
+from .warmup import warm_up
+from .utils import encode_route, find_shortest_path, issue_bulk_tickets, set_line_stops
 
-# Create your tests here.
+
+class SmallNetworkTestCase(TestCase):
+    # Red runs A-B-C-D-F slowly (10 min a stop); Blue (A-E) and Green (E-D)
+    # are 2 min a stop, so A to D is quicker with one change at E.
+    @classmethod
+    def setUpTestData(cls):
+        # Migrations create an empty default network.
+        Network.objects.all().delete()
+        cls.network = Network.objects.create(name='Test', slug='test', is_default=True)
+        cls.stations = {
+            name: Station.objects.create(network=cls.network, name=name)
+            for name in 'ABCDEF'
+        }
+        cls.add_line('Red', 'ABCDF', run_seconds=600)
+        cls.add_line('Blue', 'AE', run_seconds=120)
+        cls.add_line('Green', 'ED', run_seconds=120)
+
+    @classmethod
+    def add_line(cls, name, stops, run_seconds, **fields):
+        line = MetroLine.objects.create(network=cls.network, name=name, **fields)
+        for order, station in enumerate(stops, start=1):
+            StationOnLine.objects.create(line=line, station=cls.stations[station], order=order, run_seconds=run_seconds)
+        return line
+
+    def setUp(self):
+        # Memos and versions are per process and outlive each test's rollback.
+        cache.clear()
+        network_module._memo.clear()
+        routing._route_cache.clear()
+
+    def at(self, hour, minute, day=5):
+        return timezone.make_aware(datetime(2026, 1, day, hour, minute))
+
+    @classmethod
+    def make_user(cls, username, **fields):
+        return get_user_model().objects.create_user(username, f'{username}@example.com', 'pw', **fields)
+
+    def make_ticket(self, user, source='A', destination='D', **fields):
+        # created_at is auto_now_add, so it can only be set afterwards.
+        created_at = fields.pop('created_at', None)
+        ticket = Ticket.objects.create(
+            user=user, network=self.network, price=fields.pop('price', 8),
+            source=self.stations[source], destination=self.stations[destination], **fields
+        )
+        if created_at:
+            Ticket.objects.filter(pk=ticket.pk).update(created_at=created_at)
+            ticket.refresh_from_db()
+        return ticket
+
+
+class JourneyPlannerTests(SmallNetworkTestCase):
+    def plan(self, source, target, depart_at):
+        return plan_journeys(self.network.id, self.stations[source].id, self.stations[target].id, depart_at)
+
+    def test_pareto_set_by_transfers(self):
+        journeys = self.plan('A', 'D', self.at(8, 0))
+
+        self.assertEqual([journey['transfers'] for journey in journeys], [0, 1])
+        direct, changed = journeys
+        self.assertEqual([leg['line'] for leg in direct['legs']], ['Red'])
+        self.assertEqual(direct['arrival'], self.at(8, 30))
+        self.assertEqual([leg['line'] for leg in changed['legs']], ['Blue', 'Green'])
+        self.assertEqual(changed['arrival'], self.at(8, 7))
+
+    def test_slower_transfer_is_not_offered(self):
+        StationOnLine.objects.filter(line__name='Green').update(run_seconds=3600)
+        network_module.invalidate_network(self.network.id)
+
+        journeys = self.plan('A', 'D', self.at(8, 0))
+
+        self.assertEqual([journey['transfers'] for journey in journeys], [0])
+
+    def test_service_wraps_past_midnight(self):
+        # Trains leave until 00:30, counted in the previous day's service.
+        journeys = self.plan('A', 'D', self.at(0, 20, day=6))
+
+        self.assertEqual(journeys[0]['departure'], self.at(0, 20, day=6))
+        self.assertEqual(journeys[0]['arrival'], self.at(0, 50, day=6))
+
+    def test_waits_for_first_train_after_service_ends(self):
+        journeys = self.plan('A', 'D', self.at(1, 0, day=6))
+
+        # Default first_departure.
+        self.assertEqual(journeys[0]['departure'], self.at(5, 30, day=6))
+
+    def test_no_journey_to_itself(self):
+        self.assertEqual(self.plan('A', 'A', self.at(8, 0)), [])
+
+
+class AlternativeRoutesTests(SmallNetworkTestCase):
+    def test_first_path_has_bfs_stop_count(self):
+        graph = get_route_graph(self.network.id)
+        for source, target in (('A', 'D'), ('B', 'E'), ('F', 'A')):
+            paths = routing.k_shortest_paths(graph, source, target, 3)
+            _, _, stops = find_shortest_path(source, target, graph=graph)
+            self.assertEqual(len(paths[0][1]), stops)
+            self.assertEqual(len(paths), len({tuple(path) for path, _ in paths}))
+            for path, _ in paths:
+                self.assertEqual(len(path), len(set(path)))
+
+    def test_ranked_by_stops_then_transfers(self):
+        routes = routing.alternative_routes(self.network.id, 'A', 'D')
+
+        self.assertEqual([route['path'] for route in routes], [['A', 'E', 'D'], ['A', 'B', 'C', 'D']])
+        self.assertEqual([(route['stops'], route['transfers']) for route in routes], [(2, 1), (3, 0)])
+
+    def test_closure_evicts_only_routes_using_it(self):
+        routing.alternative_routes(self.network.id, 'A', 'D')
+        routing.alternative_routes(self.network.id, 'D', 'F')
+
+        station = self.stations['E']
+        station.is_active = False
+        station.save()
+
+        self.assertEqual(list(routing._current_routes(self.network.id)), [('D', 'F', routing.ALTERNATIVE_ROUTES)])
+        routes = routing.alternative_routes(self.network.id, 'A', 'D')
+        self.assertEqual([route['path'] for route in routes], [['A', 'B', 'C', 'D']])
+
+    def test_other_edits_empty_the_cache(self):
+        routing.alternative_routes(self.network.id, 'D', 'F')
+
+        self.add_line('Yellow', 'BF', run_seconds=120)
+
+        self.assertEqual(len(routing._current_routes(self.network.id)), 0)
+
+    def test_closure_scan_runs_once(self):
+        routing.alternative_routes(self.network.id, 'D', 'F')
+        station = self.stations['E']
+        station.is_active = False
+        station.save()
+
+        with mock.patch('core.routing.closures_between', wraps=routing.closures_between) as closures:
+            routing.alternative_routes(self.network.id, 'D', 'F')
+            routing.alternative_routes(self.network.id, 'D', 'F')
+        self.assertEqual(closures.call_count, 1)
+
+    def test_concurrent_lookups_keep_the_lru_bounded(self):
+        get_route_graph(self.network.id)
+        pairs = [(a, b) for a in 'ABCDEF' for b in 'ABCDEF' if a != b]
+        errors = []
+
+        def lookups():
+            try:
+                for _ in range(20):
+                    for source, target in pairs:
+                        routing.alternative_routes(self.network.id, source, target)
+            except Exception as e:
+                errors.append(e)
+
+        with mock.patch('core.routing.ROUTE_CACHE_SIZE', 5):
+            threads = [threading.Thread(target=lookups) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(routing._route_cache[self.network.id]['entries']), 5)
+
+
+class ArchiveTicketsTests(SmallNetworkTestCase):
+    def test_export_keeps_every_column(self):
+        user = self.make_user('alice')
+        old = self.make_ticket(user, status='USED', route=[[1, 2]], created_at=timezone.now() - timedelta(days=400))
+        recent = self.make_ticket(user, status='USED')
+
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('archive_tickets', output_dir=directory, stdout=io.StringIO())
+            name, = os.listdir(directory)
+            with gzip.open(os.path.join(directory, name), 'rt') as archive:
+                rows = [json.loads(line) for line in archive]
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['ticket_id'], str(old.ticket_id))
+        self.assertEqual(rows[0]['network_id'], self.network.id)
+        self.assertEqual(rows[0]['route'], [[1, 2]])
+        self.assertIn('updated_at', rows[0])
+        self.assertEqual(rows[0]['source__name'], 'A')
+        self.assertEqual(list(Ticket.objects.values_list('pk', flat=True)), [recent.pk])
+
+    def test_active_tickets_hold_back_their_month(self):
+        user = self.make_user('alice')
+        self.make_ticket(user, created_at=timezone.now() - timedelta(days=400))
+
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('archive_tickets', output_dir=directory, stdout=io.StringIO())
+            self.assertEqual(os.listdir(directory), [])
+        self.assertEqual(Ticket.objects.count(), 1)
+
+
+class BulkTicketTests(SmallNetworkTestCase):
+    def test_form_parses_csv_and_json(self):
+        csv_form = BulkTicketForm({'data': 'passenger,source,destination\nalice,A,D\n'})
+        json_form = BulkTicketForm({'data': '[{"passenger": "alice", "source": "A", "destination": "D"}]'})
+
+        for form in (csv_form, json_form):
+            self.assertTrue(form.is_valid(), form.errors)
+            self.assertEqual(form.cleaned_data['rows'], [{'passenger': 'alice', 'source': 'A', 'destination': 'D'}])
+
+    def test_form_rejects_non_utf8_upload(self):
+        upload = SimpleUploadedFile('list.csv', 'passenger,source,destination\nzoë,A,D\n'.encode('latin-1'))
+        form = BulkTicketForm({}, {'upload': upload})
+
+        self.assertFalse(form.is_valid())
+        self.assertIn('UTF-8', str(form.errors))
+
+    def test_issue_is_all_or_nothing(self):
+        self.make_user('alice')
+        rows = [
+            {'passenger': 'alice', 'source': 'A', 'destination': 'D'},
+            {'passenger': 'nobody', 'source': 'A', 'destination': 'Z'},
+        ]
+
+        tickets, errors = issue_bulk_tickets(rows, self.network)
+
+        self.assertEqual(tickets, [])
+        self.assertEqual(len(errors), 2)
+        self.assertFalse(Ticket.objects.exists())
+
+        tickets, errors = issue_bulk_tickets(rows[:1] * 2, self.network)
+        self.assertEqual(errors, [])
+        self.assertEqual(Ticket.objects.count(), 2)
+        self.assertEqual({ticket.price for ticket in tickets}, {6})
+
+
+class TicketQrTests(SmallNetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.make_user('alice')
+        self.ticket = self.make_ticket(self.alice)
+        self.url = f'/ticket/{self.ticket.ticket_id}/qr.svg'
+
+    def test_owner_gets_a_cached_image(self):
+        client = Client()
+        client.force_login(self.alice)
+
+        with mock.patch('core.qr.qrcode.make', wraps=qrcode.make) as make:
+            first = client.get(self.url)
+            second = client.get(self.url)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'image/svg+xml')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(make.call_count, 1)
+
+    def test_other_users_and_unknown_tickets_are_not_rendered(self):
+        client = Client()
+        client.force_login(self.make_user('mallory'))
+
+        with mock.patch('core.qr.qrcode.make') as make:
+            self.assertEqual(client.get(self.url).status_code, 404)
+            self.assertEqual(client.get(f'/ticket/{uuid.uuid4()}/qr.svg').status_code, 404)
+        make.assert_not_called()
+        self.assertIsNone(cache.get(f'qr:{self.ticket.ticket_id}'))
+
+
+class NetworkTests(SmallNetworkTestCase):
+    def test_requests_pick_their_network(self):
+        other = Network.objects.create(name='Other', slug='other', domain='other.example.com')
+        client = Client()
+
+        self.assertEqual(client.get('/', HTTP_HOST='other.example.com').context['network'], other)
+        self.assertEqual(client.get('/', headers={'X-Network': 'other'}).context['network'], other)
+        self.assertEqual(client.get('/').context['network'], self.network)
+        client.get('/network/other/')
+        self.assertEqual(client.get('/').context['network'], other)
+
+    def test_edits_only_invalidate_their_network(self):
+        other = Network.objects.create(name='Other', slug='other')
+        before = network_module.network_version(self.network.id), network_module.network_version(other.id)
+
+        Station.objects.create(network=other, name='Z')
+
+        after = network_module.network_version(self.network.id), network_module.network_version(other.id)
+        self.assertEqual(after[0], before[0])
+        self.assertGreater(after[1], before[1])
+
+    def test_line_cannot_use_another_networks_station(self):
+        other = Network.objects.create(name='Other', slug='other')
+        line = MetroLine.objects.create(network=other, name='Purple')
+
+        with self.assertRaises(ValidationError):
+            StationOnLine(line=line, station=self.stations['A'], order=1).full_clean()
+        StationOnLine(line=line, station=Station.objects.create(network=other, name='Z'), order=1).full_clean()
+
+
+class NoNetworkTests(TestCase):
+    def setUp(self):
+        Network.objects.all().delete()
+        cache.clear()
+        network_module._memo.clear()
+
+    def test_pages_are_unavailable_until_a_network_exists(self):
+        client = Client()
+
+        self.assertEqual(client.get('/').status_code, 503)
+        self.assertEqual(client.get('/api/occupancy/').status_code, 503)
+        self.assertEqual(client.get('/admin/login/').status_code, 200)
+
+
+class OdMatrixTests(SmallNetworkTestCase):
+    def test_counts_trips_by_entry_hour(self):
+        user = self.make_user('alice')
+        day = timezone.localdate() - timedelta(days=3)
+        for hour, source, destination in ((8, 'A', 'D'), (8, 'A', 'D'), (9, 'A', 'D'), (17, 'D', 'A')):
+            entry = timezone.make_aware(datetime.combine(day, time(hour, 15)))
+            self.make_ticket(user, source, destination, status='USED', entry_time=entry)
+
+        ids, lookup = station_index(self.network.id)
+        index = {name: lookup[station.id] for name, station in self.stations.items()}
+
+        _, morning = od_matrix(self.network.id, day, day, hours=range(7, 10))
+        self.assertEqual(morning[index['A'], index['D']], 3)
+        self.assertEqual(morning.sum(), 3)
+        _, evening = od_matrix(self.network.id, day, day, hours=range(16, 20))
+        self.assertEqual(evening[index['D'], index['A']], 1)
+        self.assertEqual(evening.sum(), 1)
+
+    def test_stations_added_after_the_index_are_dropped(self):
+        ids, lookup = station_index(self.network.id)
+        matrix = np.zeros((24, len(ids), len(ids)), dtype=np.int32)
+        a, d = self.stations['A'].id, self.stations['D'].id
+
+        _accumulate(matrix, lookup, [(a, d, 8), (a, len(lookup) + 5, 8), (len(lookup), d, 9)])
+
+        self.assertEqual(matrix.sum(), 1)
+
+
+class TicketApiTests(SmallNetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.make_user('alice')
+        self.client.force_login(self.alice)
+
+    def get(self, **params):
+        return self.client.get('/api/tickets/', params)
+
+    def test_cursor_pages_cover_every_ticket_once(self):
+        tickets = [self.make_ticket(self.alice) for _ in range(5)]
+        self.make_ticket(self.make_user('bob'))
+
+        seen, url = [], '/api/tickets/?page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(row['ticket_id'] for row in page['results'])
+            url = page['next']
+
+        self.assertEqual(seen, [str(ticket.ticket_id) for ticket in reversed(tickets)])
+
+    def test_sparse_fields(self):
+        self.make_ticket(self.alice)
+
+        row, = self.get(fields='ticket_id,status').json()['results']
+        self.assertEqual(set(row), {'ticket_id', 'status'})
+        self.assertEqual(self.get(fields='ticket_id,password').status_code, 400)
+
+    def test_since_reports_changes_oldest_first(self):
+        first, second = self.make_ticket(self.alice), self.make_ticket(self.alice)
+        checkpoint = timezone.now()
+        Ticket.objects.filter(pk=first.pk).update(updated_at=checkpoint - timedelta(hours=1))
+        Ticket.objects.filter(pk=second.pk).update(updated_at=checkpoint - timedelta(hours=1))
+
+        second.status = 'CANCELLED'
+        second.save()
+        first.status = 'USED'
+        first.save()
+
+        rows = self.get(since=checkpoint.isoformat()).json()['results']
+        self.assertEqual([row['ticket_id'] for row in rows], [str(second.ticket_id), str(first.ticket_id)])
+        self.assertEqual(self.get(since='yesterday').status_code, 400)
+
+    def test_route_backfill_counts_as_a_change(self):
+        ticket = self.make_ticket(self.alice, status='USED')
+        Ticket.objects.filter(pk=ticket.pk).update(route=None, updated_at=timezone.now() - timedelta(days=1))
+        checkpoint = timezone.now() - timedelta(hours=1)
+
+        self.assertEqual(backfill_routes(), 1)
+
+        rows = self.get(since=checkpoint.isoformat()).json()['results']
+        self.assertEqual([row['ticket_id'] for row in rows], [str(ticket.ticket_id)])
+
+
+class OtpTests(SmallNetworkTestCase):
+    def test_otp_is_single_use(self):
+        otp = issue_otp(1, {'price': 6})
+
+        self.assertEqual(check_otp(1, otp), (OTP_OK, {'price': 6}))
+        self.assertEqual(check_otp(1, otp), (OTP_EXPIRED, None))
+
+    def test_attempts_are_limited(self):
+        otp = issue_otp(1, {'price': 6})
+        for _ in range(OTP_MAX_ATTEMPTS):
+            self.assertEqual(check_otp(1, 'wrong')[0], OTP_INVALID)
+
+        self.assertEqual(check_otp(1, otp)[0], OTP_LOCKED)
+        self.assertEqual(check_otp(1, otp)[0], OTP_EXPIRED)
+
+    def test_new_otp_replaces_the_pending_one(self):
+        old = issue_otp(1, {'price': 6})
+        check_otp(1, 'wrong')
+        new = issue_otp(1, {'price': 8})
+
+        if old != new:
+            self.assertEqual(check_otp(1, old)[0], OTP_INVALID)
+        self.assertEqual(check_otp(1, new), (OTP_OK, {'price': 8}))
+
+    def test_purchase_through_the_views(self):
+        alice = self.make_user('alice', balance=20)
+        self.client.force_login(alice)
+
+        self.client.post('/buy/', {'source': self.stations['A'].id, 'destination': self.stations['D'].id})
+        otp = mail.outbox[-1].body.split(': ')[1].split('.')[0]
+        response = self.client.post('/buy/verify/', {'otp': otp})
+
+        ticket = Ticket.objects.get(user=alice)
+        self.assertRedirects(response, f'/ticket/{ticket.ticket_id}/', fetch_redirect_response=False)
+        alice.refresh_from_db()
+        self.assertEqual(alice.balance, 20 - ticket.price)
+        self.client.post('/buy/verify/', {'otp': otp})
+        self.assertEqual(Ticket.objects.filter(user=alice).count(), 1)
+
+
+class LineStopsTests(SmallNetworkTestCase):
+    def stops(self, line):
+        return list(line.stationonline_set.order_by('order').values_list('station__name', 'order'))
+
+    def test_diff_adds_removes_and_renumbers(self):
+        line = MetroLine.objects.get(name='Red')
+        names = ['A', 'E', 'C', 'B']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = set_line_stops(line, [self.stations[name] for name in names])
+
+        # E added; D and F removed; only B moves (A and C keep 1 and 3).
+        self.assertEqual(counts, (1, 2, 1))
+        self.assertEqual(self.stops(line), [(name, order) for order, name in enumerate(names, start=1)])
+
+    def test_reorder_invalidates_the_network_after_commit(self):
+        # A pure reorder only touches bulk_update, which sends no signals.
+        line = MetroLine.objects.get(name='Red')
+        get_route_graph(self.network.id)
+        before = network_module.network_version(self.network.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(set_line_stops(line, [self.stations[name] for name in 'FDCBA']), (0, 0, 4))
+            self.assertEqual(network_module.network_version(self.network.id), before)
+
+        self.assertGreater(network_module.network_version(self.network.id), before)
+        self.assertEqual([name for name, _ in self.stops(line)], list('FDCBA'))
+
+    def test_form_checks_names_within_the_network(self):
+        other = Network.objects.create(name='Other', slug='other')
+        Station.objects.create(network=other, name='Z')
+
+        form = LineStopsForm({'stops': 'A\nB\n\nC'}, network=self.network)
+        self.assertTrue(form.is_valid())
+        self.assertEqual([station.name for station in form.cleaned_data['stops']], ['A', 'B', 'C'])
+        self.assertIn('Unknown stations: Z', str(LineStopsForm({'stops': 'A\nZ'}, network=self.network).errors))
+        self.assertIn('only appear once', str(LineStopsForm({'stops': 'A\nB\nA'}, network=self.network).errors))
+
+    def test_admin_edit_stops_page(self):
+        admin = get_user_model().objects.create_superuser('root', 'root@example.com', 'pw')
+        self.client.force_login(admin)
+        line = MetroLine.objects.get(name='Blue')
+        url = f'/admin/core/metroline/{line.id}/stops/'
+
+        self.assertContains(self.client.get(url), 'A\nE')
+        response = self.client.post(url, {'stops': 'A\nB\nE'})
+
+        self.assertRedirects(response, '/admin/core/metroline/')
+        self.assertEqual([name for name, _ in self.stops(line)], ['A', 'B', 'E'])
+
+
+class LiveGateTests(SmallNetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.make_user('alice')
+        self.ticket = self.make_ticket(self.alice)
+
+    def test_events_since_returns_newer_events_in_order(self):
+        start = live.current_seq()
+        live.publish_gate_event(self.ticket, 'entry')
+        live.publish_gate_event(self.ticket, 'exit', result='no_entry')
+
+        events = live.events_since(start)
+        self.assertEqual([(event['gate'], event['result']) for event in events], [('entry', 'ok'), ('exit', 'no_entry')])
+        self.assertEqual(live.events_since(events[-1]['seq']), [])
+
+    def test_ring_drops_overwritten_events(self):
+        with mock.patch.object(live, 'GATE_BUFFER_SIZE', 3):
+            for _ in range(5):
+                live.publish_gate_event(self.ticket, 'entry')
+            events = live.events_since(0)
+
+        self.assertEqual([event['seq'] for event in events], [3, 4, 5])
+
+    def test_only_opened_gates_count(self):
+        live.publish_gate_event(self.ticket, 'entry')
+        live.publish_gate_event(self.ticket, 'entry', result='double_entry')
+        live.publish_gate_event(self.ticket, 'exit')
+
+        counters = live.station_counters([self.ticket.source_id, self.ticket.destination_id])
+        self.assertEqual(counters[self.ticket.source_id], {'entries': 1, 'exits': 0})
+        self.assertEqual(counters[self.ticket.destination_id], {'entries': 0, 'exits': 1})
+
+    def test_stream_resumes_from_last_event_id(self):
+        admin = get_user_model().objects.create_superuser('root', 'root@example.com', 'pw')
+        self.client.force_login(admin)
+        live.publish_gate_event(self.ticket, 'entry')
+        seen = live.current_seq()
+        live.publish_gate_event(self.ticket, 'exit')
+
+        with mock.patch.object(views, 'LIVE_STREAM_SECONDS', 0.05), mock.patch.object(views, 'LIVE_POLL_SECONDS', 0.01):
+            response = self.client.get('/admin/live/stream/', HTTP_LAST_EVENT_ID=str(seen))
+            body = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(body.count('event: scan'), 1)
+        self.assertIn('"gate": "exit"', body)
+        self.assertIn('event: counters', body)
+
+    def test_stream_is_staff_only(self):
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get('/admin/live/stream/').status_code, 302)
+
+    def test_check_refuses_several_workers_on_a_per_process_cache(self):
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '4'}):
+            errors = shared_cache_for_workers(None)
+            self.assertEqual([error.id for error in errors], ['core.E001'])
+            with mock.patch.object(live.settings, 'CACHES', {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+                self.assertEqual(shared_cache_for_workers(None), [])
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '1'}):
+            self.assertEqual(shared_cache_for_workers(None), [])
+
+
+class OccupancyTests(SmallNetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.make_user('alice')
+
+    def inside(self, name):
+        return StationOccupancy.objects.get(station=self.stations[name]).inside
+
+    def test_scans_move_the_counter_of_the_entry_station(self):
+        ticket = self.make_ticket(self.alice, source='B', destination='D')
+        self.client.force_login(self.alice)
+
+        self.client.post('/api/scan/', {'ticket_id': str(ticket.ticket_id), 'gate_type': 'entry'})
+        self.assertEqual(self.inside('B'), 1)
+        self.client.post('/api/scan/', {'ticket_id': str(ticket.ticket_id), 'gate_type': 'exit'})
+        self.assertEqual(self.inside('B'), 0)
+        self.assertFalse(StationOccupancy.objects.filter(station=self.stations['D']).exists())
+
+    def test_bump_never_goes_below_zero(self):
+        ticket = self.make_ticket(self.alice)
+        record_exit(ticket)
+        record_exit(ticket)
+        self.assertEqual(self.inside('A'), 0)
+        record_entry(ticket)
+        self.assertEqual(self.inside('A'), 1)
+
+    def test_reconcile_counts_recent_unfinished_entries(self):
+        now = timezone.now()
+        self.make_ticket(self.alice, source='A', entry_time=now - timedelta(minutes=10))
+        self.make_ticket(self.alice, source='A', entry_time=now - timedelta(hours=5))
+        self.make_ticket(self.alice, source='C', entry_time=now - timedelta(minutes=5), exit_time=now)
+        StationOccupancy.objects.create(station=self.stations['C'], inside=7)
+
+        reconcile_occupancy()
+        self.assertEqual(self.inside('A'), 1)
+        self.assertEqual(self.inside('C'), 0)
+
+        reconcile_occupancy(reset=True)
+        self.assertEqual(self.inside('A'), 0)
+
+    def test_snapshot_counts_interchanges_on_every_line(self):
+        StationOccupancy.objects.create(station=self.stations['A'], inside=3)
+        StationOccupancy.objects.create(station=self.stations['E'], inside=2)
+
+        snapshot = occupancy_snapshot(self.network.id)
+        lines = {line['name']: line['inside'] for line in snapshot['lines']}
+        self.assertEqual(snapshot['total'], 5)
+        self.assertEqual(lines, {'Red': 3, 'Blue': 5, 'Green': 2})
+
+    def test_api_is_staff_only(self):
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get('/api/occupancy/').status_code, 403)
+        self.client.force_login(get_user_model().objects.create_superuser('root', 'root@example.com', 'pw'))
+        self.assertEqual(self.client.get('/api/occupancy/').json()['total'], 0)
+
+
+class SegmentLoadTests(SmallNetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.make_user('alice')
+
+    def loads(self):
+        return {
+            (row.line.name, row.from_station.name, row.to_station.name): row.trips
+            for row in SegmentLoad.objects.select_related('line', 'from_station', 'to_station')
+        }
+
+    def route(self, source, destination):
+        path, lines, _ = find_shortest_path(source, destination, graph=get_route_graph(self.network.id))
+        return encode_route(path, lines, self.network.id)
+
+    def test_counts_each_travelled_hop(self):
+        for _ in range(2):
+            self.make_ticket(self.alice, 'A', 'D', status='USED', route=self.route('A', 'D'))
+        self.make_ticket(self.alice, 'C', 'B', status='USED', route=self.route('C', 'B'))
+        self.make_ticket(self.alice, 'B', 'C', status='ACTIVE', route=self.route('B', 'C'))
+
+        self.assertEqual(rebuild_segment_load(), 5)
+        self.assertEqual(self.loads(), {('Blue', 'A', 'E'): 2, ('Green', 'E', 'D'): 2, ('Red', 'C', 'B'): 1})
+
+    def test_chunks_add_up(self):
+        for source, destination in [('A', 'D'), ('B', 'C'), ('D', 'A')]:
+            self.make_ticket(self.alice, source, destination, status='USED', route=self.route(source, destination))
+        rebuild_segment_load()
+        expected = self.loads()
+
+        with mock.patch.object(segment_load, 'CHUNK_SIZE', 1):
+            rebuild_segment_load()
+        self.assertEqual(self.loads(), expected)
+
+    def test_skips_hops_the_network_no_longer_has(self):
+        red = MetroLine.objects.get(name='Red')
+        ids = {name: station.id for name, station in self.stations.items()}
+        # A-C is not a Red segment; the second route is malformed.
+        self.make_ticket(self.alice, 'A', 'C', status='USED', route={'stations': [ids['A'], ids['C'], ids['D']], 'lines': [red.id, red.id]})
+        self.make_ticket(self.alice, 'A', 'B', status='USED', route={'stations': [ids['A'], ids['B']], 'lines': []})
+
+        self.assertEqual(rebuild_segment_load(), 1)
+        self.assertEqual(self.loads(), {('Red', 'C', 'D'): 1})
+
+    def test_command_backfills_missing_routes(self):
+        self.make_ticket(self.alice, 'A', 'D', status='USED')
+        out = io.StringIO()
+
+        call_command('compute_segment_load', '--backfill', stdout=out)
+
+        self.assertIn('Backfilled routes on 1 ticket(s).', out.getvalue())
+        self.assertEqual(self.loads(), {('Blue', 'A', 'E'): 1, ('Green', 'E', 'D'): 1})
+
+
+@mock.patch.object(db_router, 'replica_available', return_value=True)
+class ReplicaRouterTests(SmallNetworkTestCase):
+    router = db_router.ReplicaRouter()
+
+    def read_alias(self):
+        with db_router.replica_reads():
+            return self.router.db_for_read(Station)
+
+    def through_middleware(self, view, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        return db_router.ReplicaStickinessMiddleware(view)(request)
+
+    def test_only_replica_scopes_read_from_the_replica(self, available):
+        self.assertIsNone(self.router.db_for_read(Station))
+        self.assertEqual(self.read_alias(), 'replica')
+        with db_router.replica_reads(), db_router.primary_reads():
+            self.assertIsNone(self.router.db_for_read(Station))
+        self.assertEqual(self.router.db_for_write(Station), 'default')
+
+        available.return_value = False
+        self.assertIsNone(self.read_alias())
+
+    def test_a_write_pins_the_rest_of_the_request_and_the_client(self, available):
+        seen = []
+
+        def view(request):
+            seen.append(self.read_alias())
+            Station.objects.create(network=self.network, name='G')
+            seen.append(self.read_alias())
+            return HttpResponse()
+
+        response = self.through_middleware(view)
+
+        self.assertEqual(seen, ['replica', None])
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+
+    def test_reads_do_not_pin(self, available):
+        def view(request):
+            list(Station.objects.all())
+            Station.objects.get_or_create(network=self.network, name='A')
+            return HttpResponse()
+
+        self.assertNotIn(db_router.PIN_COOKIE, self.through_middleware(view).cookies)
+
+    def test_pin_cookie_keeps_reads_on_the_primary_until_it_expires(self, available):
+        seen = []
+
+        def view(request):
+            seen.append(self.read_alias())
+            return HttpResponse()
+
+        self.through_middleware(view, {db_router.PIN_COOKIE: str(timezone.now().timestamp() + 60)})
+        self.through_middleware(view, {db_router.PIN_COOKIE: str(timezone.now().timestamp() - 1)})
+        self.through_middleware(view, {db_router.PIN_COOKIE: 'garbage'})
+        self.assertEqual(seen, [None, 'replica', 'replica'])
+
+
+class WarmUpTests(SmallNetworkTestCase):
+    def test_warm_workers_serve_network_data_without_queries(self):
+        timings = warm_up()
+
+        self.assertIn('test route graph', timings)
+        self.assertIn('test network map', timings)
+        with self.assertNumQueries(0):
+            get_route_graph(self.network.id)
+            get_stations(self.network.id)
+            get_system_settings(self.network.id)
+
+    def test_a_failing_step_does_not_stop_the_rest(self):
+        def broken(network_id):
+            raise DatabaseError('replica down')
+
+        steps = (('broken', broken),) + warmup.NETWORK_STEPS
+        with mock.patch.object(warmup, 'NETWORK_STEPS', steps):
+            timings = warm_up()
+
+        self.assertNotIn('test broken', timings)
+        self.assertIn('test stations', timings)
+
+    def test_memo_rebuilds_after_its_network_changes(self):
+        other = Network.objects.create(name='Other', slug='other')
+        get_stations(self.network.id)
+
+        invalidate_network(other.id)
+        with self.assertNumQueries(0):
+            get_stations(self.network.id)
+
+        invalidate_network(self.network.id)
+        with self.assertNumQueries(1):
+            get_stations(self.network.id)
+
+    def test_per_process_memo_expires(self):
+        get_stations(self.network.id)
+        later = network_module.time.monotonic() + network_module.MEMO_TTL + 1
+
+        with mock.patch.object(network_module.time, 'monotonic', return_value=later), self.assertNumQueries(1):
+            get_stations(self.network.id)
+
+
+class DisruptionTests(SmallNetworkTestCase):
+    def close(self, obj):
+        obj.is_active = False
+        obj.save()
+
+    def shortest(self, source, target):
+        path, lines, _ = find_shortest_path(source, target, network_id=self.network.id)
+        return path, lines
+
+    def test_closed_line_is_left_out(self):
+        self.close(MetroLine.objects.get(name='Blue'))
+
+        self.assertEqual(self.shortest('A', 'D'), (['A', 'B', 'C', 'D'], ['Red'] * 3))
+        self.assertEqual(self.shortest('A', 'E'), (['A', 'B', 'C', 'D', 'E'], ['Red'] * 3 + ['Green']))
+
+    def test_closed_station_cannot_be_passed_through(self):
+        self.close(self.stations['C'])
+
+        graph = get_route_graph(self.network.id)
+        self.assertNotIn('C', graph)
+        self.assertEqual(graph['B'], [('A', 'Red')])
+        self.assertEqual(self.shortest('B', 'D'), (['B', 'A', 'E', 'D'], ['Red', 'Blue', 'Green']))
+
+    def test_reopening_restores_routes(self):
+        station = self.stations['E']
+        self.close(station)
+        self.assertEqual(self.shortest('A', 'D')[0], ['A', 'B', 'C', 'D'])
+
+        station.is_active = True
+        station.save()
+        self.assertEqual(self.shortest('A', 'D')[0], ['A', 'E', 'D'])
+
+    def test_closures_accumulate_between_versions(self):
+        before = network_module.network_version(self.network.id)
+        self.close(self.stations['C'])
+        self.close(MetroLine.objects.get(name='Green'))
+        after = network_module.network_version(self.network.id)
+
+        self.assertEqual(closures_between(self.network.id, before, after), ({'Green'}, {'C'}))
+
+        station = self.stations['B']
+        station.name = 'B2'
+        station.save()
+        self.assertIsNone(closures_between(self.network.id, before, network_module.network_version(self.network.id)))
+
+
+class MapLayoutTests(SmallNetworkTestCase):
+    def positions(self):
+        return {station.name: (station.map_x, station.map_y) for station in Station.objects.filter(network=self.network)}
+
+    def test_lays_out_once_per_topology(self):
+        self.assertTrue(update_layout(self.network.id))
+        positions = self.positions()
+        self.assertNotIn(None, [coordinate for position in positions.values() for coordinate in position])
+
+        self.assertFalse(update_layout(self.network.id))
+        # A forced run only nudges the existing layout.
+        self.assertTrue(update_layout(self.network.id, force=True))
+        for name, position in self.positions().items():
+            self.assertLess(np.linalg.norm(np.subtract(position, positions[name])), 10)
+
+    def test_edits_relayout_after_commit_seeded_by_old_positions(self):
+        update_layout(self.network.id)
+        before = self.positions()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_line('Yellow', 'BF', run_seconds=120)
+
+        after = self.positions()
+        self.assertNotEqual(after, before)
+        self.assertFalse(update_layout(self.network.id))
+
+    def test_map_data_carries_new_positions(self):
+        self.assertIsNone(json.loads(get_map_data(self.network.id))['nodes'][0]['x'])
+
+        update_layout(self.network.id)
+
+        nodes = {node['label']: (node['x'], node['y']) for node in json.loads(get_map_data(self.network.id))['nodes']}
+        self.assertEqual(nodes, self.positions())
+
+    def test_force_layout_scales_edges_to_length(self):
+        edges = [(0, 1), (1, 2), (2, 3), (3, 0)]
+        pos = force_layout(4, edges, edge_length=50)
+
+        lengths = [np.linalg.norm(pos[a] - pos[b]) for a, b in edges]
+        self.assertAlmostEqual(float(np.mean(lengths)), 50)
+        np.testing.assert_allclose(pos.mean(axis=0), 0, atol=1e-9)
+        np.testing.assert_array_equal(force_layout(4, edges, edge_length=50), pos)
+        self.assertEqual(force_layout(0, []).shape, (0, 2))
+
+    def test_command_reports_each_network(self):
+        out = io.StringIO()
+        call_command('compute_map_layout', stdout=out)
+        call_command('compute_map_layout', '--network', 'test', stdout=out)
+
+        self.assertEqual(out.getvalue().splitlines(), ['Test: map layout updated.', 'Test: map layout is up to date.'])
+
+
+class FareEvasionTests(SmallNetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.detector = FareEvasionDetector()
+        self.start = self.at(8, 0)
+
+    def scan(self, seconds, station, gate='entry', user_id=1, result='ok'):
+        return self.detector.feed({
+            'time': (self.start + timedelta(seconds=seconds)).isoformat(),
+            'gate': gate,
+            'network_id': self.network.id,
+            'station_id': self.stations[station].id,
+            'user_id': user_id,
+            'ticket_id': str(uuid.uuid4()),
+            'result': result,
+        })
+
+    def test_hops_follow_the_open_network(self):
+        hops = get_station_hops(self.network.id)
+        ids = {name: station.id for name, station in self.stations.items()}
+        self.assertEqual(hops[(ids['A'], ids['F'])], 3)
+        self.assertEqual(hops[(ids['B'], ids['E'])], 2)
+
+    def test_entries_too_far_apart_for_one_passenger(self):
+        # A to F is 3 stops, so at least 3 minutes.
+        self.assertEqual(self.scan(0, 'A'), [])
+        incident, = self.scan(120, 'F')
+        self.assertEqual((incident.kind, incident.user_id, incident.station_id), ('SHARING', 1, self.stations['F'].id))
+        self.assertEqual(len(incident.ticket_ids), 2)
+
+        self.assertEqual(self.scan(0, 'A', user_id=2), [])
+        self.assertEqual(self.scan(200, 'F', user_id=2), [])
+
+    def test_burst_of_entries_at_different_stations(self):
+        self.assertEqual(self.scan(0, 'A'), [])
+        self.assertEqual(self.scan(240, 'B'), [])
+        incident, = self.scan(480, 'C')
+        self.assertEqual(incident.kind, 'BURST')
+        self.assertEqual(len(incident.ticket_ids), 3)
+        # The window starts over after an incident.
+        self.assertEqual(self.scan(720, 'D'), [])
+
+    def test_refused_exits_at_one_station(self):
+        for second in range(4):
+            self.assertEqual(self.scan(second * 60, 'D', gate='exit', result='no_entry'), [])
+        self.assertEqual(self.scan(0, 'C', gate='exit', result='no_entry'), [])
+        self.assertEqual(self.scan(300, 'D', gate='exit'), [])
+        incident, = self.scan(360, 'D', gate='exit', result='no_entry')
+        self.assertEqual((incident.kind, incident.user_id, len(incident.ticket_ids)), ('NO_ENTRY', None, 5))
+
+    def test_refused_entries_are_ignored(self):
+        self.scan(0, 'A')
+        self.assertEqual(self.scan(60, 'F', result='double_entry'), [])
+
+    def test_command_needs_a_shared_cache(self):
+        with self.assertRaisesMessage(CommandError, 'per-process'):
+            call_command('detect_fare_evasion', '--once', stdout=io.StringIO())
+
+    @mock.patch('core.management.commands.detect_fare_evasion.is_shared', return_value=True)
+    def test_command_records_incidents_from_buffered_scans(self, shared):
+        user = self.make_user('alice')
+        for source in 'AF':
+            live.publish_gate_event(self.make_ticket(user, source=source), 'entry')
+        out = io.StringIO()
+
+        call_command('detect_fare_evasion', '--once', stdout=out)
+
+        self.assertEqual(list(FareIncident.objects.values_list('kind', 'user_id')), [('SHARING', user.id)])
+        self.assertIn('Entries too far apart', out.getvalue())
+
+
+class ProfilingTests(SmallNetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        override = self.settings(PROFILE_DIR=self.directory, PROFILE_SAMPLE_RATE=0.0)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.admin = get_user_model().objects.create_superuser('root', 'root@example.com', 'pw')
+
+    def reports(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_staff_opt_in_writes_a_report(self):
+        self.client.force_login(self.admin)
+
+        response = self.client.get('/', {'_profile': '1'})
+
+        name = response['X-Profile-Report']
+        self.assertEqual(self.reports(), [f'{name}.json', f'{name}.prof'])
+        with open(os.path.join(self.directory, f'{name}.json')) as f:
+            report = json.load(f)
+        self.assertEqual((report['path'], report['user'], report['status']), ('/?_profile=1', 'root', 200))
+        self.assertEqual(report['sql_count'], len(report['queries']))
+        self.assertEqual(set(report['queries'][0]), {'alias', 'ms', 'sql'})
+
+        self.assertNotIn('X-Profile-Report', self.client.get('/', HTTP_X_PROFILE='0'))
+        self.assertIn('X-Profile-Report', self.client.get('/', HTTP_X_PROFILE='1'))
+
+    def test_other_users_cannot_opt_in(self):
+        self.client.force_login(self.make_user('alice'))
+        self.assertNotIn('X-Profile-Report', self.client.get('/', {'_profile': '1'}))
+        self.assertEqual(self.reports(), [])
+
+    def test_sampling_and_pruning(self):
+        with self.settings(PROFILE_SAMPLE_RATE=1.0, PROFILE_MAX_REPORTS=2):
+            names = [self.client.get('/')['X-Profile-Report'] for _ in range(3)]
+
+        self.assertEqual(self.reports(), sorted(f'{name}{ext}' for name in names[1:] for ext in ('.json', '.prof')))
+
+    def test_admin_pages(self):
+        self.client.force_login(self.admin)
+        name = self.client.get('/', {'_profile': '1'})['X-Profile-Report']
+
+        self.assertContains(self.client.get('/admin/profiles/'), name)
+        self.assertContains(self.client.get(f'/admin/profiles/{name}/'), 'core_systemsettings')
+        download = self.client.get(f'/admin/profiles/{name}/', {'download': '1'})
+        self.assertEqual(download['Content-Disposition'], f'attachment; filename="{name}.prof"')
+        download.close()
+        self.assertEqual(self.client.get('/admin/profiles/..%2Fsettings/').status_code, 404)
+
+
+class RoutingBenchmarkTests(TestCase):
+    def test_synthetic_network_is_connected_and_reproducible(self):
+        rows = synthetic_network(200, 12, interchange=0.2, seed=3)
+
+        self.assertEqual(rows, synthetic_network(200, 12, interchange=0.2, seed=3))
+        self.assertNotEqual(rows, synthetic_network(200, 12, interchange=0.2, seed=4))
+        self.assertEqual(len({row[2] for row in rows}), 200)
+        self.assertEqual(len({row[0] for row in rows}), 12)
+        for line in {row[0] for row in rows}:
+            orders = sorted(row[1] for row in rows if row[0] == line)
+            self.assertEqual(orders, list(range(1, len(orders) + 1)))
+
+        result = run_benchmark(rows, queries=50, repeat_build=1)
+        self.assertEqual((result['stations'], result['queries'], result['routes_found']), (200, 50, 50))
+        self.assertEqual(set(result['find_shortest_path']), {'mean_us', 'p50_us', 'p95_us', 'p99_us', 'max_us'})
+
+    def test_compare_matches_sizes(self):
+        old = {'stations': 10, 'lines': 2, 'graph_build_ms': 2.0, 'graph_memory_kb': 4.0, 'throughput_qps': 100.0,
+               'find_shortest_path': {'p50_us': 10.0, 'p95_us': 20.0}}
+        new = dict(old, graph_build_ms=1.0, throughput_qps=200.0, find_shortest_path={'p50_us': 5.0, 'p95_us': 0})
+
+        change, = compare([new, dict(new, stations=20)], {'results': [old]})
+        self.assertEqual(change['graph_build'], 0.5)
+        self.assertEqual(change['throughput'], 0.5)
+        self.assertEqual(change['find_shortest_path_p50'], 0.5)
+        self.assertIsNone(change['find_shortest_path_p95'])
+
+    def test_command_writes_and_compares_results(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        first, second = os.path.join(directory.name, 'a.json'), os.path.join(directory.name, 'b.json')
+        options = {'sizes': '30,60', 'queries': 20, 'stdout': io.StringIO()}
+
+        call_command('benchmark_routing', output=first, **options)
+        call_command('benchmark_routing', output=second, baseline=first, **options)
+
+        with open(second) as f:
+            report = json.load(f)
+        self.assertEqual([result['stations'] for result in report['results']], [30, 60])
+        self.assertEqual([change['stations'] for change in report['changes']], [30, 60])
+        with self.assertRaisesMessage(CommandError, '--sizes'):
+            call_command('benchmark_routing', sizes='30,x', stdout=io.StringIO())
+
+
+class IdempotentScanTests(SmallNetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.make_user('alice')
+        self.ticket = self.make_ticket(self.alice)
+        self.client.force_login(self.alice)
+
+    def scan(self, gate='entry', key='k1', ticket=None, **extra):
+        data = {'ticket_id': str((ticket or self.ticket).ticket_id), 'gate_type': gate}
+        if key:
+            extra['HTTP_IDEMPOTENCY_KEY'] = key
+        return self.client.post('/api/scan/', data, **extra)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.scan()
+        seq = live.current_seq()
+        self.ticket.refresh_from_db()
+        entered = self.ticket.entry_time
+
+        retry = self.scan()
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replay'], 'true')
+        self.assertEqual(live.current_seq(), seq)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.entry_time, entered)
+
+        # A new key is a new scan.
+        self.assertEqual(self.scan(key='k2').status_code, 400)
+
+    def test_key_in_the_body(self):
+        data = {'ticket_id': str(self.ticket.ticket_id), 'gate_type': 'entry', 'idempotency_key': 'k1'}
+        self.client.post('/api/scan/', data)
+        self.assertEqual(self.client.post('/api/scan/', data)['Idempotent-Replay'], 'true')
+
+    def test_reused_key_with_another_request_is_refused(self):
+        self.scan()
+        self.assertEqual(self.scan(gate='exit').status_code, 422)
+
+    def test_keys_are_per_user(self):
+        self.scan()
+        bob = self.make_user('bob')
+        self.client.force_login(bob)
+        response = self.scan(ticket=self.make_ticket(bob))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Idempotent-Replay'))
+
+    def test_in_flight_key_and_long_keys(self):
+        data = {'ticket_id': str(self.ticket.ticket_id), 'gate_type': 'entry'}
+        cache.set(f'idem:scan:{self.alice.pk}:k1', (PENDING, _fingerprint(data)))
+        self.assertEqual(self.scan().status_code, 409)
+        self.assertEqual(self.scan(key='x' * 101).status_code, 400)
+
+    def test_server_errors_are_not_kept(self):
+        with mock.patch('core.api_views._scan', side_effect=DatabaseError('down')):
+            with self.assertRaises(DatabaseError):
+                self.scan()
+        self.assertEqual(self.scan().status_code, 200)
+
+
+class ThrottleTests(SmallNetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.make_user('alice')
+        self.client.force_login(self.alice)
+
+    def take(self, at, capacity=3, seconds_per_token=60):
+        with mock.patch.object(throttling.time, 'time', return_value=1_000_000 + at):
+            return throttling.take_token('test', 'alice', capacity, seconds_per_token)
+
+    def scan(self, **extra):
+        return self.client.post('/api/scan/', {'ticket_id': str(uuid.uuid4()), 'gate_type': 'entry'}, **extra)
+
+    def test_bucket_refills_at_its_rate(self):
+        self.assertEqual([self.take(0) for _ in range(3)], [None] * 3)
+        self.assertEqual(self.take(0), 60)
+        self.assertEqual(self.take(30), 30)
+        self.assertIsNone(self.take(60))
+        self.assertEqual(self.take(60), 60)
+
+    def test_idle_time_refills_one_burst_at_most(self):
+        self.take(0)
+        self.assertEqual([self.take(3600) for _ in range(4)], [None, None, None, 60])
+
+    def test_api_answers_429_with_retry_after(self):
+        with self.settings(THROTTLE_RATES={'scan:user': (2, 30)}):
+            self.assertEqual([self.scan().status_code for _ in range(2)], [404, 404])
+            response = self.scan()
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '30')
+            self.assertIn('try again in 30 s', response.json()['message'])
+
+            self.client.force_login(self.make_user('bob'))
+            self.assertEqual(self.scan().status_code, 404)
+
+    def test_gates_have_their_own_bucket(self):
+        with self.settings(THROTTLE_RATES={'scan:gate': (1, 30)}):
+            self.assertEqual(self.scan(HTTP_X_GATE_ID='g1').status_code, 404)
+            self.assertEqual(self.scan(HTTP_X_GATE_ID='g1').status_code, 429)
+            self.assertEqual(self.scan(HTTP_X_GATE_ID='g2').status_code, 404)
+            self.assertEqual(self.scan().status_code, 404)
+
+    def test_pages_get_a_plain_429(self):
+        with self.settings(THROTTLE_RATES={'buy:user': (1, 60)}):
+            self.client.post('/buy/')
+            response = self.client.post('/buy/')
+            self.assertEqual(self.client.get('/buy/').status_code, 200)
+
+        self.assertEqual((response.status_code, response['Content-Type']), (429, 'text/plain'))
+        self.assertEqual(response['Retry-After'], '60')
+
+    def test_client_ip_trusts_only_known_proxies(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='6.6.6.6, 1.2.3.4')
+
+        for proxies, expected in ((0, '10.0.0.1'), (1, '1.2.3.4'), (2, '6.6.6.6'), (5, '6.6.6.6')):
+            with self.settings(THROTTLE_PROXY_COUNT=proxies):
+                self.assertEqual(throttling.client_ip(request), expected)
+        with self.settings(THROTTLE_PROXY_COUNT=1):
+            self.assertEqual(throttling.client_ip(RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')), '10.0.0.1')
+
+
+class StructuredLogTests(TestCase):
+    def record(self, **extra):
+        record = logging.makeLogRecord({'name': 'metro.test', 'levelno': logging.INFO, 'levelname': 'INFO', 'msg': 'hello %s', 'args': ('world',)})
+        record.__dict__.update(extra)
+        return record
+
+    def test_formatter_writes_one_json_object_and_redacts(self):
+        line = JsonFormatter().format(self.record(otp='123456', password='pw', token='t', ticket_id='abc', _private=1))
+
+        self.assertNotIn('\n', line)
+        data = json.loads(line)
+        self.assertEqual((data['logger'], data['level'], data['message']), ('metro.test', 'INFO', 'hello world'))
+        self.assertEqual([data[key] for key in ('otp', 'password', 'token')], ['[redacted]'] * 3)
+        self.assertEqual(data['ticket_id'], 'abc')
+        self.assertNotIn('_private', data)
+
+    def test_handler_writes_from_a_background_thread_with_the_request_id(self):
+        stream = io.StringIO()
+        handler = QueueListenerHandler(stream)
+
+        def view(request):
+            try:
+                raise ValueError('boom')
+            except ValueError:
+                handler.handle(self.record(exc_info=sys.exc_info()))
+            return HttpResponse()
+
+        RequestLogMiddleware(view)(RequestFactory().get('/', HTTP_X_REQUEST_ID='req-1'))
+        handler.listener.stop()
+        atexit.unregister(handler.listener.stop)
+
+        data = json.loads(stream.getvalue())
+        self.assertEqual(data['request_id'], 'req-1')
+        self.assertIn('ValueError: boom', data['exc'])
+
+    def test_middleware_assigns_and_returns_request_ids(self):
+        seen = []
+
+        def view(request):
+            seen.append(current_request_id())
+            return HttpResponse(status=201)
+
+        middleware = RequestLogMiddleware(view)
+        with self.assertLogs('metro.request') as logs:
+            given = middleware(RequestFactory().get('/x', HTTP_X_REQUEST_ID='r' * 100))
+            generated = middleware(RequestFactory().post('/y'))
+
+        self.assertEqual(given['X-Request-ID'], 'r' * 64)
+        self.assertEqual(len(generated['X-Request-ID']), 32)
+        self.assertEqual(seen, [given['X-Request-ID'], generated['X-Request-ID']])
+        self.assertIsNone(current_request_id())
+        self.assertEqual([(r.method, r.path, r.status) for r in logs.records], [('GET', '/x', 201), ('POST', '/y', 201)])
+
+
+class LoadDataTests(SmallNetworkTestCase):
+    def generate(self, prefix, seed=1, **options):
+        call_command('generate_load_data', users=20, tickets=300, days=7, prefix=prefix, seed=seed, network='test', stdout=io.StringIO(), **options)
+        return Ticket.objects.filter(user__username__startswith=prefix).order_by('id')
+
+    def summary(self, tickets):
+        return [
+            (ticket.user.username[1:], ticket.source_id, ticket.destination_id, ticket.status, ticket.price)
+            for ticket in tickets.select_related('user')
+        ]
+
+    def test_generates_consistent_tickets(self):
+        tickets = self.generate('a')
+        now = timezone.now()
+
+        self.assertEqual(tickets.count(), 300)
+        self.assertEqual(get_user_model().objects.filter(username__startswith='a').count(), 20)
+        for ticket in tickets:
+            self.assertNotEqual(ticket.source_id, ticket.destination_id)
+            self.assertLess(now - ticket.created_at, timedelta(days=7))
+            if ticket.status == 'USED':
+                self.assertLess(ticket.entry_time, ticket.exit_time)
+                self.assertEqual(ticket.route['stations'][0], ticket.source_id)
+                self.assertEqual(ticket.route['stations'][-1], ticket.destination_id)
+            self.assertIn(ticket.status, {'USED', 'CANCELLED', 'EXPIRED', 'ACTIVE'})
+
+    def test_same_seed_same_data_without_id_collisions(self):
+        first = self.generate('a')
+        second = self.generate('b')
+
+        self.assertEqual(self.summary(first), self.summary(second))
+        self.assertFalse(set(first.values_list('ticket_id', flat=True)) & set(second.values_list('ticket_id', flat=True)))
+        self.assertNotEqual(self.summary(self.generate('c', seed=2)), self.summary(first))
+
+    def test_refuses_an_existing_prefix(self):
+        self.make_user('a-existing')
+        with self.assertRaisesMessage(CommandError, "prefix 'a' already exist"):
+            self.generate('a')
+
+
+class TravelStatsTests(SmallNetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.make_user('alice')
+        self.bob = self.make_user('bob')
+
+    def snapshot(self):
+        stats = list(TravelStats.objects.order_by('user_id').values_list('user_id', 'tickets', 'trips', 'cancelled', 'total_spent', 'last_trip_at'))
+        visits = set(StationVisits.objects.values_list('user_id', 'station_id', 'visits'))
+        return stats, visits
+
+    def travel(self):
+        rows = [
+            {'passenger': 'alice', 'source': 'A', 'destination': 'D'},
+            {'passenger': 'alice', 'source': 'B', 'destination': 'C'},
+            {'passenger': 'alice', 'source': 'A', 'destination': 'E'},
+            {'passenger': 'bob', 'source': 'F', 'destination': 'A'},
+        ]
+        tickets, errors = issue_bulk_tickets(rows, self.network)
+        self.assertEqual(errors, [])
+
+        self.client.force_login(self.alice)
+        self.client.post(f'/ticket/cancel/{tickets[1].ticket_id}/')
+        for ticket in (tickets[0], tickets[2]):
+            for gate in ('entry', 'exit'):
+                self.client.post('/api/scan/', {'ticket_id': str(ticket.ticket_id), 'gate_type': gate})
+
+    def test_incremental_totals_match_a_rebuild(self):
+        self.travel()
+        incremental = self.snapshot()
+
+        self.assertEqual(rebuild_travel_stats(), 2)
+        self.assertEqual(self.snapshot(), incremental)
+        with mock.patch.object(travel_stats, 'REBUILD_FLUSH_USERS', 1):
+            rebuild_travel_stats()
+        self.assertEqual(self.snapshot(), incremental)
+
+        stats = TravelStats.objects.get(user=self.alice)
+        self.assertEqual((stats.tickets, stats.trips, stats.cancelled), (3, 2, 1))
+        self.assertEqual(stats.last_trip_at, Ticket.objects.filter(user=self.alice).latest('exit_time').exit_time)
+
+    def test_top_stations(self):
+        self.travel()
+
+        top = stats_for(self.alice)['top_stations']
+        self.assertEqual(top[0], ('A', 2))
+        self.assertEqual(sorted(top[1:]), [('D', 1), ('E', 1)])
+        self.assertEqual(stats_for(self.make_user('carol'))['stats'].trips, 0)
+
+    def test_command(self):
+        self.make_ticket(self.alice, status='USED')
+        out = io.StringIO()
+        call_command('rebuild_travel_stats', stdout=out)
+        self.assertIn('Travel stats rebuilt for 1 user(s).', out.getvalue())
@@ -0,0 +1,100 @@
+import math
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+# Token buckets in the shared cache, one per (scope, identity). A bucket is
+# an epoch key plus a counter named after that epoch: tokens refill from the
+# epoch at a fixed rate, and taking one is a single atomic incr(). A bucket
+# found full is re-based to a fresh epoch, so idle time never adds up to more
+# than one burst. Rates come from settings.THROTTLE_RATES.
+
+GATE_HEADER = 'X-Gate-Id'
+
+
+def _cache():
+    return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+def _identity(request, kind):
+    if kind == 'user':
+        return request.user.pk if request.user.is_authenticated else None
+    if kind == 'gate':
+        gate = request.headers.get(GATE_HEADER)
+        if not gate and isinstance(request, Request):
+            gate = request.data.get('gate_id')
+        return str(gate)[:64] if gate else None
+    if kind == 'ip':
+        return client_ip(request)
+    return None
+
+def client_ip(request):
+    # Behind THROTTLE_PROXY_COUNT reverse proxies REMOTE_ADDR is the nearest
+    # proxy; each proxy appends the address it saw to X-Forwarded-For, so the
+    # client is that many entries from the end. Entries further left are
+    # whatever the client sent and are not trusted.
+    proxies = getattr(settings, 'THROTTLE_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        if forwarded:
+            return forwarded[-min(proxies, len(forwarded))]
+    return request.META.get('REMOTE_ADDR')
+
+def take_token(scope, identity, capacity, seconds_per_token):
+    # Returns None if a token was taken, else the seconds until one is free.
+    cache = _cache()
+    ttl = getattr(settings, 'THROTTLE_KEY_TTL', 3600)
+    key = f"throttle:{scope}:{identity}"
+    now = time.time()
+
+    epoch = cache.get(key)
+    if epoch is None:
+        cache.add(key, now, timeout=ttl)
+        epoch = cache.get(key, now)
+    counter = f"{key}:{epoch}"
+    try:
+        used = cache.incr(counter)
+    except ValueError:
+        cache.add(counter, 0, timeout=ttl)
+        used = cache.incr(counter)
+
+    # Tokens taken and not yet refilled, including this one.
+    level = used - (now - epoch) / seconds_per_token
+    if level > capacity:
+        cache.decr(counter)
+        return max(1, math.ceil((level - capacity) * seconds_per_token))
+    if level < 1 and used > 1:
+        # The bucket was full before this request.
+        cache.set_many({key: now, f"{key}:{now}": 1}, timeout=ttl)
+    return None
+
+def throttle(scope, methods=('POST',)):
+    # Checks every `<scope>:<identity kind>` bucket in THROTTLE_RATES,
+    # e.g. 'scan:user', 'scan:gate', 'scan:ip'.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return view(request, *args, **kwargs)
+
+            rates = getattr(settings, 'THROTTLE_RATES', {})
+            for kind in ('user', 'gate', 'ip'):
+                rate = rates.get(f"{scope}:{kind}")
+                identity = _identity(request, kind) if rate else None
+                if identity is None:
+                    continue
+                retry_after = take_token(f"{scope}:{kind}", identity, *rate)
+                if retry_after is not None:
+                    message = f"Too many requests, try again in {retry_after} s"
+                    if isinstance(request, Request):
+                        response = Response({"status": "error", "message": message}, status=429)
+                    else:
+                        response = HttpResponse(message, status=429, content_type='text/plain')
+                    response['Retry-After'] = str(retry_after)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,103 @@
+from collections import Counter, defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
+from .models import StationVisits, Ticket, TravelStats
+
+# Per-user travel totals, updated with one UPDATE per event so showing them
+# never touches the ticket history. `manage.py rebuild_travel_stats`
+# recomputes everything from Ticket rows with the same rules:
+# tickets = every ticket, trips = USED tickets, total_spent = prices of
+# tickets that were not cancelled.
+
+TOP_STATIONS = 3
+REBUILD_CHUNK_SIZE = 20_000
+REBUILD_FLUSH_USERS = 2_000
+
+
+def _add(user_id, assign=None, **deltas):
+    values = {field: F(field) + delta for field, delta in deltas.items()}
+    values.update(assign or {})
+    rows = TravelStats.objects.filter(user_id=user_id)
+    if not rows.update(**values):
+        TravelStats.objects.get_or_create(user_id=user_id)
+        rows.update(**values)
+
+def _visit(user_id, station_ids):
+    for station_id, count in Counter(station_ids).items():
+        rows = StationVisits.objects.filter(user_id=user_id, station_id=station_id)
+        if not rows.update(visits=F('visits') + count):
+            StationVisits.objects.get_or_create(user_id=user_id, station_id=station_id)
+            rows.update(visits=F('visits') + count)
+
+def record_purchase(ticket):
+    _add(ticket.user_id, tickets=1, total_spent=ticket.price)
+
+def record_purchases(tickets):
+    # Bulk-issued tickets: one update per passenger.
+    totals = defaultdict(lambda: [0, Decimal(0)])
+    for ticket in tickets:
+        totals[ticket.user_id][0] += 1
+        totals[ticket.user_id][1] += ticket.price
+    for user_id, (count, amount) in totals.items():
+        _add(user_id, tickets=count, total_spent=amount)
+
+def record_cancellation(ticket):
+    _add(ticket.user_id, cancelled=1, total_spent=-ticket.price)
+
+def record_trip(ticket):
+    _add(ticket.user_id, assign={'last_trip_at': ticket.exit_time}, trips=1)
+    _visit(ticket.user_id, [ticket.source_id, ticket.destination_id])
+
+def stats_for(user):
+    stats = TravelStats.objects.filter(user=user).first() or TravelStats(user=user)
+    top = (
+        StationVisits.objects.filter(user=user)
+        .select_related('station')
+        .order_by('-visits')[:TOP_STATIONS]
+    )
+    return {'stats': stats, 'top_stations': [(visit.station.name, visit.visits) for visit in top]}
+
+def _flush(stats, visits):
+    TravelStats.objects.bulk_create(stats.values(), batch_size=1000)
+    StationVisits.objects.bulk_create([
+        StationVisits(user_id=user_id, station_id=station_id, visits=count)
+        for user_id, counter in visits.items()
+        for station_id, count in counter.items()
+    ], batch_size=1000)
+
+@transaction.atomic
+def rebuild_travel_stats():
+    # Streams tickets ordered by user, so only REBUILD_FLUSH_USERS users'
+    # totals are held in memory at a time.
+    TravelStats.objects.all().delete()
+    StationVisits.objects.all().delete()
+
+    rows = (
+        Ticket.objects.order_by('user_id')
+        .values_list('user_id', 'status', 'price', 'source_id', 'destination_id', 'exit_time')
+        .iterator(chunk_size=REBUILD_CHUNK_SIZE)
+    )
+    stats, visits, users = {}, defaultdict(Counter), 0
+    for user_id, status, price, source_id, destination_id, exit_time in rows:
+        row = stats.get(user_id)
+        if row is None:
+            if len(stats) >= REBUILD_FLUSH_USERS:
+                _flush(stats, visits)
+                stats, visits = {}, defaultdict(Counter)
+            row = stats[user_id] = TravelStats(user_id=user_id)
+            users += 1
+        row.tickets += 1
+        if status == 'CANCELLED':
+            row.cancelled += 1
+        else:
+            row.total_spent += price
+        if status == 'USED':
+            row.trips += 1
+            visits[user_id][source_id] += 1
+            visits[user_id][destination_id] += 1
+            if exit_time and (row.last_trip_at is None or exit_time > row.last_trip_at):
+                row.last_trip_at = exit_time
+    if stats:
+        _flush(stats, visits)
+    return users
@@ -4,6 +4,7 @@ from . import views, api_views
 
 urlpatterns = [
     path('', views.home, name='home'), 
+    path('network/<slug:slug>/', views.switch_network, name='switch_network'),
     path('register/', views.register_view, name='register'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
@@ -11,10 +12,16 @@ urlpatterns = [
     path('wallet/', views.add_funds, name='add_funds'),
     path('my-tickets/', views.my_tickets, name='my_tickets'),
     path('ticket/<uuid:ticket_id>/', views.ticket_confirmation, name='ticket_confirmation'),
+    path('ticket/<uuid:ticket_id>/qr.svg', views.ticket_qr, name='ticket_qr'),
     path('ticket/cancel/<uuid:ticket_id>/', views.cancel_ticket, name='cancel_ticket'),
     path('scanner/', views.scanner_view, name='scanner'),
     path('api/scan/', api_views.scan_ticket, name='api_scan'),
+    path('api/tickets/', api_views.tickets, name='api_tickets'),
+    path('api/routes/', api_views.routes, name='api_routes'),
+    path('api/journeys/', api_views.journeys, name='api_journeys'),
+    path('api/occupancy/', api_views.occupancy, name='api_occupancy'),
     path('admin-create-ticket/', views.admin_create_ticket, name='admin_create_ticket'),
+    path('admin-bulk-tickets/', views.admin_bulk_tickets, name='admin_bulk_tickets'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
     path('profile/password/', 
          auth_views.PasswordChangeView.as_view(template_name='core/change_password.html', success_url='/profile/password/done/'), 
@@ -1,33 +1,28 @@
+import logging
+import time
 from collections import deque
-from .models import Station, StationOnLine, Ticket
+from .models import Station, StationOnLine, Ticket, MetroLine
 import random
-from django.core.mail import send_mail
+from django.core.mail import send_mail, EmailMessage, get_connection
+from django.contrib.auth import get_user_model
+from django.db.models import Q
 from django.conf import settings
 from decimal import Decimal
+from django.db import transaction
+from .qr import ticket_qr_svg
+from .travel_stats import record_purchase, record_purchases
+from .layout import schedule_layout
+from .network import get_route_graph, invalidate_network
 
-def find_shortest_path(start_station_name, end_station_name):
+logger = logging.getLogger('metro.tickets')
+email_logger = logging.getLogger('metro.email')
+
+def find_shortest_path(start_station_name, end_station_name, graph=None, network_id=None):
     if start_station_name == end_station_name:
         return None, None, 0
 
-    graph = {}
-    all_connections = StationOnLine.objects.select_related('station', 'line').all()
-    
-    lines_map = {} 
-    for conn in all_connections:
-        lines_map.setdefault(conn.line.name, []).append(conn)
-
-    for line_name, connections in lines_map.items():
-        connections.sort(key=lambda x: x.order)
-        for i in range(len(connections)):
-            curr_st = connections[i].station.name
-            if curr_st not in graph: graph[curr_st] = []
-
-            if i > 0:
-                prev_st = connections[i-1].station.name
-                graph[curr_st].append((prev_st, line_name))
-            if i < len(connections) - 1:
-                next_st = connections[i+1].station.name
-                graph[curr_st].append((next_st, line_name))
+    if graph is None:
+        graph = get_route_graph(network_id)
 
     queue = deque([(start_station_name, [start_station_name], [])]) 
     visited = {start_station_name}
@@ -61,12 +56,27 @@ def get_navigation_instructions(path, lines):
     instructions.append(f"🏁 Arrive at {path[-1]}")
     return "\n".join(instructions)
 
+def encode_route(path, lines, network_id, station_ids=None, line_ids=None):
+    # Compact, id-based form of a find_shortest_path() result for Ticket.route.
+    # Callers encoding many routes can pass name -> id maps to skip the lookups.
+    if not path:
+        return None
+    if station_ids is None:
+        station_ids = dict(Station.objects.filter(network_id=network_id, name__in=path).values_list('name', 'id'))
+    if line_ids is None:
+        line_ids = dict(MetroLine.objects.filter(network_id=network_id, name__in=set(lines)).values_list('name', 'id'))
+    return {
+        'stations': [station_ids[name] for name in path],
+        'lines': [line_ids[name] for name in lines],
+    }
+
 def generate_otp():
     return str(random.randint(100000, 999999))
 
 def send_otp_email(user_email, otp):
     subject = 'Verify your Metro Ticket Purchase'
     message = f'Your OTP for ticket verification is: {otp}. It expires in 5 minutes.'
+    started = time.perf_counter()
     send_mail(
         subject, 
         message, 
@@ -74,6 +84,7 @@ def send_otp_email(user_email, otp):
         [user_email], 
         fail_silently=False
     )
+    email_logger.info('email sent', extra={'kind': 'otp', 'duration_ms': round((time.perf_counter() - started) * 1000, 2)})
 
 def finalize_ticket_booking(request, data):
     user = request.user
@@ -87,19 +98,30 @@ def finalize_ticket_booking(request, data):
     
     ticket = Ticket.objects.create(
         user=user,
+        network_id=source.network_id,
         source=source,
         destination=dest,
         price=price,
         route_info=data.get('route_desc', 'Direct Trip'),
+        route=data.get('route'),
         status='ACTIVE'
     )
 
-    send_ticket_confirmation(user.email, ticket)
+    record_purchase(ticket)
 
+    # Render the QR code now so the confirmation page is served from cache.
+    ticket_qr_svg(ticket.ticket_id)
 
-    request.session.pop('ticket_data', None)
-    request.session.pop('purchase_otp', None)
-    request.session.pop('otp_created_at', None)
+    logger.info('ticket purchased', extra={
+        'user_id': user.id,
+        'ticket_id': str(ticket.ticket_id),
+        'network_id': ticket.network_id,
+        'source_id': source.id,
+        'destination_id': dest.id,
+        'price': str(price),
+    })
+
+    send_ticket_confirmation(user.email, ticket)
 
     return ticket
 
@@ -114,6 +136,7 @@ def send_ticket_confirmation(user_email, ticket):
         f"Route Info: {ticket.route_info}\n\n"
         f"Thank you for using our Metro service!"
     )
+    started = time.perf_counter()
     send_mail(
         subject, 
         message, 
@@ -121,4 +144,117 @@ def send_ticket_confirmation(user_email, ticket):
         [user_email], 
         fail_silently=False
     )
+    email_logger.info('email sent', extra={'kind': 'ticket_confirmation', 'ticket_id': str(ticket.ticket_id), 'duration_ms': round((time.perf_counter() - started) * 1000, 2)})
+
+
+@transaction.atomic
+def set_line_stops(line, stations):
+    existing = {sol.station_id: sol for sol in StationOnLine.objects.select_for_update().filter(line=line)}
+    wanted_ids = [station.id for station in stations]
+
+    removed = [sol.id for station_id, sol in existing.items() if station_id not in wanted_ids]
+    StationOnLine.objects.filter(id__in=removed).delete()
+
+    to_update, to_create = [], []
+    for index, station_id in enumerate(wanted_ids):
+        sol = existing.get(station_id)
+        if sol is None:
+            to_create.append(StationOnLine(line=line, station_id=station_id, order=index + 1))
+        elif sol.order != index + 1:
+            sol.order = index + 1
+            to_update.append(sol)
+
+    StationOnLine.objects.bulk_update(to_update, ['order'])
+    StationOnLine.objects.bulk_create(to_create)
+    # Bulk operations send no signals.
+    transaction.on_commit(lambda: invalidate_network(line.network_id))
+    schedule_layout(line.network_id)
+
+    return len(to_create), len(removed), len(to_update)
+
+def send_bulk_ticket_confirmations(tickets):
+    # One SMTP connection for the whole batch instead of one per ticket.
+    messages = []
+    for ticket in tickets:
+        if not ticket.user.email:
+            continue
+        messages.append(EmailMessage(
+            f'Ticket Issued - {ticket.ticket_id}',
+            (
+                f"A ticket has been issued for you.\n\n"
+                f"Ticket ID: {ticket.ticket_id}\n"
+                f"From: {ticket.source.name}\n"
+                f"To: {ticket.destination.name}\n\n"
+                f"Route Info: {ticket.route_info}\n\n"
+                f"Thank you for using our Metro service!"
+            ),
+            settings.EMAIL_HOST_USER,
+            [ticket.user.email],
+        ))
+    if messages:
+        started = time.perf_counter()
+        get_connection(fail_silently=False).send_messages(messages)
+        email_logger.info('email sent', extra={'kind': 'bulk_confirmation', 'count': len(messages), 'duration_ms': round((time.perf_counter() - started) * 1000, 2)})
+    return len(messages)
+
+def issue_bulk_tickets(rows, network):
+    # rows: [{'passenger': username or email, 'source': name, 'destination': name}]
+    # Station names are looked up within `network`.
+    # Either every row is valid and all tickets are created, or nothing is.
+    User = get_user_model()
+    passengers = {row['passenger'] for row in rows}
+    users = {}
+    for user in User.objects.filter(Q(username__in=passengers) | Q(email__in=passengers)):
+        users[user.username] = user
+        users.setdefault(user.email, user)
+
+    station_names = {row['source'] for row in rows} | {row['destination'] for row in rows}
+    stations = {station.name: station for station in Station.objects.filter(network=network, name__in=station_names)}
+
+    errors = []
+    for number, row in enumerate(rows, start=1):
+        if row['passenger'] not in users:
+            errors.append(f"Row {number}: unknown passenger '{row['passenger']}'.")
+        for field in ('source', 'destination'):
+            if row[field] not in stations:
+                errors.append(f"Row {number}: unknown station '{row[field]}'.")
+        if row['source'] == row['destination']:
+            errors.append(f"Row {number}: source and destination are the same.")
+    if errors:
+        return [], errors
+
+    graph = get_route_graph(network.id)
+    station_ids = dict(Station.objects.filter(network=network).values_list('name', 'id'))
+    line_ids = dict(MetroLine.objects.filter(network=network).values_list('name', 'id'))
+    routes = {}
+    for pair in {(row['source'], row['destination']) for row in rows}:
+        path, lines, stops = find_shortest_path(*pair, graph=graph)
+        if not path:
+            errors.append(f"No route found from {pair[0]} to {pair[1]}.")
+            continue
+        routes[pair] = (
+            Decimal(2.0 + (stops * 2.0)),
+            get_navigation_instructions(path, lines),
+            encode_route(path, lines, network.id, station_ids, line_ids),
+        )
+    if errors:
+        return [], errors
+
+    tickets = []
+    for row in rows:
+        price, route_desc, route = routes[(row['source'], row['destination'])]
+        tickets.append(Ticket(
+            user=users[row['passenger']],
+            network=network,
+            source=stations[row['source']],
+            destination=stations[row['destination']],
+            price=price,
+            route_info=route_desc,
+            route=route,
+            status='ACTIVE',
+        ))
 
+    with transaction.atomic():
+        Ticket.objects.bulk_create(tickets, batch_size=1000)
+        record_purchases(tickets)
+    return tickets, []
@@ -1,73 +1,59 @@
+import logging
 from decimal import Decimal
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .forms import TicketPurchaseForm, SignUpForm, AddFundsForm, EditProfileForm
-from .models import Ticket, Station, SystemSettings, StationOnLine, MetroLine
-from .utils import find_shortest_path, generate_otp, send_otp_email, send_ticket_confirmation, finalize_ticket_booking
+from .forms import TicketPurchaseForm, SignUpForm, AddFundsForm, EditProfileForm, BulkTicketForm
+from .models import Ticket, Station
+from .utils import find_shortest_path, get_navigation_instructions, encode_route, send_otp_email, finalize_ticket_booking, issue_bulk_tickets, send_bulk_ticket_confirmations
+from .otp import issue_otp, check_otp, OTP_OK, OTP_EXPIRED, OTP_LOCKED
+from .live import current_seq, events_since, station_counters
+from .od_matrix import od_matrix, DAY_TYPES
+from .qr import ticket_qr_svg
+from .db_router import use_replica
+from .network import NETWORK_SESSION_KEY, get_networks, get_stations, get_system_settings
+from .routing import alternative_routes
+from .layout import get_map_data
+from .profiling import list_reports, load_report, report_path
+from .throttling import throttle
+from .travel_stats import record_cancellation, record_purchase, record_trip, stats_for
 from django.contrib.auth.forms import AuthenticationForm
 from django.utils import timezone
-from django.db.models import Count
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import get_user_model
 from allauth.account.models import EmailAddress
-from datetime import timedelta
 from django.core.mail import send_mail
 from django.conf import settings
 import random, json
-from dateutil.parser import parse
 from django.contrib.auth import login, logout, authenticate
+from django.http import StreamingHttpResponse, HttpResponse, FileResponse, Http404
+from datetime import date, timedelta
+import csv, time
 
 User = get_user_model()
+logger = logging.getLogger('metro.tickets')
 
+@use_replica
 def home(request):
-    settings, _ = SystemSettings.objects.get_or_create(id=1)
+    settings = get_system_settings(request.network.id)
     
-    lines = MetroLine.objects.filter(is_active=True).prefetch_related('stationonline_set__station')
-
-    nodes = []
-    edges = []
-    added_station_ids = set()
-
-    for line in lines:
-
-        stops = list(line.stationonline_set.all().order_by('id'))
-        
-        for i in range(len(stops)):
-            current_stop = stops[i]
-            station = current_stop.station
-            
-            if station.id not in added_station_ids:
-                nodes.append({
-                    'id': station.id,
-                    'label': station.name,
-                    'shape': 'dot',
-                    'size': 20 if current_stop.is_interchange else 10,
-                    'color': '#000000' if current_stop.is_interchange else '#666666',
-                    'font': {'size': 14, 'color': '#000000', 'face': 'arial'}
-                })
-                added_station_ids.add(station.id)
-
-            if i < len(stops) - 1:
-                next_stop = stops[i + 1]
-                edges.append({
-                    'from': station.id,
-                    'to': next_stop.station.id,
-                    'color': {'color': line.color, 'highlight': line.color},
-                    'width': 5, 
-                    'title': line.name
-                })
-
-    graph_data = json.dumps({'nodes': nodes, 'edges': edges})
+    graph_data = get_map_data(request.network.id)
 
     return render(request, 'core/home.html', {
         'is_open': settings.is_metro_open,
         'graph_data': graph_data,
     })
 
+def switch_network(request, slug):
+    if not any(network.slug == slug for network in get_networks()):
+        raise Http404("Unknown network")
+    request.session[NETWORK_SESSION_KEY] = slug
+    return redirect('home')
+
 @login_required
+@throttle('buy')
 def buy_ticket(request):
-    sys_settings, _ = SystemSettings.objects.get_or_create(id=1)
+    sys_settings = get_system_settings(request.network.id)
     if not sys_settings.is_metro_open:
         messages.error(request, "⛔ Metro services are currently CLOSED.")
         return redirect('home')
@@ -81,9 +67,9 @@ def buy_ticket(request):
             return redirect('buy_ticket')
         
         try:
-            source = Station.objects.get(id=source_id)
-            destination = Station.objects.get(id=dest_id)
-        except Station.DoesNotExist:
+            source = Station.objects.get(id=source_id, network=request.network)
+            destination = Station.objects.get(id=dest_id, network=request.network)
+        except (ValueError, Station.DoesNotExist):
             messages.error(request, "Invalid station selection.")
             return redirect('buy_ticket')
         
@@ -91,12 +77,17 @@ def buy_ticket(request):
             messages.error(request, "Source and Destination cannot be the same.")
             return redirect('buy_ticket')
 
-        path, lines, stops = find_shortest_path(source.name, destination.name)
-        if not path:
+        routes = alternative_routes(request.network.id, source.name, destination.name)
+        if not routes:
              messages.error(request, "No route found between these stations.")
              return redirect('buy_ticket')
 
-        from .utils import get_navigation_instructions
+        try:
+            chosen = routes[int(request.POST.get('route') or 0)]
+        except (ValueError, IndexError):
+            chosen = routes[0]
+        path, lines, stops = chosen['path'], chosen['lines'], chosen['stops']
+
         route_desc = get_navigation_instructions(path, lines)
 
         raw_price = 2.0 + (stops * 2.0)
@@ -111,37 +102,44 @@ def buy_ticket(request):
             'source_id': source.id,
             'destination_id': destination.id,
             'price': float(price), 
-            'route_desc': route_desc  
+            'route_desc': route_desc,
+            'route': encode_route(path, lines, request.network.id),
         }
-        request.session['ticket_data'] = ticket_data
 
         if request.user.is_staff:
             ticket = finalize_ticket_booking(request, ticket_data)
             messages.success(request, "Ticket Purchased (Offline Mode).")
             return redirect('ticket_confirmation', ticket_id=ticket.ticket_id)
         else:
-            otp = generate_otp()
-            request.session['purchase_otp'] = otp
-            request.session['otp_created_at'] = str(timezone.now())
+            otp = issue_otp(request.user.id, ticket_data)
 
             try:
                 send_otp_email(request.user.email, otp)
-                print(f"DEBUG: OTP sent to {request.user.email} is: {otp}") 
+                logger.info('otp issued', extra={'user_id': request.user.id, 'source_id': source.id, 'destination_id': destination.id})
                 messages.info(request, "An OTP has been sent to your email.")
-            except Exception as e:
-                print(f"EMAIL ERROR: {e}")
-                messages.warning(request, "Email service is slow, but you can still use the OTP sent (check logs if debugging).")
+            except Exception:
+                logger.exception('otp email failed', extra={'user_id': request.user.id})
+                messages.warning(request, "Email service is slow, but you can still use the OTP sent.")
             
             return redirect('verify_otp_page')
 
-    stations = Station.objects.all().order_by('name')
-    return render(request, 'core/buy_ticket.html', {'stations': stations})
+    return render(request, 'core/buy_ticket.html', {'stations': get_stations(request.network.id)})
 
 @login_required
 def ticket_confirmation(request, ticket_id):
     ticket = get_object_or_404(Ticket, ticket_id=ticket_id)
     return render(request, 'core/ticket_confirmation.html', {'ticket': ticket})
 
+@login_required
+def ticket_qr(request, ticket_id):
+    # Only for an existing ticket of the user (or staff), so arbitrary ids
+    # cannot fill the cache with images.
+    tickets = Ticket.objects.all() if request.user.is_staff else Ticket.objects.filter(user=request.user)
+    get_object_or_404(tickets.only('id'), ticket_id=ticket_id)
+    response = HttpResponse(ticket_qr_svg(ticket_id), content_type='image/svg+xml')
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
 def register_view(request):
     if request.method == 'POST':
         form = SignUpForm(request.POST)
@@ -197,10 +195,11 @@ def add_funds(request):
     
     return render(request, 'core/add_funds.html', {'form': form})
 
+@use_replica
 @login_required
 def my_tickets(request):
     tickets = Ticket.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'core/my_tickets.html', {'tickets': tickets})
+    return render(request, 'core/my_tickets.html', {'tickets': tickets, **stats_for(request.user)})
 
 @login_required
 def cancel_ticket(request, ticket_id):
@@ -213,6 +212,7 @@ def cancel_ticket(request, ticket_id):
             
             ticket.status = 'CANCELLED'
             ticket.save()
+            record_cancellation(ticket)
             
             messages.success(request, f"Ticket cancelled. ${ticket.price} refunded to your wallet.")
         else:
@@ -225,7 +225,7 @@ def scanner_view(request):
     user_tickets = Ticket.objects.filter(user=request.user).order_by('-created_at')
     
     all_users = User.objects.all() if request.user.is_superuser else None
-    stations = Station.objects.all() if request.user.is_superuser else None
+    stations = Station.objects.filter(network=request.network) if request.user.is_superuser else None
 
     context = {
         'user_tickets': user_tickets,
@@ -251,44 +251,66 @@ def admin_create_ticket(request):
         messages.error(request, "Invalid data selected.")
         return redirect('scanner')
     
-    path, lines, stops = find_shortest_path(source.name, destination.name)
-    
-    instructions = []
-    route_desc = "Direct Trip"
-
-    if lines and len(lines) > 0:
-        current_line = lines[0]
-        instructions.append(f"Start on {current_line}")
-        
-        for i in range(len(lines) - 1):
-            if lines[i] != lines[i+1]:
-                transfer_station = path[i+1]
-                next_line = lines[i+1]
-                instructions.append(f"Switch to {next_line} at {transfer_station}")
+    if source.network_id != destination.network_id:
+        messages.error(request, "Source and destination belong to different networks.")
+        return redirect('scanner')
 
-        route_desc = ". ".join(instructions) + "."
+    path, lines, stops = find_shortest_path(source.name, destination.name, network_id=source.network_id)
+    route_desc = get_navigation_instructions(path, lines)
     
     raw_price = 2.0 + (stops * 2.0)
     price = Decimal(raw_price)
 
-    Ticket.objects.create(
+    ticket = Ticket.objects.create(
         user=passenger,
+        network_id=source.network_id,
         source=source,
         destination=destination,
         price=price,
         status='USED', 
         route_info=route_desc,
+        route=encode_route(path, lines, source.network_id),
         entry_time=timezone.now(),
         exit_time=timezone.now()
     )
+    record_purchase(ticket)
+    record_trip(ticket)
         
     messages.success(request, "Ticket created manually.")
     return redirect('scanner')
 
+@staff_member_required
+def admin_bulk_tickets(request):
+    if request.method == 'POST':
+        form = BulkTicketForm(request.POST, request.FILES)
+        if form.is_valid():
+            tickets, errors = issue_bulk_tickets(form.cleaned_data['rows'], request.network)
+            if errors:
+                for error in errors[:20]:
+                    messages.error(request, error)
+                if len(errors) > 20:
+                    messages.error(request, f"...and {len(errors) - 20} more problems. No tickets were issued.")
+            else:
+                logger.info('bulk tickets issued', extra={'tickets': len(tickets), 'network_id': request.network.id, 'user_id': request.user.id})
+                messages.success(request, f"Issued {len(tickets)} tickets.")
+                if form.cleaned_data['send_emails']:
+                    try:
+                        sent = send_bulk_ticket_confirmations(tickets)
+                        messages.info(request, f"Sent {sent} confirmation emails.")
+                    except Exception:
+                        logger.exception('bulk confirmation emails failed', extra={'tickets': len(tickets)})
+                        messages.warning(request, "Tickets were issued, but the confirmation emails could not be sent.")
+                return redirect('admin_bulk_tickets')
+    else:
+        form = BulkTicketForm()
+
+    return render(request, 'core/bulk_tickets.html', {'form': form})
+
+@use_replica
 @staff_member_required
 def admin_analytics(request):
     today = timezone.now().date()
-    stations = Station.objects.all()
+    stations = Station.objects.filter(network=request.network)
     stats = []
 
     for station in stations:
@@ -305,10 +327,125 @@ def admin_analytics(request):
     context = {
         'stats': stats,
         'today': today,
-        'title': 'Daily Footfall Analytics'
+        'title': f'Daily Footfall Analytics — {request.network}'
     }
     return render(request, 'admin/admin_analytics.html', context)
 
+@use_replica
+@staff_member_required
+def admin_od_matrix(request):
+    today = timezone.localdate()
+    try:
+        end_day = date.fromisoformat(request.GET.get('end', ''))
+    except ValueError:
+        end_day = today
+    try:
+        start_day = date.fromisoformat(request.GET.get('start', ''))
+    except ValueError:
+        start_day = end_day - timedelta(days=6)
+    start_day = max(start_day, end_day - timedelta(days=92))
+
+    day_type = request.GET.get('day_type', 'all')
+    if day_type not in DAY_TYPES:
+        day_type = 'all'
+    try:
+        hour_from = min(max(int(request.GET.get('hour_from', 0)), 0), 23)
+        hour_to = min(max(int(request.GET.get('hour_to', 23)), hour_from), 23)
+    except ValueError:
+        hour_from, hour_to = 0, 23
+
+    station_ids, matrix = od_matrix(request.network.id, start_day, end_day, day_type, range(hour_from, hour_to + 1))
+    names = dict(Station.objects.filter(network=request.network).values_list('id', 'name'))
+    labels = [names.get(int(station_id), '?') for station_id in station_ids]
+
+    if request.GET.get('download') == 'csv':
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="od-{start_day}-{end_day}-{day_type}.csv"'
+        writer = csv.writer(response)
+        writer.writerow(['origin \\ destination'] + labels)
+        for label, row in zip(labels, matrix.tolist()):
+            writer.writerow([label] + row)
+        return response
+
+    # Only stations with any traffic are drawn, to keep the heatmap readable.
+    active = [i for i in range(len(labels)) if matrix[i].any() or matrix[:, i].any()]
+    peak = int(matrix.max()) if matrix.size else 0
+    rows = [
+        {
+            'name': labels[i],
+            'cells': [(labels[j], int(matrix[i, j]), round(matrix[i, j] / peak, 2) if peak else 0) for j in active],
+        }
+        for i in active
+    ]
+
+    context = {
+        'title': f'Origin–Destination Matrix — {request.network}',
+        'rows': rows,
+        'columns': [labels[j] for j in active],
+        'total_trips': int(matrix.sum()),
+        'start': start_day,
+        'end': end_day,
+        'day_type': day_type,
+        'day_types': list(DAY_TYPES),
+        'hour_from': hour_from,
+        'hour_to': hour_to,
+        'query': request.GET.urlencode(),
+    }
+    return render(request, 'admin/od_matrix.html', context)
+
+@staff_member_required
+def admin_live_gates(request):
+    return render(request, 'admin/live_gates.html', {'title': 'Live Gate Activity'})
+
+LIVE_POLL_SECONDS = 1
+LIVE_COUNTER_SECONDS = 10
+# Kept well below gunicorn's worker timeout (gunicorn.conf.py); each open
+# stream holds one gthread thread.
+LIVE_STREAM_SECONDS = 20
+
+@staff_member_required
+def admin_live_gates_stream(request):
+    # Streams are short; EventSource reconnects by itself and resumes from
+    # Last-Event-ID, so no scans are lost between them.
+    stations = dict(Station.objects.filter(network=request.network).values_list('id', 'name'))
+    last_id = request.headers.get('Last-Event-ID')
+    last_seq = int(last_id) if last_id and last_id.isdigit() else current_seq()
+
+    def sse(event, data, event_id=None):
+        head = f"id: {event_id}\n" if event_id is not None else ""
+        return f"{head}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def stream():
+        nonlocal last_seq
+        started = time.monotonic()
+        next_counters = started
+        yield "retry: 1000\n\n"
+
+        while time.monotonic() - started < LIVE_STREAM_SECONDS:
+            for event in events_since(last_seq):
+                last_seq = event['seq']
+                if event.get('result', 'ok') != 'ok' or event['station_id'] not in stations:
+                    continue
+                event['station'] = stations.get(event['station_id'], '?')
+                yield sse('scan', event, event_id=last_seq)
+
+            if time.monotonic() >= next_counters:
+                counters = station_counters(stations.keys())
+                yield sse('counters', [
+                    {'name': stations[station_id], **counts}
+                    for station_id, counts in counters.items()
+                ], event_id=last_seq)
+                next_counters = time.monotonic() + LIVE_COUNTER_SECONDS
+            else:
+                yield ": keep-alive\n\n"
+
+            time.sleep(LIVE_POLL_SECONDS)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def edit_profile(request):
     if request.method == 'POST':
@@ -320,38 +457,46 @@ def edit_profile(request):
     else:
         form = EditProfileForm(instance=request.user)
 
-    return render(request, 'core/edit_profile.html', {'form': form})
+    return render(request, 'core/edit_profile.html', {'form': form, **stats_for(request.user)})
 
 @login_required
 def verify_otp_page(request):
 
     if request.method == 'POST':
         entered_otp = request.POST.get('otp')
-        session_otp = request.session.get('purchase_otp')
-        otp_time_str = request.session.get('otp_created_at')
-        ticket_data = request.session.get('ticket_data')
+        result, ticket_data = check_otp(request.user.id, entered_otp)
 
-        if not ticket_data or not session_otp or not otp_time_str:
-            messages.error(request, "Session expired or invalid request. Please start your purchase again.")
+        if result == OTP_EXPIRED:
+            messages.error(request, "The OTP has expired or no purchase is pending. Please start your purchase again.")
             return redirect('buy_ticket')
 
-        try:
-            otp_time = parse(otp_time_str)
-            if timezone.now() > otp_time + timedelta(minutes=5):
-                request.session.pop('purchase_otp', None)
-                request.session.pop('otp_created_at', None)
-                messages.error(request, "The OTP has expired. Please try again.")
-                return redirect('buy_ticket')
-        except Exception as e:
-            messages.error(request, "An error occurred during verification.")
+        if result == OTP_LOCKED:
+            messages.error(request, "Too many incorrect attempts. Please start your purchase again.")
             return redirect('buy_ticket')
 
-        if entered_otp == session_otp:
+        if result == OTP_OK:
             ticket = finalize_ticket_booking(request, ticket_data)
-            
+
             messages.success(request, "OTP Verified! Your ticket has been booked successfully.")
             return redirect('ticket_confirmation', ticket_id=ticket.ticket_id)
         else:
             messages.error(request, "Invalid OTP code. Please check your email and try again.")
     
-    return render(request, 'core/verify_otp.html')
\ No newline at end of file
+    return render(request, 'core/verify_otp.html')
+
+@staff_member_required
+def admin_profiles(request):
+    return render(request, 'admin/profiles.html', {'reports': list_reports()})
+
+@staff_member_required
+def admin_profile_report(request, name):
+    if request.GET.get('download'):
+        path = report_path(name, '.prof')
+        if path is None:
+            raise Http404("Profile not found")
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{name}.prof')
+
+    report = load_report(name)
+    if report is None:
+        raise Http404("Profile not found")
+    return render(request, 'admin/profile_report.html', {'report': report})
@@ -0,0 +1,62 @@
+import logging
+import time
+from django.db import DatabaseError
+from django.template.loader import get_template
+from django.urls import get_resolver
+from .network import get_networks, get_route_graph, get_stations, get_system_settings
+from .layout import get_map_data
+
+logger = logging.getLogger('metro.warmup')
+
+# Called once per worker (see gunicorn.conf.py) so the first real requests
+# do not pay for imports, template compilation or building the route graph.
+
+WARM_TEMPLATES = ('core/home.html', 'core/buy_ticket.html', 'core/my_tickets.html', 'core/ticket_confirmation.html')
+
+
+def _load_urls():
+    # Resolving the URLconf imports every view module.
+    get_resolver().url_patterns
+
+def _load_templates():
+    for name in WARM_TEMPLATES:
+        get_template(name)
+
+STEPS = (
+    ('url conf', _load_urls),
+    ('templates', _load_templates),
+)
+
+# Run once for every transit network.
+NETWORK_STEPS = (
+    ('route graph', get_route_graph),
+    ('stations', get_stations),
+    ('system settings', get_system_settings),
+    ('network map', get_map_data),
+)
+
+def _steps():
+    yield from STEPS
+    try:
+        networks = get_networks()
+    except DatabaseError as e:
+        logger.warning('warmup step skipped', extra={'step': 'networks', 'error': str(e)})
+        return
+    for network in networks:
+        for name, step in NETWORK_STEPS:
+            yield f"{network.slug} {name}", lambda step=step, network_id=network.id: step(network_id)
+
+def warm_up():
+    timings = {}
+    total = time.perf_counter()
+    for name, step in _steps():
+        started = time.perf_counter()
+        try:
+            step()
+        except DatabaseError as e:
+            logger.warning('warmup step skipped', extra={'step': name, 'error': str(e)})
+            continue
+        timings[name] = (time.perf_counter() - started) * 1000
+        logger.info('warmup step ready', extra={'step': name, 'duration_ms': round(timings[name], 1)})
+    logger.info('warmup done', extra={'duration_ms': round((time.perf_counter() - total) * 1000, 1)})
+    return timings
@@ -0,0 +1,30 @@
+# Picked up automatically by gunicorn when started from the project root.
+import os
+
+# Kept in step with core/live.py.
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+shared_cache = os.environ.get('CACHE_BACKEND', PER_PROCESS_CACHES[0]) not in PER_PROCESS_CACHES
+
+# Threaded workers: a request held open (e.g. the live gate stream in the
+# admin) occupies one thread rather than a whole worker, and the worker keeps
+# reporting to the arbiter while it streams. OTPs, idempotency keys, throttle
+# buckets and the gate scan buffer live in the default cache, so more than one
+# worker needs a cache they share (CACHE_BACKEND); with LocMem there is one.
+workers = int(os.environ.get('WEB_CONCURRENCY', 2 if shared_cache else 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = 30
+
+def on_starting(server):
+    if server.cfg.workers > 1 and not shared_cache:
+        raise RuntimeError(
+            f"{server.cfg.workers} workers need a shared cache; set CACHE_BACKEND (e.g. Redis) or WEB_CONCURRENCY=1."
+        )
+
+def post_worker_init(worker):
+    # post_fork runs before the worker has loaded Django, so warm up here.
+    from core.warmup import warm_up
+    warm_up()